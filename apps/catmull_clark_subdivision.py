@@ -19,13 +19,38 @@ Mesh Subdivision Plugin.
 
 **Coding Standards:**  See http://sites.google.com/site/makehumandocs/developers-guide
 
+Abstract
+--------
+
+The faces, uv values and index buffer of a subdivided mesh, and the vertices each
+new vertex is computed from, the stencils, only depend on the faces of the original
+mesh. They are built once per mesh file, kept as indices with a module3d.Topology for
+the last few mesh files subdivided, and shared by all objects subdivided from the file.
+
+A subdivided object is created from the kept topology, so it only holds its own
+coordinates and normals. The coordinates are computed from the stencils and the
+coordinates of the original object, when the object is created and whenever the
+original object changed.
+
+The garbage collector is paused while a subdivided object is created. Creating its
+vertices and faces would otherwise start many collections, each of them going through
+all objects of the application, while none of the new objects is garbage.
+
 """
 
 __docformat__ = 'restructuredtext'
 
+import os
+import gc
+from collections import OrderedDict
+
 from aljabr import centroid
 from fastmath import vmul3d, vadd3d, vavg2d, vavg2d4, vavg3d, vavg3d4
 from module3d import Object3D
+import profiler
+
+maxSubdivisionTopologies = 8
+subdivisionTopologies = OrderedDict()  # path -> (mtime, verts, faces, module3d.Topology, stencils), oldest first
 
 def createOriginalVert(object, v):
     
@@ -34,23 +59,6 @@ def createOriginalVert(object, v):
     
     return o
     
-def initOriginalVert(v):
-    
-    v.co = v.data[0].co[:]
-    
-def updateOriginalVert(v):
-    
-    if not v.data[1] or not v.data[2]: # Joint vertex
-        return
-      
-    n = len(v.data[1])
-    if n == len(v.data[2]): # Inner vertex
-        faceVertAvg = centroid([fv.co for fv in v.data[1]])
-        edgeVertAvg = centroid([ev.co for ev in v.data[2]])
-        v.co = vmul3d(vadd3d(vadd3d(faceVertAvg, vmul3d(edgeVertAvg, 2.0)), vmul3d(v.data[0].co, n - 3.0)), 1.0/n)
-    else: # Outer vertex
-        v.co = centroid([ev.co for ev in v.data[2] if len(ev.data) == 3]+[v.data[0].co])
-
 def createFaceVert(object, f):
     
     v = object.createVertex(vavg3d4(f.verts[0].co, f.verts[1].co, f.verts[2].co, f.verts[3].co))
@@ -59,10 +67,6 @@ def createFaceVert(object, f):
     
     return v
     
-def updateFaceVert(fv):
-    
-    fv.co = vavg3d4(fv.data.verts[0].co, fv.data.verts[1].co, fv.data.verts[2].co, fv.data.verts[3].co)
-
 def createEdgeVert(object, edgeVerts, v1, v2, c):
     
     key = (v1.idx, v2.idx) if v1.idx < v2.idx else (v2.idx, v1.idx)
@@ -78,18 +82,62 @@ def createEdgeVert(object, edgeVerts, v1, v2, c):
         
     return v
     
-def updateEdgeVert(ev):
-
-    if len(ev.data) > 3: # Inner edge
-        ev.co = vavg3d4(ev.data[0].co, ev.data[1].co, ev.data[2].co, ev.data[3].co)
-    else: # Outer edge
-        ev.co = vavg3d(ev.data[0].co, ev.data[1].co)
+def updateCoords(subdivisionObject):
+    
+    coords = subdivisionObject.coords
+    source = [v.co for v in subdivisionObject.originalObject.verts]
+    originalStencils, faceStencils, edgeStencils = subdivisionObject.stencils
+    
+    for i, co in enumerate(source):
+        coords[i] = co[:]
+        
+    for i, (v0, v1, v2, v3) in faceStencils:
+        coords[i] = vavg3d4(source[v0], source[v1], source[v2], source[v3])
+        
+    for i, v1, v2, c in edgeStencils:
+        if len(c) > 1: # Inner edge
+            coords[i] = vavg3d4(source[v1], source[v2], coords[c[0]], coords[c[1]])
+        else: # Outer edge
+            coords[i] = vavg3d(source[v1], source[v2])
+            
+    for i, (faceVerts, edgeVerts, outerEdgeVerts) in enumerate(originalStencils):
+        if not faceVerts or not edgeVerts: # Joint vertex
+            continue
+        n = len(faceVerts)
+        if n == len(edgeVerts): # Inner vertex
+            faceVertAvg = centroid([coords[j] for j in faceVerts])
+            edgeVertAvg = centroid([coords[j] for j in edgeVerts])
+            coords[i] = vmul3d(vadd3d(vadd3d(faceVertAvg, vmul3d(edgeVertAvg, 2.0)), vmul3d(source[i], n - 3.0)), 1.0/n)
+        else: # Outer vertex
+            coords[i] = centroid([coords[j] for j in outerEdgeVerts] + [source[i]])
 
-def createSubdivisionObject(object, progressCallback=None):
+def getMeshPath(object):
     
-    name = object.name + '.sub'
+    if object.topology:
+        return object.topology.path
+    return getattr(object, 'path', None)
+    
+def getCacheKey(object):
+    
+    path = getMeshPath(object)
+    if not path:
+        return None, None
+    try:
+        return path, (os.path.getmtime(path), len(object.verts), len(object.faces))
+    except OSError:
+        return None, None
+        
+def getStencils(subdivisionObject):
+    
+    originalStencils = tuple([(tuple([fv.idx for fv in v.data[1]]), tuple([ev.idx for ev in v.data[2]]),
+        tuple([ev.idx for ev in v.data[2] if len(ev.data) == 3])) for v in subdivisionObject.originalVerts])
+    faceStencils = tuple([(v.idx, tuple([ov.idx for ov in v.data.verts])) for v in subdivisionObject.faceVerts])
+    edgeStencils = tuple([(v.idx, v.data[0].idx, v.data[1].idx, tuple([c.idx for c in v.data[2:4]])) for v in subdivisionObject.edgeVerts])
+    
+    return originalStencils, faceStencils, edgeStencils
+    
+def copySettings(object, subdivisionObject):
     
-    subdivisionObject = Object3D(name)
     subdivisionObject.x = object.x
     subdivisionObject.y = object.y
     subdivisionObject.z = object.z
@@ -105,6 +153,56 @@ def createSubdivisionObject(object, progressCallback=None):
     subdivisionObject.cameraMode = object.cameraMode
     subdivisionObject.solid = object.solid
     subdivisionObject.transparentPrimitives = object.transparentPrimitives * 4
+    
+def getSubdivisionTopology(object, progressCallback=None):
+    
+    path, key = getCacheKey(object)
+    entry = subdivisionTopologies.pop(path, None)
+    
+    if not entry or entry[:3] != key:
+        topology, stencils = buildSubdivisionTopology(object, progressCallback)
+        if not path:
+            return topology, stencils
+        entry = key + (topology, stencils)
+        
+    # Keep the most recently used files
+    subdivisionTopologies[path] = entry
+    while len(subdivisionTopologies) > maxSubdivisionTopologies:
+        subdivisionTopologies.popitem(last=False)
+        
+    return entry[3], entry[4]
+
+@profiler.timed('createSubdivisionObject')
+def createSubdivisionObject(object, progressCallback=None):
+    
+    collecting = gc.isenabled()
+    gc.disable()
+    try:
+        topology, stencils = getSubdivisionTopology(object, progressCallback)
+        subdivisionObject = topology.createObject(object.name + '.sub')
+        
+        copySettings(object, subdivisionObject)
+        subdivisionObject.originalObject = object
+        subdivisionObject.stencils = stencils
+        subdivisionObject.object = object.object
+        subdivisionObject.texture = object.texture
+        
+        if progressCallback:progressCallback(0.6)
+        updateCoords(subdivisionObject)
+        if progressCallback:progressCallback(0.8)
+        subdivisionObject.calcNormals()
+        if progressCallback:progressCallback(1.0)
+    finally:
+        if collecting:
+            gc.enable()
+        
+    return subdivisionObject
+    
+def buildSubdivisionTopology(object, progressCallback=None):
+    
+    name = object.name + '.sub'
+    
+    subdivisionObject = Object3D(name)
     subdivisionObject.uvValues = []
     subdivisionObject.indexBuffer = []
     
@@ -192,40 +290,13 @@ def createSubdivisionObject(object, progressCallback=None):
                 progress += progressIncr
                 progressCallback(progress)
     
-    for v in subdivisionObject.edgeVerts:
-        updateEdgeVert(v)
-        
-    if progressCallback:progressCallback(0.6)
-    
-    for v in subdivisionObject.originalVerts:
-        updateOriginalVert(v)
-        
-    if progressCallback:progressCallback(0.7)
-    
-    subdivisionObject.updateIndexBuffer()
-    subdivisionObject.object = object.object
-    subdivisionObject.texture = object.texture
-    
-    if progressCallback:progressCallback(0.8)  
-    subdivisionObject.calcNormals()
-    if progressCallback:progressCallback(1.0)
-
-    return subdivisionObject
+    return subdivisionObject.getTopology(), getStencils(subdivisionObject)
     
+@profiler.timed('updateSubdivisionObject')
 def updateSubdivisionObject(object, progressCallback=None):
     
     if progressCallback:progressCallback(0.0)
-    for v in object.originalVerts:
-        initOriginalVert(v)
-    if progressCallback:progressCallback(0.1)
-    for v in object.faceVerts:
-        updateFaceVert(v)
-    if progressCallback:progressCallback(0.2)
-    for v in object.edgeVerts:
-        updateEdgeVert(v)
-    if progressCallback:progressCallback(0.4)
-    for v in object.originalVerts:
-        updateOriginalVert(v)
+    updateCoords(object)
     if progressCallback:progressCallback(0.6)
     object.calcNormals()
     if progressCallback:progressCallback(0.8)
@@ -42,6 +42,7 @@ import mh2collada
 import mh2md5
 import mh2stl
 import mh2skel
+import modelindex
 from shutil import copyfile
 from os.path import basename
 
@@ -137,68 +138,64 @@ class HumanFileSort(gui3d.FileSort):
     def __init__(self):
         
         gui3d.FileSort.__init__(self)
-        self.meta = {}
+        self.index = modelindex.getModelIndex()
+        self.ranges = {}
+        self.tags = []
     
     def fields(self):
         
         return list(gui3d.FileSort.fields(self)) + ["gender", "age", "muscle", "weight"]
         
+    def sort(self, by, filenames):
+        
+        if self.ranges or self.tags:
+            filenames = self.index.filter(filenames, self.ranges, self.tags)
+        return gui3d.FileSort.sort(self, by, filenames)
+        
+    def setRange(self, field, minimum=None, maximum=None):
+        """
+        Only shows models whose value for field lies between minimum and maximum.
+        Passing None for both removes the filter on that field.
+        """
+        
+        if minimum is None and maximum is None:
+            self.ranges.pop(field, None)
+        else:
+            self.ranges[field] = (minimum, maximum)
+            
+    def setTags(self, tags):
+        
+        self.tags = list(tags)
+        
+    def clearFilters(self):
+        
+        self.ranges = {}
+        self.tags = []
+        
     def sortGender(self, filenames):
         
-        self.updateMeta(filenames)
-        decorated = [(self.meta[filename]['gender'], i, filename) for i, filename in enumerate(filenames)]
-        decorated.sort()
-        return [filename for gender, i, filename in decorated]
+        return self.index.sort('gender', filenames)
         
     def sortAge(self, filenames):
         
-        self.updateMeta(filenames)
-        decorated = [(self.meta[filename]['age'], i, filename) for i, filename in enumerate(filenames)]
-        decorated.sort()
-        return [filename for age, i, filename in decorated]
+        return self.index.sort('age', filenames)
 
     def sortMuscle(self, filenames):
         
-        self.updateMeta(filenames)
-        decorated = [(self.meta[filename]['muscle'], i, filename) for i, filename in enumerate(filenames)]
-        decorated.sort()
-        return [filename for muscle, i, filename in decorated]
+        return self.index.sort('muscle', filenames)
        
     def sortWeight(self, filenames):
         
-        self.updateMeta(filenames)
-        decorated = [(self.meta[filename]['weight'], i, filename) for i, filename in enumerate(filenames)]
-        decorated.sort()
-        return [filename for weight, i, filename in decorated]
+        return self.index.sort('weight', filenames)
         
     def updateMeta(self, filenames):
         
-        for filename in filenames:
-            
-            if filename in self.meta:
-                
-                if self.meta[filename]['modified'] < os.path.getmtime(filename):
-                
-                    self.meta[filename] = self.getMeta(filename)
-                
-            else:
-                
-                self.meta[filename] = self.getMeta(filename)
+        self.index.update(filenames)
                 
     def getMeta(self, filename):
         
-        meta = {}
-                
-        meta['modified'] = os.path.getmtime(filename)
-        f = open(filename)
-        for line in f:
-            lineData = line.split()
-            field = lineData[0]
-            if field in ["gender", "age", "muscle", "weight"]:
-                meta[field] = float(lineData[1])
-        f.close()
-        
-        return meta
+        self.index.update([filename])
+        return self.index.getMeta(filename)
 
 class LoadTaskView(gui3d.TaskView):
 
@@ -12,16 +12,28 @@ class MacroAction:
         self.after = value
         self.postAction = postAction
         self.update = update
+        self.delta = None
 
     def do(self):
-        getattr(self.human, 'set' + self.method)(self.after)
-        self.human.applyAllTargets(gui3d.app.progress, update=self.update)
+        if self.delta is not None:
+            getattr(self.human, 'set' + self.method)(self.after)
+            self.human.applyMeshDelta(self.delta, False, gui3d.app.progress, update=self.update)
+        else:
+            oldDetails = self.human.targetsDetailStack.copy()
+            getattr(self.human, 'set' + self.method)(self.after)
+            self.human.updateMacroTargets(oldDetails, gui3d.app.progress, update=self.update)
+            self.delta = self.human.getMeshDelta(oldDetails, self.human.targetsDetailStack)
         self.postAction()
         return True
 
     def undo(self):
-        getattr(self.human, 'set' + self.method)(self.before)
-        self.human.applyAllTargets(gui3d.app.progress)
+        if self.delta is not None:
+            getattr(self.human, 'set' + self.method)(self.before)
+            self.human.applyMeshDelta(self.delta, True, gui3d.app.progress)
+        else:
+            oldDetails = self.human.targetsDetailStack.copy()
+            getattr(self.human, 'set' + self.method)(self.before)
+            self.human.updateMacroTargets(oldDetails, gui3d.app.progress)
         self.postAction()
         return True
 
@@ -61,6 +61,7 @@ New properties added to base classes:
 - **Object3D.he_hedgeCalculated**. A flag indicating whether *Half Edges* have been calculated for this object.
 - **Vert.he_hedge**. A HEdge reference from the vertex. This is the vertex that forms the starting point of this *Half Edge*.
 - **Face.he_hedge**. A list of 3 HEdges (indexed using 0, 1 and 2), referenced from the triangular Face formed by those *Half Edges*.
+- **Object3D.he_halfEdges**. The HalfEdges arrays of the object, see below.
 
 **Figure 1:**
 
@@ -80,14 +81,26 @@ reference:
  
 All of the other Half Edges contain the same attributes, enabling the data structure to be 'viewed' in a number of ways that support the integrity and coherence of the 3D mesh. 
 
+The HalfEdges class stores the same data as integer arrays with one element per *Half Edge*,
+built with array operations from the vertex indices of the faces, and implements the same
+queries on them. It handles quads as well as triangles, and takes a small part of the memory
+of the HEdge objects, which matters for subdivided meshes. The calcHalfEdges function builds
+it for an Object3D object.
+
 Require:
 
 - base modules
+- numpy, for the HalfEdges class
 
 """
 
 __docformat__ = 'restructuredtext'
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 
 class HEdge:
 
@@ -462,9 +475,8 @@ def hedgesSharedByFace(f):
 def facesSharedByVert(v):
     """
     This function lists the faces that share a specified vertex.
-    This function calls the *edgesSharedByVert* function to retrieve a 
-    list of *Half Edges* that start at that vertex and returns the list
-    of faces that each of those *Half Edges* is on.  
+    The faces are looked up in the adjacency tables of the object, so the 
+    *Half Edges* do not need to be calculated.  
     
     .. image:: ../images/vert.png
        :alt: Faces that share the specified vertex
@@ -476,12 +488,8 @@ def facesSharedByVert(v):
       *Vertex*.  The vertex to be scanned.
     """
 
-    hEdges = edgesSharedByVert(v)
-    facesShared = []
-    for he in hEdges:
-        facesShared.append(he.face)
-
-    return facesShared
+    faces = v.object.faces
+    return [faces[i] for i in v.object.getAdjacency().getVertFaces(v.idx)]
 
 
 # def subvertIdxSharedByVert(v):
@@ -497,10 +505,9 @@ def facesSharedByVert(v):
 def vertsSharedbyVert(v):
     """
     This function lists the set of vertices from all of the faces that 
-    share the specified vertex.
-    This function calls the *facesSharedByVert* function to retrieve a 
-    list of faces that share the specified vertex and returns the list
-    of all of the vertices on all of those faces. The list is deduplicated. 
+    share the specified vertex, except the vertex itself.
+    The vertices are looked up in the adjacency tables of the object. 
+    The list is deduplicated. 
         
     .. image:: ../images/vert_shared.png
        :alt: Vertices from faces that share the specified vertex
@@ -512,12 +519,210 @@ def vertsSharedbyVert(v):
       *Vertex*.  The vertex to be scanned.
     """
 
-    vertsShared = []
-    facesShared = facesSharedByVert(v)
-    for f in facesShared:
-        for ve in f.verts:
-            if ve != v and ve not in vertsShared:
-                vertsShared.append(ve)
-    return vertsShared
+    verts = v.object.verts
+    return [verts[i] for i in v.object.getAdjacency().getVertRing(v.idx) if i != v.idx]
+
+
+class HalfEdges:
+
+    """
+    The *Half Edges* of a mesh stored as integer arrays, one element per *Half Edge*,
+    instead of an HEdge object per *Half Edge* linked by key-identifier strings.
+    The arrays are built from the face vertex indices with array operations, twins
+    are found by sorting the (start, end) vertex pairs of the *Half Edges*, so no
+    dictionary is needed.
+
+    The *Half Edges* of a face are stored consecutively, in the order of the vertices
+    of the face. A *Half Edge* is referred to by its index in the arrays.
+
+    .. py:attribute:: vert
+
+        The index of the first vertex of each *Half Edge*.
+
+    .. py:attribute:: face
+
+        The index of the face upon which each *Half Edge* sits.
+
+    .. py:attribute:: next
+
+        The next *Half Edge* on the same face.
+
+    .. py:attribute:: prev
+
+        The previous *Half Edge* on the same face.
+
+    .. py:attribute:: twin
+
+        The twin *Half Edge* on the adjoining face, -1 for a boundary edge.
+
+    .. py:attribute:: faceOffsets
+
+        The *Half Edges* of face i are faceOffsets[i] to faceOffsets[i+1] - 1.
+
+    .. py:attribute:: vertHedge
+
+        A *Half Edge* starting at each vertex, -1 for an isolated vertex. For a vertex
+        on a boundary this is the *Half Edge* following the boundary, so that all
+        *Half Edges* starting at the vertex can be found by following twin and next.
+
+    :param faceVerts: The vertex indices of each face. A triangle repeats its first
+        vertex as fourth vertex, -1 marks a missing corner.
+    :type faceVerts: numpy.ndarray of shape (faces, 3) or (faces, 4), or [(int, ..), ..]
+    :param nVerts: The amount of vertices.
+    :type nVerts: int
+    """
+
+    def __init__(self, faceVerts, nVerts):
+
+        if not numpy:
+            raise RuntimeError('Half edge arrays require numpy')
+
+        faceVerts = numpy.asarray(faceVerts, dtype=numpy.int32)
+        if len(faceVerts):
+            faceVerts = faceVerts.reshape(len(faceVerts), -1)
+        else:
+            # Without faces every vertex is isolated
+            faceVerts = faceVerts.reshape(0, 4)
+        nFaces = len(faceVerts)
+
+        valid = faceVerts >= 0
+        if faceVerts.shape[1] == 4:
+            valid[:, 3] &= faceVerts[:, 3] != faceVerts[:, 0]
+        counts = valid.sum(axis=1).astype(numpy.int32)
+
+        self.nVerts = nVerts
+        self.faceOffsets = numpy.zeros(nFaces + 1, dtype=numpy.int32)
+        numpy.cumsum(counts, out=self.faceOffsets[1:])
+        self.vert = faceVerts[valid]
+        self.face = numpy.repeat(numpy.arange(nFaces, dtype=numpy.int32), counts)
+
+        hedges = numpy.arange(len(self.vert), dtype=numpy.int32)
+        first = self.faceOffsets[self.face]
+        last = self.faceOffsets[self.face + 1] - 1
+        self.next = numpy.where(hedges == last, first, hedges + 1)
+        self.prev = numpy.where(hedges == first, last, hedges - 1)
+
+        # The twin goes from the last to the first vertex of the Half Edge
+        keys = self.__getKeys()
+        end = self.vert[self.next]
+        twinKeys = end.astype(numpy.int64) * nVerts + self.vert
+        order = numpy.argsort(keys, kind='mergesort').astype(numpy.int32)
+        sortedKeys = keys[order]
+        found = numpy.minimum(numpy.searchsorted(sortedKeys, twinKeys), max(len(keys) - 1, 0))
+        self.twin = numpy.where(sortedKeys[found] == twinKeys, order[found], -1).astype(numpy.int32)
+
+        self.vertHedge = numpy.empty(nVerts, dtype=numpy.int32)
+        self.vertHedge.fill(-1)
+        self.vertHedge[self.vert] = hedges
+        following = hedges[self.twin[self.prev] < 0]
+        self.vertHedge[self.vert[following]] = following
+
+    def __getKeys(self):
+
+        return self.vert.astype(numpy.int64) * self.nVerts + self.vert[self.next]
+
+    def getEnd(self, hedge):
+        """
+        Returns the index of the last vertex of a *Half Edge*.
+        """
+
+        return self.vert[self.next[hedge]]
+
+    def getBoundaryHedges(self):
+        """
+        Returns the *Half Edges* without a twin, the edges sitting on only one face.
+        """
+
+        return numpy.nonzero(self.twin < 0)[0]
+
+    def getIsolatedVerts(self):
+        """
+        Returns the vertices which are not used by any face.
+        """
+
+        return numpy.nonzero(self.vertHedge < 0)[0]
+
+    def getDuplicateHedges(self):
+        """
+        Returns the *Half Edges* going from the same first to the same last vertex as
+        another *Half Edge*. This happens where faces sharing an edge have opposite
+        normals, or where more than two faces share an edge.
+        """
+
+        keys = self.__getKeys()
+        order = numpy.argsort(keys, kind='mergesort')
+        sortedKeys = keys[order]
+        duplicate = numpy.zeros(len(keys), dtype=bool)
+        same = sortedKeys[1:] == sortedKeys[:-1]
+        duplicate[1:] |= same
+        duplicate[:-1] |= same
+        return numpy.sort(order[duplicate])
+
+    def edgesSharedByVert(self, index):
+        """
+        Returns the *Half Edges* starting at a vertex, as the edgesSharedByVert function
+        does for HEdge objects. The *Half Edges* are found by going from the twin of a
+        *Half Edge* to its next, until the first one is found again or a boundary is
+        reached.
+        """
+
+        start = self.vertHedge[index]
+        if start < 0:
+            return []
+        hedges = [start]
+        hedge = start
+        while True:
+            twin = self.twin[hedge]
+            if twin < 0:
+                break
+            hedge = self.next[twin]
+            # A wrong normal may lead to a loop which doesn't pass the first Half Edge
+            if hedge == start or hedge in hedges:
+                break
+            hedges.append(hedge)
+        return hedges
+
+    def hedgesSharedByFace(self, index):
+        """
+        Returns the *Half Edges* which delimit a face.
+        """
+
+        return range(self.faceOffsets[index], self.faceOffsets[index + 1])
+
+    def facesSharedByVert(self, index):
+        """
+        Returns the faces which share a vertex.
+        """
+
+        return self.face[self.edgesSharedByVert(index)].tolist()
+
+    def vertsSharedByVert(self, index):
+        """
+        Returns the vertices from all of the faces that share a vertex, except the
+        vertex itself, deduplicated.
+        """
+
+        verts = set()
+        for f in self.facesSharedByVert(index):
+            verts.update(self.vert[self.faceOffsets[f]:self.faceOffsets[f + 1]].tolist())
+        verts.discard(index)
+        return sorted(verts)
+
+
+def calcHalfEdges(ob):
+    """
+    This function builds the array based *Half Edges* of an Object3D object and
+    stores them as the *he_halfEdges* attribute of the object.
+
+    Parameters
+    ----------
+
+    ob:
+      *Object3D*.  The Object3D object.
+    """
+
+    faceVerts = [[v.idx for v in f.verts] + [-1] * (4 - len(f.verts)) for f in ob.faces]
+    ob.he_halfEdges = HalfEdges(faceVerts, len(ob.verts))  # New property added to base obj
+    return ob.he_halfEdges
 
 
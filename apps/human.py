@@ -30,6 +30,13 @@ import humanmodifier
 import hair
 import events3d
 import warp
+import meshdelta
+import symmetry
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 class HumanEvent(events3d.Event):
 
@@ -47,7 +54,6 @@ class Human(gui3d.Object):
         gui3d.Object.__init__(self, [0, 0, 0], mesh, True)
         
         self.iHaveChanged = True
-        algos3d.theHuman = self
         
         self.mesh.setCameraProjection(0)
         self.mesh.setShadeless(0)
@@ -62,6 +68,8 @@ class Human(gui3d.Object):
         self.clothesProxies = {}
         self.targetsDetailStack = {}  # All details targets applied, with their values
         self.symmetryModeEnabled = False
+        self.macroDrift = 0.0 # Total weight applied incrementally since the last applyAllTargets
+        self.macroDriftTolerance = 50.0
 
         self.enableUVInterpolation = 0
         self.targetUVBuffer = {}
@@ -385,6 +393,7 @@ class Human(gui3d.Object):
 
         algos3d.resetObj(self.meshData)
         self.syncShadowVerts()
+        self.macroDrift = 0.0
 
         if progressCallback:
             progressCallback(0.0)
@@ -426,6 +435,179 @@ class Human(gui3d.Object):
         self.callEvent('onChanged', HumanEvent(self, 'targets'))
         
 
+    def updateMacroTargets(self, oldDetails, progressCallback=None, update=True):
+        """
+        This method recomputes the weights of the macro targets (gender, age,
+        muscle, weight and ethnic) and applies them incrementally, see
+        applyChangedTargets.
+
+        Parameters
+        ----------
+
+        oldDetails:
+            *dict*. A copy of the targetsDetailStack taken before the macro
+            values were changed.
+        """
+
+        self.muscleWeightModifier.setValue(self, 1.0)
+        self.baseModifier.setValue(self, 1.0)
+        self.applyChangedTargets(oldDetails, progressCallback, update)
+
+    def applyChangedTargets(self, oldDetails, progressCallback=None, update=True):
+        """
+        This method applies only the weight differences between oldDetails and
+        the current targetsDetailStack to the mesh, instead of resetting the mesh
+        and replaying every target like applyAllTargets does.
+
+        Each incremental update adds rounding error to the coordinates. The
+        weights applied this way are summed in macroDrift, and once that sum
+        exceeds macroDriftTolerance a full applyAllTargets is done instead.
+        Warp targets depend on all other targets, so when any is loaded a full
+        rebuild is done as well.
+
+        Parameters
+        ----------
+
+        oldDetails:
+            *dict*. A copy of the targetsDetailStack matching the current mesh.
+        """
+
+        changed = {}
+        for targetPath in set(oldDetails) | set(self.targetsDetailStack):
+            delta = self.targetsDetailStack.get(targetPath, 0.0) - oldDetails.get(targetPath, 0.0)
+            if delta:
+                changed[targetPath] = delta
+
+        drift = self.macroDrift + sum([abs(delta) for delta in changed.itervalues()])
+        if drift > self.macroDriftTolerance or [t for t in algos3d.targetBuffer.itervalues() if hasattr(t, "isWarp")]:
+            self.applyAllTargets(progressCallback, update)
+            return
+        self.macroDrift = drift
+
+        if progressCallback:
+            progressCallback(0.0)
+        progressVal = 0.0
+        progressIncr = 0.5 / (len(changed) + 1)
+
+        verts = set()
+        faces = set()
+        for (targetPath, delta) in changed.iteritems():
+            target = algos3d.getTarget(self.meshData, targetPath)
+            target.apply(self.meshData, delta, False, False)
+            target.morphFactor = self.targetsDetailStack.get(targetPath, 0.0)
+            verts.update(target.verts)
+            faces.update(target.faces)
+
+            progressVal += progressIncr
+            if progressCallback:
+                progressCallback(progressVal)
+
+        vertices = [self.meshData.verts[i] for i in verts]
+        self.updateChangedVerts(vertices, [self.meshData.faces[i] for i in faces], progressCallback, update)
+
+    def updateChangedVerts(self, vertices, faces, progressCallback=None, update=True):
+        """
+        This method recalculates the normals of the given vertices and faces after
+        their coordinates were changed, and updates the proxy and subdivided meshes.
+        """
+
+        self.meshData.calcNormals(1, 1, vertices, faces)
+        if progressCallback:
+            progressCallback(0.7)
+
+        self.updateProxyMesh()
+        if self.isSubdivided():
+            self.getSeedMesh().update(vertices)
+            self.updateSubdivisionMesh()
+            self.mesh.calcNormals()
+            if progressCallback:
+                progressCallback(0.8)
+            if update:
+                self.mesh.update()
+        elif update:
+            self.meshData.update(vertices)
+
+        if progressCallback:
+            progressCallback(1.0)
+
+        self.callEvent('onChanged', HumanEvent(self, 'targets'))
+
+    def getMeshDelta(self, before, after):
+        """
+        This method returns the difference between two sets of target weights,
+        for undoing and redoing the change with applyMeshDelta, or None when
+        numpy is not available.
+
+        Parameters
+        ----------
+
+        before:
+            *dict*. The target weights before the change.
+
+        after:
+            *dict*. The target weights after the change.
+        """
+
+        if not meshdelta.numpy:
+            return None
+        return meshdelta.MeshDelta(before, after)
+
+    def applyMeshDelta(self, delta, undo=False, progressCallback=None, update=True):
+        """
+        This method sets the target weights of a delta and moves the vertices
+        by its offsets, subtracting them when undo is set. Like
+        applyChangedTargets it falls back to applyAllTargets when the drift
+        exceeds macroDriftTolerance or warp targets are loaded.
+
+        Parameters
+        ----------
+
+        delta:
+            *MeshDelta*. The delta returned by getMeshDelta.
+
+        undo:
+            *bool*. Whether to go back to the weights before the change.
+        """
+
+        details = delta.before if undo else delta.after
+        for (targetPath, morphFactor) in details.iteritems():
+            self.setDetail(targetPath, morphFactor)
+
+        drift = self.macroDrift + delta.weight
+        if drift > self.macroDriftTolerance or [t for t in algos3d.targetBuffer.itervalues() if hasattr(t, "isWarp")]:
+            self.applyAllTargets(progressCallback, update)
+            return
+        self.macroDrift = drift
+
+        if progressCallback:
+            progressCallback(0.0)
+
+        delta.build(self.meshData)
+        for targetPath in details:
+            target = algos3d.targetBuffer.get(targetPath)
+            if target:
+                target.morphFactor = self.getDetail(targetPath)
+
+        offsets = -delta.offsets if undo else delta.offsets
+        vertices = []
+        faces = set()
+        for i, (dx, dy, dz) in zip(delta.indices.tolist(), offsets.tolist()):
+            v = self.meshData.verts[i]
+            v.co[0] += dx
+            v.co[1] += dy
+            v.co[2] += dz
+            sv = self.shadowVerts[i]
+            sv[0] += dx
+            sv[1] += dy
+            sv[2] += dz
+            vertices.append(v)
+            faces.update(v.sharedFaces)
+
+        if progressCallback:
+            progressCallback(0.5)
+
+        self.updateChangedVerts(vertices, list(faces), progressCallback, update)
+
     def resetAllWarpTargets(self, force):
         if not warp.numpy:
             return
@@ -509,6 +691,23 @@ class Human(gui3d.Object):
             prefix1 = 'r-'
             prefix2 = 'l-'
 
+        # Move the vertices by the summed offsets of all changed targets at once
+
+        before = dict(self.targetsDetailStack)
+        after = dict([(target, value) for (target, value) in before.iteritems()
+            if os.path.basename(target)[:2] != prefix2])
+        for (target, value) in before.iteritems():
+            targetName = os.path.basename(target)
+            if targetName[:2] == prefix1:
+                after[self.getSymmetricTarget(target, prefix2)] = value
+
+        delta = self.getMeshDelta(before, after)
+        if delta is not None:
+            if delta:
+                self.applyMeshDelta(delta)
+            gui3d.app.redraw()
+            return
+
         # Remove current values
 
         for target in self.targetsDetailStack.keys():
@@ -526,12 +725,8 @@ class Human(gui3d.Object):
         for target in self.targetsDetailStack.keys():
             targetName = os.path.basename(target)
             if targetName[:2] == prefix1:
-                targetSym = os.path.join(os.path.dirname(target), prefix2 + targetName[2:])
+                targetSym = self.getSymmetricTarget(target, prefix2)
                 targetSymVal = self.targetsDetailStack[target]
-                if 'trans-in' in targetSym:
-                    targetSym = targetSym.replace('trans-in', 'trans-out')
-                elif 'trans-out' in targetSym:
-                    targetSym = targetSym.replace('trans-out', 'trans-in')
                 algos3d.loadTranslationTarget(self.meshData, targetSym, targetSymVal, None, 1, 1)
                 self.targetsDetailStack[targetSym] = targetSymVal
         
@@ -541,6 +736,88 @@ class Human(gui3d.Object):
 
         gui3d.app.redraw()
 
+    def getSymmetricTarget(self, target, prefix):
+        """
+        This method returns the path of the target on the other side, which has
+        the given prefix. For horizontal movement the direction is inverted.
+        """
+
+        targetSym = os.path.join(os.path.dirname(target), prefix + os.path.basename(target)[2:])
+        if 'trans-in' in targetSym:
+            targetSym = targetSym.replace('trans-in', 'trans-out')
+        elif 'trans-out' in targetSym:
+            targetSym = targetSym.replace('trans-out', 'trans-in')
+        return targetSym
+
+    def symmetrizeMesh(self, side='r', indices=None):
+        """
+        This method makes the mesh symmetrical by mirroring the coordinates of one
+        side onto the other, whatever moved them. Unlike symmetrize it does not change
+        targets, so the change is lost when all targets are applied again.
+
+        Parameters
+        ----------
+
+        side:
+            *string*. The side to keep, "r" or "l".
+
+        indices:
+            *list*. The vertices to replace by their mirrored counterpart, all
+            vertices of the other side if None.
+        """
+
+        coords = self.getCoords()
+        if indices is None:
+            newCoords = symmetry.symmetrizeCoords(coords, self.meshData, side)
+        else:
+            newCoords = symmetry.mirrorCoords(coords, symmetry.getMirrorMap(self.meshData), indices)
+        self.setCoords(newCoords, coords)
+
+    def smoothMesh(self, indices=None, factor=0.5, iterations=1):
+        """
+        This method smooths the mesh, or the given vertices, by moving the vertices
+        towards the average of their neighbours. Like symmetrizeMesh it does not
+        change targets.
+        """
+
+        coords = self.getCoords()
+        newCoords = symmetry.smoothCoords(coords, self.meshData.getAdjacency(), indices, factor, iterations)
+        self.setCoords(newCoords, coords)
+
+    def getCoords(self):
+        """
+        This method returns the coordinates of the base mesh as an array.
+        """
+
+        if not numpy:
+            raise RuntimeError('Mesh operations require numpy')
+        return numpy.array([v.co for v in self.meshData.verts])
+
+    def setCoords(self, coords, oldCoords):
+        """
+        This method moves the vertices whose coordinates differ from oldCoords,
+        keeping the shadow coordinates in step, and updates the meshes.
+        """
+
+        offsets = coords - oldCoords
+        indices = numpy.flatnonzero(numpy.any(offsets, axis=1))
+        vertices = []
+        faces = set()
+        for i, (dx, dy, dz) in zip(indices.tolist(), offsets[indices].tolist()):
+            v = self.meshData.verts[i]
+            v.co[0] += dx
+            v.co[1] += dy
+            v.co[2] += dz
+            sv = self.shadowVerts[i]
+            sv[0] += dx
+            sv[1] += dy
+            sv[2] += dz
+            vertices.append(v)
+            faces.update(v.sharedFaces)
+
+        if vertices:
+            self.updateChangedVerts(vertices, list(faces))
+
     def rotateLimb(self, targetPath, morphFactor):
         targetPath1 = targetPath+".target"
         targetPath2 = targetPath+".rot"
@@ -26,6 +26,7 @@ TO DO
 __docformat__ = 'restructuredtext'
 
 import algos3d
+import targetindex
 import gui3d
 from string import Template
 from operator import mul
@@ -41,19 +42,29 @@ class DetailAction:
         self.after = after
         self.postAction = postAction
         self.update=update
+        self.delta = human.getMeshDelta(before, after)
+        self.done = False
 
     def do(self):
-        for (target, value) in self.after.iteritems():
-            self.human.setDetail(target, value)
-        self.human.applyAllTargets(gui3d.app.progress, update=self.update)
+        if self.delta is not None and self.done:
+            self.human.applyMeshDelta(self.delta, False, gui3d.app.progress, self.update)
+        else:
+            for (target, value) in self.after.iteritems():
+                self.human.setDetail(target, value)
+            self.human.applyAllTargets(gui3d.app.progress, update=self.update)
+        self.done = True
         if self.postAction:
             self.postAction()
         return True
 
     def undo(self):
-        for (target, value) in self.before.iteritems():
-            self.human.setDetail(target, value)
-        self.human.applyAllTargets()
+        if self.delta is not None:
+            self.human.applyMeshDelta(self.delta, True)
+        else:
+            for (target, value) in self.before.iteritems():
+                self.human.setDetail(target, value)
+            self.human.applyAllTargets()
+        self.done = True
         if self.postAction:
             self.postAction()
         return True
@@ -67,16 +78,30 @@ class ModifierAction:
         self.before = before
         self.after = after
         self.postAction = postAction
+        self.delta = None
 
     def do(self):
-        self.modifier.setValue(self.human, self.after)
-        self.human.applyAllTargets(gui3d.app.progress)
+        if self.delta is not None:
+            self.human.applyMeshDelta(self.delta, False, gui3d.app.progress)
+        else:
+            # The slider may already have changed the details while dragging,
+            # so the weights before the change are those of the old value
+            if self.before is not None:
+                self.modifier.setValue(self.human, self.before)
+                before = self.human.targetsDetailStack.copy()
+            self.modifier.setValue(self.human, self.after)
+            if self.before is not None:
+                self.delta = self.human.getMeshDelta(before, self.human.targetsDetailStack)
+            self.human.applyAllTargets(gui3d.app.progress)
         self.postAction()
         return True
 
     def undo(self):
-        self.modifier.setValue(self.human, self.before)
-        self.human.applyAllTargets(gui3d.app.progress)
+        if self.delta is not None:
+            self.human.applyMeshDelta(self.delta, True, gui3d.app.progress)
+        else:
+            self.modifier.setValue(self.human, self.before)
+            self.human.applyAllTargets(gui3d.app.progress)
         self.postAction()
         return True
         
@@ -156,18 +181,7 @@ class Modifier:
         
         # Collect vertex and face indices if we didn't yet
         if not (self.verts or self.faces):
-            # Collect verts
-            self.verts = []
-            for target in (self.left, self.right):
-                t = algos3d.getTarget(human.meshData, target)
-                self.verts.extend(t.verts)
-            self.verts = list(set(self.verts))
-            
-            # collect faces
-            self.faces = []
-            for vindex in self.verts:
-                self.faces += [face.idx for face in human.meshData.verts[vindex].sharedFaces]
-            self.faces = list(set(self.faces))
+            self.verts, self.faces = targetindex.getRegion(human.meshData, (self.left, self.right))
         
         # Remove old targets
         algos3d.loadTranslationTarget(human.meshData, self.left, -human.getDetail(self.left), None, 0, 0)
@@ -212,18 +226,7 @@ class GenericModifier:
         
         # Collect vertex and face indices if we didn't yet
         if not (self.verts or self.faces):
-            # Collect verts
-            self.verts = []
-            for target in self.targets:
-                t = algos3d.getTarget(human.meshData, target[0])
-                self.verts.extend(t.verts)
-            self.verts = list(set(self.verts))
-            
-            # collect faces
-            self.faces = []
-            for vindex in self.verts:
-                self.faces += [face.idx for face in human.meshData.verts[vindex].sharedFaces]
-            self.faces = list(set(self.faces))
+            self.verts, self.faces = targetindex.getRegion(human.meshData, [target[0] for target in self.targets])
         
         # Remove old targets
         for target in self.targets:
@@ -0,0 +1,107 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Sparse coordinate differences for undo and redo.
+
+**Project Name:**      MakeHuman
+
+**Product Home Page:** http://www.makehuman.org/
+
+**Code Home Page:**    http://code.google.com/p/makehuman/
+
+**Authors:**           MakeHuman Team
+
+**Copyright(c):**      MakeHuman Team 2001-2012
+
+**Licensing:**         GPL3 (see also http://sites.google.com/site/makehumandocs/licensing)
+
+**Coding Standards:**  See http://sites.google.com/site/makehumandocs/developers-guide
+
+Abstract
+--------
+
+An undo step which changes target weights used to set the old weights and replay all
+targets with applyAllTargets. A MeshDelta instead holds the weights which changed and
+the resulting offset of each vertex which moves, as an array of vertex indices and an
+array of float32 offsets. Undo subtracts the offsets and redo adds them, see
+Human.applyMeshDelta.
+
+The offsets are computed from the targets the first time they are needed, so an
+action which is never undone costs no more than the weights it changed.
+"""
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+import algos3d
+
+class MeshDelta:
+
+    """
+    The difference between two sets of target weights.
+
+    :param before: The target weights before the change.
+    :type before: dict
+    :param after: The target weights after the change.
+    :type after: dict
+    """
+
+    def __init__(self, before, after):
+
+        self.before = {}
+        self.after = {}
+        for targetPath in set(before) | set(after):
+            if before.get(targetPath, 0.0) != after.get(targetPath, 0.0):
+                self.before[targetPath] = before.get(targetPath, 0.0)
+                self.after[targetPath] = after.get(targetPath, 0.0)
+
+        self.indices = None
+        self.offsets = None
+
+    def __nonzero__(self):
+
+        return bool(self.after)
+
+    @property
+    def weight(self):
+        """
+        The sum of the absolute weight changes.
+        """
+
+        return sum([abs(self.after[targetPath] - self.before[targetPath]) for targetPath in self.after])
+
+    @property
+    def nbytes(self):
+        """
+        The memory used by the offsets, 0 if they were not computed yet.
+        """
+
+        if self.indices is None:
+            return 0
+        return self.indices.nbytes + self.offsets.nbytes
+
+    def build(self, obj):
+        """
+        Sums the weighted offsets of the changed targets.
+
+        :param obj: The base object.
+        :type obj: :py:class:`module3d.Object3D`
+        """
+
+        if self.indices is not None:
+            return
+
+        offsets = numpy.zeros((len(obj.verts), 3))
+        for targetPath in self.after:
+            target = algos3d.getTarget(obj, targetPath)
+            if not target.verts:
+                continue
+            indices = numpy.array(target.verts, numpy.int32)
+            data = numpy.array([target.data[i] for i in target.verts])
+            offsets[indices] += data * (self.after[targetPath] - self.before[targetPath])
+
+        self.indices = numpy.flatnonzero(numpy.any(offsets, axis=1)).astype(numpy.int32)
+        self.offsets = offsets[self.indices].astype(numpy.float32)
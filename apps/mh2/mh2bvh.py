@@ -34,7 +34,9 @@ Requires:
 __docformat__ = 'restructuredtext'
 
 from skeleton import Skeleton
+import profiler
 
+@profiler.timed('export bvh')
 def exportSkeleton(obj, filename):
     """
     This function exports joint information describing the structure of the 
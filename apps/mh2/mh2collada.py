@@ -36,6 +36,7 @@ import mh2proxy
 import export_config
 import mhx_globals as the
 import read_rig
+import profiler
 
 #
 #    Size of end bones = 1 mm
@@ -46,6 +47,7 @@ Delta = [0,0.01,0]
 # exportCollada(human, filename, options):
 #
 
+@profiler.timed('export collada')
 def exportCollada(human, filename, options):
     time1 = time.clock()
     the.Config = export_config.exportConfig(human, True, [])
@@ -34,6 +34,7 @@ __docformat__ = 'restructuredtext'
 
 from os.path import basename
 from skeleton import Skeleton
+import profiler
 
 groupWeights = (
     ('head-back-skull', 'joint-head', 1.0),
@@ -303,6 +304,7 @@ groupWeights = (
     ('r-eye-lower-lash', 'joint-head', 1.0),
     ('r-eye-upper-lash', 'joint-head', 1.0))
 
+@profiler.timed('export md5')
 def exportMd5(obj, filename):
     """
     This function exports MakeHuman mesh and skeleton data to id Software's MD5 format. 
@@ -30,7 +30,9 @@ if mhxPath not in sys.path:
     sys.path.append(mhxPath)
     
 import mhx_main    
+import profiler
 
+@profiler.timed('export mhx')
 def exportMhx(human, filename, options=None):    
     mhx_main.exportMhx(human, filename, options)
 
@@ -30,14 +30,20 @@ Also use parts of code from mh2obj.py
 import os
 import string
 import shutil
-import subprocess
+import renderqueue
 import mh2mitsuba_ini
 import random
+import array
 import mh
 from os.path import basename
 #
 import sys
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 
 def MitsubaExport(obj, app, settings):
 
@@ -76,15 +82,20 @@ def MitsubaExport(obj, app, settings):
     if os.path.exists(Mitsuba_bin):
         if action == 'render':
             # exporting human mesh.
-            fileobj = 'human.obj'
-            filename = out_path + fileobj
-        
-            #
-            exportObj(obj, filename)
+            if mh2mitsuba_ini.geometry == 'ply':
+                fileobj = 'human.ply'
+                filename = out_path + fileobj
+                # the same faces as exportObj writes
+                exportPly(obj, filename, groupFilter=lambda fg: not [name for name in
+                    ('joint-', 'helper', 'eye-cornea', '-eyebrown', '-lash') if name in fg.name])
+            else:
+                fileobj = 'human.obj'
+                filename = out_path + fileobj
+                exportObj(obj, filename)
 
             # create name for Mitsuba xml scene file
             # this name is different to the name use for command line?
-            filexml = str(filename).replace('.obj','.xml')
+            filexml = os.path.splitext(str(filename))[0] + '.xml'
             #print filexml
 
             # open xml file scene
@@ -116,15 +127,16 @@ def MitsubaExport(obj, app, settings):
             mitsubaFileClose(filexml)
 
             #
-            xmlDataFile = str(fileobj).replace('.obj', '.xml')
+            xmlDataFile = os.path.splitext(str(fileobj))[0] + '.xml'
             #
             if source == 'gui':
                 render_mode  = str(Mitsuba_bin)+'/mtsgui.exe'
-                pathHandle = subprocess.Popen(cwd=outputDirectory, args = render_mode +' '+ xmlDataFile)
+                renderqueue.getRenderQueue(app).submit(renderqueue.RenderJob([render_mode, xmlDataFile], cwd=outputDirectory))
             #
             elif source == 'console':
                 render_mode  = str(Mitsuba_bin)+'/mitsuba.exe'
-                pathHandle = subprocess.Popen(cwd=outputDirectory, args = render_mode +' '+ xmlDataFile)
+                renderqueue.getRenderQueue(app).submit(renderqueue.RenderJob([render_mode, xmlDataFile], cwd=outputDirectory,
+                    progressParser=renderqueue.parsePercentProgress))
             #
             else:
                 app.prompt('INFO ',
@@ -139,10 +151,12 @@ def MitsubaExport(obj, app, settings):
                    'Please, enter a valid path to Mitsuba folder.',
                    'Accept')    
 
-def exportPly(obj, filename, exportGroups = True, groupFilter=None):
+def exportPly(obj, filename, exportUvs=True, groupFilter=None):
     """
-    This function exports a mesh object in Wavefront obj format. It is assumed that obj will have at least vertices and
-    faces (exception handling for vertices/faces must be done outside this method).
+    This function exports a mesh object in binary little endian PLY format. Quads are
+    split in two triangles and the faces of joint and helper groups are skipped, unless
+    a groupFilter is given. When exportUvs is set, every vertex carries its uv coordinate
+    and vertices lying on a uv seam are duplicated, once per distinct uv coordinate.
     
     Parameters
     ----------
@@ -151,57 +165,144 @@ def exportPly(obj, filename, exportGroups = True, groupFilter=None):
       *Object3D*.  The object to export.
     filename:     
       *string*.  The filename of the file to export the object to.
+    exportUvs:
+      *boolean*.  Whether to write per vertex uv coordinates.
+    groupFilter:
+      *function*.  Called with each face group, returns whether its faces are exported.
     """
 
-    # Write obj file
+    if not groupFilter:
+        groupFilter = lambda fg: 'joint' not in fg.name and 'helper' not in fg.name
 
-    f = open(filename, 'w')
+    exportUvs = exportUvs and bool(obj.uvValues)
+
+    # Vertex and uv indices of the exported faces, triangles repeat their first vertex
+
+    faceVerts = []
+    faceUvs = []
+    for fg in obj.faceGroups:
+        if not groupFilter(fg):
+            continue
+        for face in fg.faces:
+            verts = [v.idx for v in face.verts]
+            faceVerts.extend(verts + verts[:1] * (4 - len(verts)))
+            if exportUvs:
+                uvs = list(face.uv)
+                faceUvs.extend(uvs + uvs[:1] * (4 - len(uvs)))
+
+    if obj.coords is not None:
+        coords, normals = obj.coords, obj.normals
+    else:
+        coords, normals = [v.co for v in obj.verts], [v.no for v in obj.verts]
+
+    if numpy:
+        faceVerts = numpy.array(faceVerts, numpy.int64).reshape(-1, 4)
+        if exportUvs:
+            faceUvs = numpy.array(faceUvs, numpy.int64).reshape(-1, 4)
+            keys = faceVerts * len(obj.uvValues) + faceUvs
+        else:
+            keys = faceVerts
+
+        # Each distinct (vertex, uv) pair becomes a ply vertex
+        keys, indices = numpy.unique(keys, return_inverse=True)
+        indices = indices.reshape(-1, 4)
+        quads = faceVerts[:,0] != faceVerts[:,3]
+        triangles = numpy.vstack((indices[:,:3], indices[quads][:,[0, 2, 3]])).ravel()
+
+        if exportUvs:
+            vertIndices, uvIndices = numpy.divmod(keys, len(obj.uvValues))
+            uvs = numpy.asarray(obj.uvValues)[uvIndices]
+        else:
+            vertIndices, uvs = keys, None
+        coords = numpy.asarray(coords)[vertIndices]
+        normals = numpy.asarray(normals)[vertIndices]
+    else:
+        plyVerts = {}
+        triangles = array.array('I')
+        for i in xrange(0, len(faceVerts), 4):
+            indices = []
+            for j in xrange(i, i + 4):
+                key = (faceVerts[j], faceUvs[j] if exportUvs else -1)
+                if key not in plyVerts:
+                    plyVerts[key] = len(plyVerts)
+                indices.append(plyVerts[key])
+            triangles.extend(indices[:3])
+            if faceVerts[i] != faceVerts[i + 3]:
+                triangles.extend((indices[0], indices[2], indices[3]))
+
+        keys = sorted(plyVerts, key=plyVerts.get)
+        uvs = [obj.uvValues[uvIdx] for vIdx, uvIdx in keys] if exportUvs else None
+        coords = [coords[vIdx] for vIdx, uvIdx in keys]
+        normals = [normals[vIdx] for vIdx, uvIdx in keys]
+
+    writePly(filename, coords, normals, uvs, triangles)
+
+def writePly(filename, coords, normals, uvs, triangles):
+    """
+    This function writes a binary little endian PLY file. The vertex values are numpy
+    arrays or sequences of tuples, the triangles are given as a flat numpy or
+    array.array('I') array of vertex indices.
+
+    Parameters
+    ----------
+
+    filename:
+      *string*.  The filename of the file to write.
+    coords:
+      *float array*.  The coordinates of each vertex.
+    normals:
+      *float array*.  The normal of each vertex.
+    uvs:
+      *float array*.  The uv coordinate of each vertex, or None.
+    triangles:
+      *int array*.  Three vertex indices per triangle.
+    """
+
+    faceCount = len(triangles) / 3
+
+    f = open(filename, 'wb')
     f.write("ply\n")
-    f.write("format ascii 1.0\n")
+    f.write("format binary_little_endian 1.0\n")
     f.write("comment Mh2Ply; PLY exporter for MakeHuman\n")
-    f.write("element vertex 500 \n")
+    f.write("element vertex %d\n" % len(coords))
     f.write("property float x\n")
     f.write("property float y\n")
     f.write("property float z\n")
-    
-    '''
-    for vertex colors?
-    f << "property uchar red\n";
-    f << "property uchar green\n";
-    f << "property uchar blue\n";
-    '''
     f.write("property float nx\n")
     f.write("property float ny\n")
     f.write("property float nz\n")
-   
-    #f.write("property float u\n")
-    #f.write("property float v\n")
-    
-    f.write("element face ""amount faces""\n")
+    if uvs is not None:
+        f.write("property float u\n")
+        f.write("property float v\n")
+    f.write("element face %d\n" % faceCount)
     f.write("property list uchar uint vertex_indices\n")
     f.write("end_header\n")
-   
-    uvs =[u for u in obj.uvValues]
-    print uvs[24]
-    
-    for v in obj.verts:
-        # vertex
-        f.write('%f %f %f' % tuple(v.co))
-        
-        # normals
-        f.write(' %f %f %f' % tuple(v.no))
 
-        f.write('\n')
-    
-    faces = [fe for fe in obj.faces 
-             if not 'joint' in fe.group.name 
-             and not 'helper' in fe.group.name]
-    #
-    for fa in faces:
-        f.write('3 %s %s %s' % (fa.verts[0].idx, fa.verts[1].idx, fa.verts[2].idx))
-        f.write('\n')
-    
-    
+    if numpy:
+        columns = [coords, normals] if uvs is None else [coords, normals, uvs]
+        f.write(numpy.hstack([numpy.asarray(c, numpy.float32).reshape(len(coords), -1) for c in columns]).astype('<f4').tostring())
+
+        # 13 byte face records: the vertex count followed by the indices
+        faces = numpy.empty(faceCount, numpy.dtype([('count', 'u1'), ('indices', '<u4', (3,))]))
+        faces['count'] = 3
+        faces['indices'] = numpy.asarray(triangles).reshape(-1, 3)
+        f.write(faces.tostring())
+    else:
+        vertexData = array.array('f')
+        for i in xrange(len(coords)):
+            vertexData.extend(coords[i])
+            vertexData.extend(normals[i])
+            if uvs is not None:
+                vertexData.extend(uvs[i])
+        triangles = array.array('I', triangles)
+        if sys.byteorder == 'big':
+            vertexData.byteswap()
+            triangles.byteswap()
+        f.write(vertexData.tostring())
+        data = triangles.tostring()
+        f.write(''.join(['\x03' + data[i:i+12] for i in xrange(0, len(data), 12)]))
+
+    f.close()
 
 def exportObj(obj, filename):
     '''
@@ -461,7 +562,7 @@ def mitsubaGeometry(filexml, fileobj, subSurfaceData):
     '''
     # human mesh
     f.write('\n' +
-            '\t<shape type="obj">\n' + 
+            '\t<shape type="%s">\n' % os.path.splitext(fileobj)[1][1:] + 
             '\t    <string name="filename" value="%s"/>\n' % fileobj +
             '\t    %s\n' % subSurfaceData +
             '\t    <ref id="humanMat"/>\n' + # use 'instantiate' material declaration (id)
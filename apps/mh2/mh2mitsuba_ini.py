@@ -50,3 +50,6 @@ sampler = 'low'
 
 action = 'render' 
 
+# define geometry format for the human mesh: 'obj' or 'ply' (binary, faster to load)
+
+geometry = 'ply'
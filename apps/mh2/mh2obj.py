@@ -31,7 +31,9 @@ Requires:
 __docformat__ = 'restructuredtext'
 
 from os.path import basename
+import profiler
 
+@profiler.timed('export obj')
 def exportObj(obj, filename, exportGroups = True, groupFilter=None):
     """
     This function exports a mesh object in Wavefront obj format. It is assumed that obj will have at least vertices and
@@ -56,33 +58,52 @@ def exportObj(obj, filename, exportGroups = True, groupFilter=None):
     for v in obj.verts:
         f.write('v %f %f %f\n' % tuple(v.co))
 
-    if not (obj.uvValues==None):
-        for uv in obj.uvValues:
-            f.write('vt %f %f\n' % tuple(uv))
+    f.write(formatUvs(obj))
 
     for v in obj.verts:
         f.write('vn %f %f %f\n' % tuple(v.no))
 
-    f.write('usemtl basic\n')
-    f.write('s off\n')
-      
+    f.write(formatFaces(obj, exportGroups, groupFilter))
+    f.close()
+
+    # Write material file
+
+    exportMtl(obj, filename + '.mtl')
+
+def formatUvs(obj):
+    """
+    Returns the texture coordinate lines of an obj file.
+    """
+
+    if obj.uvValues == None:
+        return ''
+    return ''.join(['vt %f %f\n' % tuple(uv) for uv in obj.uvValues])
+
+def formatFaces(obj, exportGroups = True, groupFilter=None):
+    """
+    Returns the material, group and face lines of an obj file. These only depend
+    on the topology, so they can be shared by the frames of an animation.
+    """
+
+    lines = ['usemtl basic\n', 's off\n']
     for fg in obj.faceGroups:
         if not groupFilter or groupFilter(fg):
             if exportGroups:
-                f.write('g %s\n' % fg.name)
+                lines.append('g %s\n' % fg.name)
             for face in fg.faces:
-                f.write('f')
+                line = ['f']
                 for i, v in enumerate(face.verts):
                     if (obj.uvValues == None):
-                        f.write(' %i//%i' % (v.idx + 1, v.idx + 1))
+                        line.append(' %i//%i' % (v.idx + 1, v.idx + 1))
                     else:
-                        f.write(' %i/%i/%i' % (v.idx + 1, face.uv[i] + 1, v.idx + 1))
-                f.write('\n')
-    f.close()
+                        line.append(' %i/%i/%i' % (v.idx + 1, face.uv[i] + 1, v.idx + 1))
+                line.append('\n')
+                lines.append(''.join(line))
+    return ''.join(lines)
 
-    # Write material file
+def exportMtl(obj, filename):
 
-    f = open(filename + '.mtl', 'w')
+    f = open(filename, 'w')
     f.write('# MakeHuman exported MTL\n')
     f.write('# www.makehuman.org\n')
     f.write('newmtl basic\n')
@@ -24,11 +24,13 @@ import export_config
 import mh2proxy
 import mh2collada
 import mhx_globals as the
+import profiler
 
 #
 #    exportProxyObj(human, filename):    
 #
 
+@profiler.timed('export obj proxies')
 def exportProxyObj(human, name, options):
     obj = human.meshData
     the.Config = export_config.exportConfig(human, True)
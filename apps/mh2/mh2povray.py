@@ -42,7 +42,7 @@ prefix so that you end up with your own unique prefix.
 import os
 import string
 import shutil
-import subprocess
+import renderqueue
 import mh2povray_ini
 import random
 import mh
@@ -141,15 +141,16 @@ def povrayExport(obj, app, settings):
             else:
                 baseName = mh2povray_ini.renderscenefile
             #
-            cmdLineOpt = ' +I%s' %  baseName
+            cmdLineOpt = ['+I%s' %  baseName]
             #
             if os.name == 'nt':
-                cmdLineOpt = ' /RENDER %s' % baseName
+                cmdLineOpt = ['/RENDER', baseName]
             #
-            cmdLineOpt += ' +W%d +H%d' % resolution
+            cmdLineOpt += ['+W%d' % resolution[0], '+H%d' % resolution[1]]
         
             #
-            pathHandle = subprocess.Popen(cwd=outputDirectory, args = povray_bin + cmdLineOpt, shell=True)
+            renderqueue.getRenderQueue(app).submit(renderqueue.RenderJob([povray_bin] + cmdLineOpt, cwd=outputDirectory,
+                name=baseName, progressParser=renderqueue.parsePercentProgress))
         #
         else:
             app.prompt('POV-Ray not found',
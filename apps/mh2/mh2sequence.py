@@ -0,0 +1,201 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Export an animation as a sequence of frames.
+
+**Project Name:**      MakeHuman
+
+**Product Home Page:** http://www.makehuman.org/
+
+**Code Home Page:**    http://code.google.com/p/makehuman/
+
+**Authors:**           MakeHuman Team
+
+**Copyright(c):**      MakeHuman Team 2001-2012
+
+**Licensing:**         GPL3 (see also http://sites.google.com/site/makehumandocs/licensing)
+
+**Coding Standards:**  See http://sites.google.com/site/makehumandocs/developers-guide
+
+Abstract
+--------
+
+This module exports the frames of a skinned animation, either as a Wavefront obj file
+per frame, or as an obj file with the rest pose and a point cache holding only the
+vertex positions of each frame.
+
+The point cache uses the PC2 format: a 32 byte header followed by the positions of all
+vertices of each frame, as little endian 32 bit floats.
+
+The frames are posed and written by a pool of worker threads. The caller passes the
+skinning matrices of each frame, see skinning.SkinWeights, and only a few frames are
+held in memory at any time.
+"""
+
+import os
+import struct
+import threading
+import Queue
+
+import mh2obj
+import profiler
+
+OBJ, PC2 = 'obj', 'pc2'
+
+class SequenceExporter:
+
+    """
+    Writes the frames of a skinned mesh.
+
+    :param obj: The mesh, its topology and uv coordinates are written once.
+    :type obj: :py:class:`module3d.Object3D`
+    :param skinWeights: The skinning weights of the mesh.
+    :type skinWeights: :py:class:`skinning.SkinWeights`
+    :param coords: The rest coordinates.
+    :type coords: numpy.ndarray of shape (verts, 3)
+    :param normals: The rest normals.
+    :type normals: numpy.ndarray of shape (verts, 3)
+    :param workers: The amount of worker threads.
+    :type workers: int
+    :param mode: The skinning mode, see skinning.SkinWeights.skin.
+    :type mode: int
+    """
+
+    def __init__(self, obj, skinWeights, coords, normals, workers=4, mode=0, groupFilter=None):
+
+        self.obj = obj
+        self.skinWeights = skinWeights
+        self.coords = coords
+        self.normals = normals
+        self.workers = max(1, workers)
+        self.mode = mode
+        self.groupFilter = groupFilter
+
+    @profiler.timed('export sequence')
+    def export(self, path, name, frames, format=OBJ, progressCallback=None):
+        """
+        Exports the frames.
+
+        :param path: The folder to write to.
+        :type path: str
+        :param name: The base name of the files.
+        :type name: str
+        :param frames: The skinning matrices of each frame.
+        :type frames: iterable of numpy.ndarray of shape (bones, 4, 4)
+        :param format: OBJ to write an obj file per frame, PC2 for a point cache.
+        :type format: str
+        :param progressCallback: Called from the calling thread with the amount of frames written.
+        :type progressCallback: function
+        :return: The paths of the written files.
+        :rtype: [str, ..]
+        """
+
+        self.__path = path
+        self.__name = name
+        self.__format = format
+        self.__written = 0
+        self.__lock = threading.Lock()
+        self.__error = None
+
+        # The parts of an obj file which do not depend on the pose
+        self.__mtllib = 'mtllib %s.mtl\n' % name
+        self.__uvs = mh2obj.formatUvs(self.obj)
+        self.__faces = mh2obj.formatFaces(self.obj, True, self.groupFilter)
+        mh2obj.exportMtl(self.obj, os.path.join(path, name + '.mtl'))
+
+        if format == PC2:
+            # The topology, in the rest pose, and the cache with the positions of each frame
+            filenames = [self.__writeObj(os.path.join(path, name + '.obj'), self.coords, self.normals),
+                os.path.join(path, name + '.pc2')]
+            self.__cache = open(filenames[1], 'wb')
+            self.__cache.write(struct.pack('<12siiffi', 'POINTCACHE2\0', 1, len(self.coords), 0.0, 1.0, 0))
+            self.__pending = {}
+            self.__nextFrame = 0
+        else:
+            filenames = []
+
+        queue = Queue.Queue(self.workers * 2)
+        threads = [threading.Thread(target=self.__work, args=(queue,)) for i in xrange(self.workers)]
+        for thread in threads:
+            thread.start()
+
+        count = 0
+        try:
+            for index, matrices in enumerate(frames):
+                if self.__error:
+                    break
+                queue.put((index, matrices))
+                if format == OBJ:
+                    filenames.append(self.__getFrameFilename(index))
+                count += 1
+                if progressCallback:
+                    progressCallback(self.__written)
+        finally:
+            for thread in threads:
+                queue.put(None)
+            for thread in threads:
+                thread.join()
+
+        if progressCallback:
+            progressCallback(self.__written)
+
+        if format == PC2:
+            # Now that the amount of frames is known, complete the header
+            self.__cache.seek(28)
+            self.__cache.write(struct.pack('<i', count))
+            self.__cache.close()
+
+        if self.__error:
+            raise self.__error
+
+        return filenames
+
+    def __work(self, queue):
+
+        while True:
+            item = queue.get()
+            if item is None:
+                break
+            if self.__error:
+                continue
+            index, matrices = item
+            try:
+                if self.__format == PC2:
+                    coords = self.skinWeights.skin(self.coords, matrices, None, self.mode)
+                    self.__writeCacheFrame(index, coords)
+                else:
+                    coords, normals = self.skinWeights.skin(self.coords, matrices, self.normals, self.mode)
+                    self.__writeObj(self.__getFrameFilename(index), coords, normals)
+            except Exception, e:
+                self.__error = e
+                continue
+            with self.__lock:
+                self.__written += 1
+
+    def __getFrameFilename(self, index):
+
+        return os.path.join(self.__path, '%s_%04d.obj' % (self.__name, index))
+
+    def __writeObj(self, filename, coords, normals):
+
+        f = open(filename, 'w')
+        f.write('# MakeHuman exported OBJ\n')
+        f.write('# www.makehuman.org\n')
+        f.write(self.__mtllib)
+        f.write(''.join(['v %f %f %f\n' % tuple(co) for co in coords.tolist()]))
+        f.write(self.__uvs)
+        f.write(''.join(['vn %f %f %f\n' % tuple(no) for no in normals.tolist()]))
+        f.write(self.__faces)
+        f.close()
+        return filename
+
+    def __writeCacheFrame(self, index, coords):
+
+        # Frames finish in any order but are appended to the cache in sequence
+        data = coords.astype('<f4').tostring()
+        with self.__lock:
+            self.__pending[index] = data
+            while self.__nextFrame in self.__pending:
+                self.__cache.write(self.__pending.pop(self.__nextFrame))
+                self.__nextFrame += 1
@@ -3,7 +3,9 @@
 
 from os.path import basename
 from skeleton import Skeleton
+import profiler
 
+@profiler.timed('export skel')
 def exportSkel(obj, filename):
 
     skeleton = Skeleton()
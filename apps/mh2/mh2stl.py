@@ -33,7 +33,9 @@ Requires:
 __docformat__ = 'restructuredtext'
 
 import struct
+import profiler
 
+@profiler.timed('export stl')
 def exportStlAscii(obj, filename, exportJoints = False):
     """
     This function exports MakeHuman mesh and skeleton data to stereolithography ascii format. 
@@ -69,6 +71,7 @@ def exportStlAscii(obj, filename, exportJoints = False):
         f.write('\tendfacet\n')
     f.write('endsolid human\n')
     
+@profiler.timed('export stl')
 def exportStlBinary(obj, filename, exportJoints = False):
     """
     This function exports MakeHuman mesh and skeleton data to stereolithography ascii format. 
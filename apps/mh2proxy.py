@@ -27,6 +27,7 @@ from aljabr import *
 import export_config
 import mhx_globals as the
 import read_rig, mhx_rig, mhx_main
+import profiler
 
 #
 #    class CProxy
@@ -86,6 +87,7 @@ class CProxy:
         self.clothings = []
         return
         
+    @profiler.timed('CProxy.update')
     def update(self, mesh, parent):
         rlen = len(self.refVerts)
         mlen = len(mesh.verts)
@@ -0,0 +1,243 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Index of the metadata of saved models.
+
+**Project Name:**      MakeHuman
+
+**Product Home Page:** http://www.makehuman.org/
+
+**Code Home Page:**    http://code.google.com/p/makehuman/
+
+**Authors:**           MakeHuman Team
+
+**Copyright(c):**      MakeHuman Team 2001-2012
+
+**Licensing:**         GPL3 (see also http://sites.google.com/site/makehumandocs/licensing)
+
+**Coding Standards:**  See http://sites.google.com/site/makehumandocs/developers-guide
+
+Abstract
+--------
+
+The Load task sorts models on their macro values, which are stored in the .mhm files.
+This module keeps the macro values, the tags, a summary of the other modifiers and the
+thumbnail of each model in models.json in the user's home folder, so that a model file
+is only read again when its modification time or size changed.
+
+Besides sorting, the index filters models on ranges of values, for example the models
+with an age between 0.25 and 0.5.
+"""
+
+import os
+import json
+import threading
+
+import mh
+
+indexVersion = 1
+
+macroFields = ['gender', 'age', 'muscle', 'weight', 'african', 'asian', 'height']
+
+defaultValues = {
+    'gender': 0.5,
+    'age': 0.5,
+    'muscle': 0.5,
+    'weight': 0.5,
+    'african': 0.0,
+    'asian': 0.0,
+    'height': 0.0
+}
+
+def readModelMeta(filename, previewExtension='bmp'):
+    """
+    Reads the metadata of a .mhm file.
+
+    :return: The macro values, the tags, the amount of each other kind of modifier
+        line and the path of the thumbnail, or None if there is no thumbnail.
+    :rtype: dict
+    """
+
+    meta = dict(defaultValues)
+    meta['tags'] = []
+    meta['modifiers'] = {}
+
+    f = open(filename, 'rU')
+    for line in f:
+        lineData = line.split()
+        if not lineData or lineData[0].startswith('#'):
+            continue
+        field = lineData[0]
+        if field in macroFields:
+            try:
+                meta[field] = float(lineData[1])
+            except (IndexError, ValueError):
+                pass
+        elif field == 'tags':
+            meta['tags'] = lineData[1:]
+        elif field != 'version':
+            meta['modifiers'][field] = meta['modifiers'].get(field, 0) + 1
+    f.close()
+
+    thumbnail = os.path.splitext(filename)[0] + '.' + previewExtension
+    meta['thumbnail'] = thumbnail if os.path.isfile(thumbnail) else None
+
+    return meta
+
+class ModelIndex:
+
+    """
+    The metadata of .mhm files, kept up to date with the files on disk.
+
+    :param path: The path of the index file.
+    :type path: str
+    """
+
+    def __init__(self, path):
+
+        self.path = path
+        self.entries = {}
+        self.modified = False
+        self.lock = threading.RLock()
+        self.load()
+
+    def load(self):
+
+        self.entries = {}
+        if not os.path.isfile(self.path):
+            return
+        try:
+            f = open(self.path, 'r')
+            try:
+                data = json.load(f)
+            finally:
+                f.close()
+            if data.get('version') == indexVersion:
+                self.entries = data['models']
+        except (ValueError, AttributeError, KeyError, IOError):
+            print('Ignoring corrupt model index %s' % self.path)
+            self.entries = {}
+
+    def save(self):
+        """
+        Writes the index if entries were changed since it was loaded or saved.
+        """
+
+        if not self.modified:
+            return
+        f = open(self.path, 'w')
+        json.dump({'version': indexVersion, 'models': self.entries}, f, indent=1, sort_keys=True)
+        f.close()
+        self.modified = False
+
+    def update(self, filenames):
+        """
+        Reads the files which are new or changed since they were indexed, forgets
+        files which no longer exist and saves the index if anything changed.
+
+        :param filenames: The files to index.
+        :type filenames: [str, ..]
+        """
+
+        with self.lock:
+            self.__update(filenames)
+
+    def updateFolder(self, path):
+        """
+        Indexes the .mhm files below a folder, named the way the Load task lists them.
+        """
+
+        filenames = []
+        for root, dirs, files in os.walk(path):
+            filenames.extend([os.path.join(root, f) for f in files if f.lower().endswith('.mhm')])
+        self.update(filenames)
+
+    def __update(self, filenames):
+
+        for filename in filenames:
+            try:
+                stat = os.stat(filename)
+            except OSError:
+                continue
+            entry = self.entries.get(filename)
+            if entry and entry['modified'] == stat.st_mtime and entry['size'] == stat.st_size:
+                continue
+            try:
+                meta = readModelMeta(filename)
+            except IOError, e:
+                print('Could not index %s: %s' % (filename, e))
+                continue
+            meta['modified'] = stat.st_mtime
+            meta['size'] = stat.st_size
+            self.entries[filename] = meta
+            self.modified = True
+
+        known = set(filenames)
+        for filename in self.entries.keys():
+            if filename not in known and not os.path.exists(filename):
+                del self.entries[filename]
+                self.modified = True
+
+        self.save()
+
+    def getMeta(self, filename):
+
+        return self.entries.get(filename)
+
+    def getValue(self, filename, field):
+
+        entry = self.entries.get(filename)
+        if entry is None:
+            return defaultValues.get(field, 0.0)
+        return entry.get(field, defaultValues.get(field, 0.0))
+
+    def sort(self, field, filenames):
+        """
+        Returns the files sorted on a macro value, files with equal values keep their order.
+        """
+
+        self.update(filenames)
+        decorated = [(self.getValue(filename, field), i, filename) for i, filename in enumerate(filenames)]
+        decorated.sort()
+        return [filename for value, i, filename in decorated]
+
+    def filter(self, filenames, ranges=None, tags=None):
+        """
+        Returns the files whose values lie within the given ranges and which have all
+        of the given tags.
+
+        :param ranges: The inclusive minimum and maximum of each field, either may be None.
+        :type ranges: dict of str to (float, float)
+        :param tags: The tags the models need to have.
+        :type tags: [str, ..]
+        """
+
+        self.update(filenames)
+        result = []
+        for filename in filenames:
+            accepted = True
+            for field, (minimum, maximum) in (ranges or {}).iteritems():
+                value = self.getValue(filename, field)
+                if (minimum is not None and value < minimum) or (maximum is not None and value > maximum):
+                    accepted = False
+                    break
+            if accepted and tags:
+                modelTags = (self.entries.get(filename) or {}).get('tags', [])
+                accepted = not [tag for tag in tags if tag not in modelTags]
+            if accepted:
+                result.append(filename)
+        return result
+
+modelIndex = None
+
+def getModelIndex():
+    """
+    Returns the application wide model index, stored in the user's home folder.
+    """
+
+    global modelIndex
+
+    if not modelIndex:
+        modelIndex = ModelIndex(os.path.join(mh.getPath(''), 'models.json'))
+    return modelIndex
@@ -0,0 +1,202 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Startup timing and background preloading.
+
+**Project Name:**      MakeHuman
+
+**Product Home Page:** http://www.makehuman.org/
+
+**Code Home Page:**    http://code.google.com/p/makehuman/
+
+**Authors:**           MakeHuman Team
+
+**Copyright(c):**      MakeHuman Team 2001-2012
+
+**Licensing:**         GPL3 (see also http://sites.google.com/site/makehumandocs/licensing)
+
+**Coding Standards:**  See http://sites.google.com/site/makehumandocs/developers-guide
+
+Abstract
+--------
+
+The application starts in a chain of steps, each scheduled with mh.callAsync so the
+splash screen keeps updating. StartupLog records the wall time of each step and of
+each plugin, and writes them to startup.log in the user's home folder when the
+application is ready.
+
+Preloader runs jobs on worker threads while the main thread builds the GUI: parsing
+the targets the first applyAllTargets needs into algos3d.targetBuffer and updating
+the target and model indexes. A target which the main thread loaded first is never
+replaced, so a job only saves time and never changes what the main thread sees.
+"""
+
+import os
+import time
+import threading
+import Queue
+from operator import mul
+
+import mh
+import algos3d
+
+class StartupLog:
+
+    """
+    The wall times of the startup phases, plugins and preload jobs.
+    """
+
+    def __init__(self):
+
+        self.started = time.time()
+        self.phases = []
+        self.plugins = []
+        self.preloads = []
+        self.__phase = None
+        self.__lock = threading.Lock()
+
+    def beginPhase(self, name):
+        """
+        Ends the current phase, if any, and starts the next one.
+        """
+
+        self.endPhase()
+        self.__phase = (name, time.time())
+
+    def endPhase(self):
+
+        if self.__phase:
+            name, started = self.__phase
+            self.phases.append((name, time.time() - started))
+            self.__phase = None
+
+    def addPlugin(self, name, seconds):
+
+        self.plugins.append((name, seconds))
+
+    def addPreload(self, name, seconds):
+
+        # Called from the worker threads
+        with self.__lock:
+            self.preloads.append((name, seconds))
+
+    def write(self, path=None):
+        """
+        Writes the report, by default to startup.log in the user's home folder.
+        """
+
+        self.endPhase()
+        total = time.time() - self.started
+
+        if path is None:
+            path = os.path.join(mh.getPath(''), 'startup.log')
+
+        with self.__lock:
+            preloads = list(self.preloads)
+
+        f = open(path, 'w')
+        f.write('# MakeHuman startup, %s\n' % time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.started)))
+        f.write('total %.3f\n' % total)
+        f.write('\n# phases\n')
+        for name, seconds in self.phases:
+            f.write('%-40s %8.3f\n' % (name, seconds))
+        f.write('\n# plugins, slowest first\n')
+        for name, seconds in sorted(self.plugins, key=lambda plugin: -plugin[1]):
+            f.write('%-40s %8.3f\n' % (name, seconds))
+        f.write('\n# preloaded on worker threads\n')
+        for name, seconds in preloads:
+            f.write('%-40s %8.3f\n' % (name, seconds))
+        f.close()
+
+        print('Started in %.3f seconds, see %s' % (total, path))
+
+class Preloader:
+
+    """
+    Runs jobs on a few daemon threads.
+
+    :param workers: The amount of threads, 0 runs no jobs at all.
+    :type workers: int
+    :param log: The log to record the time of each job in.
+    :type log: :py:class:`startup.StartupLog`
+    """
+
+    def __init__(self, workers=2, log=None):
+
+        self.workers = workers
+        self.log = log
+        self.queue = Queue.Queue()
+        self.pending = set()
+        self.condition = threading.Condition()
+        self.threads = []
+
+    def add(self, name, function, *args):
+        """
+        Queues a job, jobs start in the order they were added. The threads stop
+        when the queue is empty, so jobs are added before start is called.
+        """
+
+        if not self.workers:
+            return
+        with self.condition:
+            self.pending.add(name)
+        self.queue.put((name, function, args))
+
+    def start(self):
+
+        for i in xrange(self.workers):
+            thread = threading.Thread(target=self.__work)
+            thread.setDaemon(True)
+            thread.start()
+            self.threads.append(thread)
+
+    def wait(self, names=None):
+        """
+        Waits until the given jobs, or all jobs, are done.
+        """
+
+        with self.condition:
+            while self.pending if names is None else self.pending.intersection(names):
+                self.condition.wait()
+
+    def __work(self):
+
+        while True:
+            try:
+                name, function, args = self.queue.get_nowait()
+            except Queue.Empty:
+                break
+            started = time.time()
+            try:
+                function(*args)
+            except Exception, e:
+                print('Could not preload %s: %s' % (name, e))
+            if self.log:
+                self.log.addPreload(name, time.time() - started)
+            with self.condition:
+                self.pending.discard(name)
+                self.condition.notifyAll()
+
+def getMacroTargets(human):
+    """
+    Returns the paths of the macro targets the current macro values of the human
+    give a weight, which are the targets applyAllTargets applies.
+    """
+
+    paths = []
+    for modifier in (human.muscleWeightModifier, human.baseModifier):
+        factors = modifier.getFactors(human, 1.0)
+        for target in modifier.targets:
+            if reduce(mul, [factors[factor] for factor in target[1]]):
+                paths.append(target[0])
+    return paths
+
+def preloadTarget(obj, targetPath):
+    """
+    Parses a target into algos3d.targetBuffer unless it is already loaded.
+    """
+
+    if targetPath in algos3d.targetBuffer or not os.path.isfile(targetPath):
+        return
+    algos3d.targetBuffer.setdefault(targetPath, algos3d.Target(obj, targetPath))
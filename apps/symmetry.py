@@ -0,0 +1,205 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Mirroring and smoothing of mesh coordinates.
+
+**Project Name:**      MakeHuman
+
+**Product Home Page:** http://www.makehuman.org/
+
+**Code Home Page:**    http://code.google.com/p/makehuman/
+
+**Authors:**           MakeHuman Team
+
+**Copyright(c):**      MakeHuman Team 2001-2012
+
+**Licensing:**         GPL3 (see also http://sites.google.com/site/makehumandocs/licensing)
+
+**Coding Standards:**  See http://sites.google.com/site/makehumandocs/developers-guide
+
+Abstract
+--------
+
+The base mesh is symmetrical in the yz plane. The mirror map holds for each vertex the
+index of the vertex at its mirrored position, vertices on the plane map to themselves.
+It is computed once per topology from the rest coordinates, so it also covers the
+helper geometry which is not listed in utils/maketarget/base.sym.
+
+With the map, the coordinates of any subset of vertices can be replaced by the mirrored
+coordinates of their counterparts in one array operation, which makes one side of a
+sculpted mesh equal to the other whatever changed it, targets or not.
+
+The smoothing operator moves each vertex towards the average of the vertices it shares
+an edge with (the uniform Laplacian), using the adjacency tables of the mesh.
+"""
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+mirrorMaps = {}  # topology -> array of mirrored vertex indices
+
+def getMirrorMap(obj, tolerance=1e-3):
+    """
+    Returns the index of the mirrored vertex of each vertex of the object.
+
+    :param obj: The object, its rest coordinates are used if it has a shared topology.
+    :type obj: :py:class:`module3d.Object3D`
+    :param tolerance: The maximum distance between a mirrored vertex and its counterpart.
+    :type tolerance: float
+    :return: The mirror map, vertices without counterpart map to themselves.
+    :rtype: numpy.ndarray of int32
+    """
+
+    if not numpy:
+        raise RuntimeError('Mirroring requires numpy')
+
+    key = obj.topology or obj
+    mirror = mirrorMaps.get(key)
+    if mirror is None:
+        mirror = buildMirrorMap(getRestCoords(obj), tolerance)
+        mirrorMaps[key] = mirror
+    return mirror
+
+def getRestCoords(obj):
+    """
+    Returns the coordinates in the mesh file of an object with a shared topology, or
+    the current coordinates of other objects.
+    """
+
+    # Imported here, the offline tools use this module without the application modules
+    import files3d
+
+    coords = files3d.getSharedCoords(obj)
+    if coords is None:
+        coords = [v.co for v in obj.verts]
+    return coords
+
+def buildMirrorMap(coords, tolerance=1e-3):
+    """
+    Matches each vertex with the nearest vertex to its mirrored position within the
+    tolerance, looking only in the neighbouring cells of a grid of the tolerance size.
+    """
+
+    grid = {}
+    for i, (x, y, z) in enumerate(coords):
+        cell = (int(round(x / tolerance)), int(round(y / tolerance)), int(round(z / tolerance)))
+        grid.setdefault(cell, []).append(i)
+
+    offsets = [(dx, dy, dz) for dx in (-1, 0, 1) for dy in (-1, 0, 1) for dz in (-1, 0, 1)]
+    mirror = numpy.arange(len(coords), dtype=numpy.int32)
+    for i, (x, y, z) in enumerate(coords):
+        cx, cy, cz = int(round(-x / tolerance)), int(round(y / tolerance)), int(round(z / tolerance))
+        best = tolerance * tolerance
+        for dx, dy, dz in offsets:
+            for j in grid.get((cx + dx, cy + dy, cz + dz), ()):
+                mx, my, mz = coords[j]
+                d = (mx + x) ** 2 + (my - y) ** 2 + (mz - z) ** 2
+                if d <= best:
+                    best = d
+                    mirror[i] = j
+    return mirror
+
+def getSideVerts(obj, side):
+    """
+    Returns the indices of the vertices on one side of the object in its rest pose.
+
+    :param side: 'r' for the side of the r- targets, positive x, 'l' for the other side.
+    :type side: str
+    :rtype: numpy.ndarray of int32
+    """
+
+    mirror = getMirrorMap(obj)
+    x = numpy.array([co[0] for co in getRestCoords(obj)])
+    if side == 'l':
+        return numpy.flatnonzero((x < 0.0) & (mirror != numpy.arange(len(mirror)))).astype(numpy.int32)
+    return numpy.flatnonzero((x > 0.0) & (mirror != numpy.arange(len(mirror)))).astype(numpy.int32)
+
+def mirrorCoords(coords, mirror, indices=None):
+    """
+    Replaces the coordinates of the given vertices by the mirrored coordinates of
+    their counterparts. Vertices which are their own counterpart are moved onto the
+    mirror plane.
+
+    :param coords: The coordinates.
+    :type coords: numpy.ndarray of shape (verts, 3)
+    :param mirror: The mirror map, see getMirrorMap.
+    :type mirror: numpy.ndarray of int32
+    :param indices: The vertices to replace, all if None.
+    :type indices: numpy.ndarray of int
+    :return: The new coordinates.
+    :rtype: numpy.ndarray of shape (verts, 3)
+    """
+
+    coords = numpy.array(coords, dtype=numpy.float64)
+    if indices is None:
+        indices = numpy.arange(len(coords))
+    indices = numpy.asarray(indices)
+    coords[indices] = coords[mirror[indices]] * [-1.0, 1.0, 1.0]
+    return coords
+
+def symmetrizeCoords(coords, obj, side='r'):
+    """
+    Makes the coordinates symmetrical by mirroring the given side onto the other side.
+
+    :param coords: The coordinates.
+    :type coords: numpy.ndarray of shape (verts, 3)
+    :param obj: The object the coordinates belong to.
+    :type obj: :py:class:`module3d.Object3D`
+    :param side: The side to keep, 'r' or 'l'.
+    :type side: str
+    :rtype: numpy.ndarray of shape (verts, 3)
+    """
+
+    mirror = getMirrorMap(obj)
+    indices = getSideVerts(obj, 'l' if side == 'r' else 'r')
+    coords = mirrorCoords(coords, mirror, indices)
+    centers = numpy.flatnonzero(mirror == numpy.arange(len(mirror)))
+    coords[centers, 0] = 0.0
+    return coords
+
+def smoothCoords(coords, adjacency, indices=None, factor=0.5, iterations=1):
+    """
+    Moves vertices towards the average of their edge neighbours.
+
+    :param coords: The coordinates.
+    :type coords: numpy.ndarray of shape (verts, 3)
+    :param adjacency: The adjacency tables of the mesh.
+    :type adjacency: :py:class:`adjacency.Adjacency`
+    :param indices: The vertices to move, all if None. The other vertices keep their position.
+    :type indices: numpy.ndarray of int
+    :param factor: How far to move towards the average, between 0 and 1.
+    :type factor: float
+    :param iterations: The amount of smoothing steps.
+    :type iterations: int
+    :rtype: numpy.ndarray of shape (verts, 3)
+    """
+
+    if not numpy:
+        raise RuntimeError('Smoothing requires numpy')
+
+    coords = numpy.array(coords, dtype=numpy.float64)
+    offsets = numpy.asarray(adjacency.vertVertOffsets)
+    neighbours = numpy.asarray(adjacency.vertVertIndices)
+    counts = numpy.diff(offsets)
+
+    # Row of each neighbour entry, so sums can be accumulated with bincount
+    rows = numpy.repeat(numpy.arange(len(counts)), counts)
+    connected = counts > 0
+    if indices is None:
+        moving = connected
+    else:
+        moving = numpy.zeros(len(coords), dtype=bool)
+        moving[indices] = True
+        moving &= connected
+
+    for i in xrange(iterations):
+        average = numpy.empty_like(coords)
+        for axis in xrange(3):
+            average[:, axis] = numpy.bincount(rows, coords[neighbours, axis], len(coords))
+        average[connected] /= counts[connected][:, numpy.newaxis]
+        coords[moving] += factor * (average[moving] - coords[moving])
+
+    return coords
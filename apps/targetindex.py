@@ -0,0 +1,241 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Index of the vertices and faces affected by each target.
+
+**Project Name:**      MakeHuman
+
+**Product Home Page:** http://www.makehuman.org/
+
+**Code Home Page:**    http://code.google.com/p/makehuman/
+
+**Authors:**           MakeHuman Team
+
+**Copyright(c):**      MakeHuman Team 2001-2012
+
+**Licensing:**         GPL3 (see also http://sites.google.com/site/makehumandocs/licensing)
+
+**Coding Standards:**  See http://sites.google.com/site/makehumandocs/developers-guide
+
+Abstract
+--------
+
+Modifiers need to know which vertices and faces their targets touch, so that only
+those are updated while a slider is dragged. Loading every target of a modifier
+to find out is expensive, as a modifier like the macro modifiers expands its
+template to dozens of targets.
+
+This module keeps the affected vertex indices of each target file, read from the
+first column of the file without parsing the offsets. The face indices are derived
+from the vertices once per target, and the union over all targets of a modifier is
+kept as well, until one of those targets is rescanned. The vertex indices are
+stored in a file in the user's home folder, so that later sessions only rescan
+targets whose file changed.
+
+The index is built on a worker thread at startup while the main thread may already
+look up regions, so the tables are only used while holding the module lock.
+"""
+
+import os
+import array
+import marshal
+import threading
+
+import mh
+import algos3d
+
+indexVersion = 1
+
+targetVerts = {}  # target path -> (mtime, size, array of vertex indices)
+targetFaces = {}  # target path -> tuple of face indices
+regions = {}      # key -> (tuple of target paths, tuple of vertex indices, tuple of face indices)
+modified = False
+
+lock = threading.RLock()
+
+def getIndexPath():
+
+    return os.path.join(mh.getPath(''), 'targets.idx')
+
+def load(path=None):
+    """
+    Loads the stored vertex indices. Entries of targets whose file changed since are
+    dropped when they are looked up.
+    """
+
+    global targetVerts, modified
+
+    with lock:
+        path = path or getIndexPath()
+        if not os.path.isfile(path):
+            return
+
+        try:
+            f = open(path, 'rb')
+            try:
+                version, entries = marshal.load(f)
+            finally:
+                f.close()
+            if version != indexVersion:
+                return
+            for targetPath, (mtime, size, data) in entries.iteritems():
+                verts = array.array('i')
+                verts.fromstring(data)
+                targetVerts[targetPath] = (mtime, size, verts)
+        except (EOFError, ValueError, TypeError, IOError):
+            print('Ignoring corrupt target index %s' % path)
+            targetVerts = {}
+
+        modified = False
+
+def save(path=None):
+    """
+    Stores the vertex indices if targets were scanned since the index was loaded.
+    """
+
+    global modified
+
+    with lock:
+        if not modified:
+            return
+
+        path = path or getIndexPath()
+        entries = dict([(targetPath, (mtime, size, verts.tostring()))
+            for targetPath, (mtime, size, verts) in targetVerts.items()])
+        f = open(path, 'wb')
+        marshal.dump((indexVersion, entries), f, 2)
+        f.close()
+
+        modified = False
+
+def scanTarget(targetPath):
+    """
+    Returns the vertex indices in the first column of a target file.
+    """
+
+    verts = array.array('i')
+    f = open(targetPath, 'r')
+    for line in f:
+        translationData = line.split(None, 1)
+        if translationData and not translationData[0].startswith('#'):
+            vertIndex = int(translationData[0])
+            if vertIndex < algos3d.NMHVerts:
+                verts.append(vertIndex)
+    f.close()
+    return verts
+
+def getTargetVerts(obj, targetPath):
+    """
+    Returns the indices of the vertices moved by a target, rescanning the target
+    if its file changed.
+
+    :param obj: The base object.
+    :type obj: :py:class:`module3d.Object3D`
+    :param targetPath: The path of the target file.
+    :type targetPath: str
+    :return: The vertex indices.
+    :rtype: array of int
+    """
+
+    global modified
+
+    try:
+        stat = os.stat(targetPath)
+    except OSError:
+        # Missing targets are replaced by another one when loaded, see algos3d.Target
+        return array.array('i', algos3d.getTarget(obj, targetPath).verts)
+
+    with lock:
+        entry = targetVerts.get(targetPath)
+        if entry and entry[0] == stat.st_mtime and entry[1] == stat.st_size:
+            return entry[2]
+
+        verts = scanTarget(targetPath)
+        targetVerts[targetPath] = (stat.st_mtime, stat.st_size, verts)
+        targetFaces.pop(targetPath, None)
+        for key, region in regions.items():
+            if targetPath in region[0]:
+                regions.pop(key, None)
+        modified = True
+
+        return verts
+
+def getTargetFaces(obj, targetPath):
+    """
+    Returns the indices of the faces sharing a vertex moved by a target.
+    """
+
+    with lock:
+        faces = targetFaces.get(targetPath)
+        if faces is None:
+            faces = tuple(obj.getAdjacency().getFacesOfVerts(getTargetVerts(obj, targetPath)))
+            targetFaces[targetPath] = faces
+        return faces
+
+def getRegion(obj, targetPaths, key=None):
+    """
+    Returns the vertex and face indices affected by any of the given targets.
+    The union is kept, so modifiers expanding to the same targets share it, and
+    built again when the file of one of the targets changed.
+
+    :param obj: The base object.
+    :type obj: :py:class:`module3d.Object3D`
+    :param targetPaths: The paths of the target files.
+    :type targetPaths: [str, ..]
+    :param key: The key to keep the result under, the sorted paths if None.
+    :type key: str
+    :return: The vertex and face indices.
+    :rtype: ((int, ..), (int, ..))
+    """
+
+    if key is None:
+        key = tuple(sorted(targetPaths))
+
+    with lock:
+        region = regions.get(key)
+        if region is not None:
+            # Rescanning a changed target drops the regions it is part of
+            for targetPath in region[0]:
+                getTargetVerts(obj, targetPath)
+            region = regions.get(key)
+
+        if region is None:
+            verts = set()
+            faces = set()
+            for targetPath in targetPaths:
+                verts.update(getTargetVerts(obj, targetPath))
+                faces.update(getTargetFaces(obj, targetPath))
+            region = (tuple(targetPaths), tuple(verts), tuple(faces))
+            regions[key] = region
+
+        return region[1:]
+
+def build(obj, root='data/targets', progressCallback=None):
+    """
+    Indexes all targets below the given folder which are not indexed yet or changed.
+    """
+
+    targetPaths = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        # Modifiers refer to targets with forward slashes on all platforms
+        targetPaths.extend([os.path.join(dirpath, filename).replace('\\', '/') for filename in filenames
+            if filename.endswith('.target')])
+
+    for i, targetPath in enumerate(targetPaths):
+        getTargetVerts(obj, targetPath)
+        if progressCallback and i % 100 == 0:
+            progressCallback(float(i) / len(targetPaths))
+
+    if progressCallback:
+        progressCallback(1.0)
+
+def clear():
+
+    global modified
+
+    with lock:
+        targetVerts.clear()
+        targetFaces.clear()
+        regions.clear()
+        modified = False
@@ -27,7 +27,6 @@ __docformat__ = 'restructuredtext'
 
 import algos3d
 import files3d
-import fastmath
 import math
 import mh
 import os
@@ -129,7 +128,7 @@ class WarpModifier (humanmodifier.SimpleModifier):
     def updateValue(self, human, value, updateNormals=1):
         
         if warp.numpy:
-            target = self.getWarpTarget(algos3d.theHuman)    
+            target = self.getWarpTarget(human)    
             if not target:
                 return
             target.reinit()
@@ -157,22 +156,21 @@ class WarpModifier (humanmodifier.SimpleModifier):
         targetChanged = self.getBases(human)
         if targetChanged:
             print "Reference target changed"
-            if not self.makeRefTarget():
+            if not self.makeRefTarget(human):
                 print "Updating character"
                 human.applyAllTargets()
                 self.getBases(human)
-                if not self.makeRefTarget():
+                if not self.makeRefTarget(human):
                     raise NameError("Character is empty")
 
     
     def getBases(self, human):
-        global theRefObjects
         
         targetChanged = False
         for key in self.bases.keys():
             target,char,cval0 = self.bases[key]
     
-            verts = theRefObjects[char]
+            verts = getRefCharacter(human.meshData, char)
             if not verts:
                 self.bases[key] = target,char,0
                 continue
@@ -185,56 +183,58 @@ class WarpModifier (humanmodifier.SimpleModifier):
         return targetChanged
         
 
-    def makeRefTarget(self):
+    def makeRefTarget(self, human):
         self.refTargetVerts = {}
+        offsets = warp.numpy.zeros((len(human.meshData.verts), 3))
+        moved = warp.numpy.zeros(len(human.meshData.verts), dtype=bool)
         madeRefTarget = False
         for key in self.bases.keys():
             target,char,cval = self.bases[key]
             if cval:
                 #print "ch", target, cval
                 madeRefTarget = True
-                verts = self.getTargetInsist(target)
-                for n,v in verts.items():
-                    dr = fastmath.vmul3d(v, cval)
-                    try:
-                        self.refTargetVerts[n] = fastmath.vadd3d(self.refTargetVerts[n], dr)
-                    except KeyError:
-                        self.refTargetVerts[n] = dr
+                verts = self.getTargetInsist(human.meshData, target)
+                if verts:
+                    indices, data = verts
+                    offsets[indices] += cval * data
+                    moved[indices] = True
+        indices = warp.numpy.flatnonzero(moved)
+        self.refTargetVerts = dict(zip(indices.tolist(), offsets[indices]))
         return madeRefTarget                            
                             
 
-    def getTargetInsist(self, target):
-        verts = self.getTarget(target)
+    def getTargetInsist(self, obj, target):
+        verts = self.getTarget(obj, target)
         if verts:
             self.refTargets[target] = verts
             return verts
         target1 = target.replace("asian", "caucasian").replace("neutral", "caucasian").replace("african", "caucasian")
         target1 = target1.replace("caucaucasian", "caucasian")
-        verts = self.getTarget(target1)
+        verts = self.getTarget(obj, target1)
         if verts:
             self.refTargets[target] = verts
             return verts
         target2 = target1.replace("child", "young").replace("old", "young")
-        verts = self.getTarget(target2)
+        verts = self.getTarget(obj, target2)
         if verts:
             self.refTargets[target] = verts
             return verts
         target3 = target2.replace("male", "female")
         target3 = target3.replace("fefemale", "female")
-        verts = self.getTarget(target3)
+        verts = self.getTarget(obj, target3)
         self.refTargets[target] = verts
         if not verts:
             print("Warning: Found none of:\n    %s\n    %s\n    %s\n    %s" % (target, target1, target2, target3))
         return verts
 
 
-    def getTarget(self, target):
+    def getTarget(self, obj, target):
         try:
             verts = self.refTargets[target]
         except KeyError:
             verts = None
         if verts == None:
-            verts = readTarget(target)
+            verts = readTarget(obj, target)
         return verts            
           
 
@@ -258,24 +258,45 @@ class WarpModifier (humanmodifier.SimpleModifier):
         
 
 def getRefObject(human):
-    global theRefObjects, theRefObjectVerts, theBaseObjectVerts
+    global theRefObjectVerts
        
-    if human.iHaveChanged:
+    if human.iHaveChanged or theRefObjectVerts is None:
         print "Reference character changed"
         human.iHaveChanged = False                        
     
-        theRefObjectVerts = [ list(v) for v in theBaseObjectVerts ]
+        theRefObjectVerts = getBaseObjectVerts(human.meshData).copy()
     
-        for (char, verts) in theRefObjects.items():
+        for char in theRefCharacters:
             cval = human.getDetail(char)
             if cval:
                 print "  ", os.path.basename(char), cval
-                for n,v in verts.items():
-                    dr = fastmath.vmul3d(v, cval)
-                    theRefObjectVerts[n] = fastmath.vadd3d(theRefObjectVerts[n], dr)
+                verts = getRefCharacter(human.meshData, char)
+                if verts:
+                    indices, data = verts
+                    theRefObjectVerts[indices] += cval * data
         return True
     else:
         return False
+
+
+def getBaseObjectVerts(obj):
+    global theBaseObjectVerts
+
+    if theBaseObjectVerts is None:
+        coords = files3d.getSharedCoords(obj)
+        if coords is None:
+            coords = files3d.loadVertsCoo("data/3dobjs/base.obj")
+        theBaseObjectVerts = warp.numpy.array(coords, dtype=float)
+    return theBaseObjectVerts
+
+
+def getRefCharacter(obj, path):
+    try:
+        return theRefObjects[path]
+    except KeyError:
+        verts = readTarget(obj, path)
+        theRefObjects[path] = verts
+        return verts
     
 
 
@@ -321,25 +342,21 @@ def compileWarpTarget(template, fallback, human, bodypart):
 #   Read target
 #----------------------------------------------------------                
 
-def readTarget(path):
-    target = {}
-    try:        
-        fp = open(path, "r")
-    except:
-        fp = None
-    if fp:
-        #print("Loading target %s" % path)
-        for line in fp:
-            words = line.split()
-            if len(words) >= 4:
-                n = int(words[0])
-                if n < algos3d.NMHVerts:
-                    target[n] = [float(words[1]), float(words[2]), float(words[3])]
-        fp.close()
-        return target
-    else:
+def readTarget(obj, path):
+    """
+    Returns the vertex indices and offsets of a target as arrays, or None if the
+    file does not exist or is empty. The target is parsed once and kept in
+    algos3d.targetBuffer, shared with the modifiers which apply it.
+    """
+    if not os.path.isfile(path):
         #print("Could not find %s" % os.path.realpath(path))
-        return {}
+        return None
+    target = algos3d.getTarget(obj, path)
+    if not target.verts:
+        return None
+    indices = warp.numpy.array(target.verts, dtype=int)
+    data = warp.numpy.array([target.data[n] for n in target.verts], dtype=float)
+    return indices, data
 
  
 #----------------------------------------------------------
@@ -347,7 +364,7 @@ def readTarget(path):
 #----------------------------------------------------------
 
 def defineGlobals():
-    global theLandMarks, theBaseObjectVerts, theRefObjects
+    global theLandMarks, theBaseObjectVerts, theRefObjects, theRefObjectVerts, theRefCharacters
     
     theLandMarks = {}
     folder = "data/landmarks"
@@ -366,16 +383,16 @@ def defineGlobals():
 
         theLandMarks[name] = landmark
 
-    obj = files3d.loadMesh("data/3dobjs/base.obj")
-    theBaseObjectVerts = [ v.co for v in obj.verts ]
-
+    # The base coordinates and the reference characters are read the first time
+    # a warp target is compiled, see getRefObject
+    theBaseObjectVerts = None
     theRefObjects = {}
+    theRefObjectVerts = None
+    theRefCharacters = []
     for race in ["african", "asian", "neutral"]:
         for gender in ["female", "male"]:
             for age in ["child", "young", "old"]:
-                path = "data/targets/macrodetails/%s-%s-%s.target" % (race, gender, age)
-                theRefObjects[path] = readTarget(path)
-    
+                theRefCharacters.append("data/targets/macrodetails/%s-%s-%s.target" % (race, gender, age))
 
 
 defineGlobals()
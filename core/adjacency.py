@@ -0,0 +1,180 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+:Authors:
+    MakeHuman Team
+
+:Version: 1.0
+:Copyright: MakeHuman Team 2001-2012
+:License: GPL3
+
+Abstract
+--------
+
+This module contains the adjacency tables of a mesh: the faces sharing each vertex,
+the vertices connected to each vertex by an edge, the list of edges and the edges
+of each face.
+
+The tables are stored in compressed sparse row form. The neighbours of element i are
+indices[offsets[i]:offsets[i+1]], so a table takes two flat integer arrays instead of
+a Python list per element. The tables are built once per topology, see
+Object3D.getAdjacency, and are exposed as numpy arrays when numpy is available, so
+that mesh algorithms can work on all vertices at once.
+
+Faces are quads; a triangle repeats its first vertex as fourth vertex and has three
+edges.
+"""
+
+__docformat__ = 'restructuredtext'
+
+import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+def _toArray(data):
+
+    if numpy:
+        return numpy.frombuffer(data, dtype=numpy.int32)
+    return data
+
+class Adjacency:
+
+    """
+    The adjacency tables of a mesh.
+
+    .. py:attribute:: vertFaceOffsets, vertFaceIndices
+
+        The faces sharing each vertex, in increasing order.
+
+    .. py:attribute:: vertVertOffsets, vertVertIndices
+
+        The vertices connected to each vertex by an edge, in increasing order.
+
+    .. py:attribute:: edges
+
+        The two vertex indices of each edge, the lowest first, as a flat array.
+
+    .. py:attribute:: faceEdgeOffsets, faceEdgeIndices
+
+        The edges of each face, the edge from the i-th to the next corner at position i.
+
+    :param faceVerts: The vertex indices of each face.
+    :type faceVerts: [(int, ..), ..]
+    :param nVerts: The amount of vertices.
+    :type nVerts: int
+    """
+
+    def __init__(self, faceVerts, nVerts):
+
+        self.nVerts = nVerts
+        self.nFaces = len(faceVerts)
+
+        vertFaces = [[] for i in xrange(nVerts)]
+        vertVerts = [set() for i in xrange(nVerts)]
+        edgeMap = {}
+        edges = array.array('i')
+        faceEdgeOffsets = array.array('i', [0])
+        faceEdgeIndices = array.array('i')
+
+        for fIndex, verts in enumerate(faceVerts):
+            if len(verts) == 4 and verts[3] == verts[0]:
+                verts = verts[:3]
+            for i, v in enumerate(verts):
+                if not vertFaces[v] or vertFaces[v][-1] != fIndex:
+                    vertFaces[v].append(fIndex)
+                w = verts[(i + 1) % len(verts)]
+                key = (v, w) if v < w else (w, v)
+                eIndex = edgeMap.get(key)
+                if eIndex is None:
+                    eIndex = len(edgeMap)
+                    edgeMap[key] = eIndex
+                    edges.extend(key)
+                    vertVerts[v].add(w)
+                    vertVerts[w].add(v)
+                faceEdgeIndices.append(eIndex)
+            faceEdgeOffsets.append(len(faceEdgeIndices))
+
+        self.nEdges = len(edgeMap)
+        self.vertFaceOffsets, self.vertFaceIndices = self.__compress(vertFaces)
+        self.vertVertOffsets, self.vertVertIndices = self.__compress([sorted(verts) for verts in vertVerts])
+        self.edges = _toArray(edges)
+        self.faceEdgeOffsets = _toArray(faceEdgeOffsets)
+        self.faceEdgeIndices = _toArray(faceEdgeIndices)
+
+        self.__faceVerts = faceVerts
+
+    def __compress(self, rows):
+
+        offsets = array.array('i', [0])
+        indices = array.array('i')
+        for row in rows:
+            indices.extend(row)
+            offsets.append(len(indices))
+        return _toArray(offsets), _toArray(indices)
+
+    def getVertFaces(self, index):
+        """
+        Returns the indices of the faces sharing a vertex.
+        """
+
+        return self.vertFaceIndices[self.vertFaceOffsets[index]:self.vertFaceOffsets[index + 1]]
+
+    def getVertVerts(self, index):
+        """
+        Returns the indices of the vertices connected to a vertex by an edge.
+        """
+
+        return self.vertVertIndices[self.vertVertOffsets[index]:self.vertVertOffsets[index + 1]]
+
+    def getFaceEdges(self, index):
+        """
+        Returns the indices of the edges of a face.
+        """
+
+        return self.faceEdgeIndices[self.faceEdgeOffsets[index]:self.faceEdgeOffsets[index + 1]]
+
+    def getEdge(self, index):
+        """
+        Returns the vertex indices of an edge, the lowest first.
+        """
+
+        return self.edges[2 * index], self.edges[2 * index + 1]
+
+    def getVertRing(self, index):
+        """
+        Returns the indices of the vertices of all faces sharing a vertex, including
+        the vertex itself.
+        """
+
+        ring = set()
+        for fIndex in self.getVertFaces(index):
+            ring.update(self.__faceVerts[fIndex])
+        return sorted(ring)
+
+    def getFacesOfVerts(self, indices):
+        """
+        Returns the indices of the faces sharing any of the given vertices.
+
+        :param indices: The vertex indices.
+        :type indices: [int, ..]
+        :rtype: [int, ..]
+        """
+
+        if numpy:
+            indices = numpy.asarray(indices, dtype=numpy.int32)
+            if not len(indices):
+                return []
+            starts = self.vertFaceOffsets[indices]
+            counts = self.vertFaceOffsets[indices + 1] - starts
+            # Positions of the faces of all vertices in vertFaceIndices
+            positions = numpy.repeat(starts - numpy.cumsum(counts) + counts, counts) + numpy.arange(counts.sum())
+            return numpy.unique(self.vertFaceIndices[positions]).tolist()
+
+        faces = set()
+        for index in indices:
+            faces.update(self.getVertFaces(index))
+        return sorted(faces)
@@ -47,11 +47,11 @@ import aljabr
 import textures3d
 import files3d
 import os
+import profiler
 
 NMHVerts = 18528
 
 targetBuffer = {}
-theHuman = None
 
 class Target:
 
@@ -143,11 +143,18 @@ class Target:
 
         fileDescriptor.close()
         
+    @profiler.timed('Target.apply')
     def apply(self, obj, morphFactor, update=True, calcNormals=True, faceGroupToUpdateName=None, scale=(1.0,1.0,1.0)):
-        global theHuman
         
         self.morphFactor = morphFactor                
 
+        # The unwarped coordinates are kept by the human owning the mesh, if any
+        human = obj.object
+        if hasattr(self, "isWarp") or getattr(human, "meshData", None) is not obj:
+            shadowVerts = None
+        else:
+            shadowVerts = human.shadowVerts
+
         if self.verts:
             
             if morphFactor or calcNormals or update:
@@ -184,8 +191,8 @@ class Target:
                     v.co[0] += dv0
                     v.co[1] += dv1
                     v.co[2] += dv2                    
-                    if not hasattr(self, "isWarp"):
-                        sv = theHuman.shadowVerts[v.idx]
+                    if shadowVerts:
+                        sv = shadowVerts[v.idx]
                         sv[0] += dv0
                         sv[1] += dv1
                         sv[2] += dv2     
@@ -344,6 +351,7 @@ def calcTargetNormal(obj, targetPath):
         return False
 
 
+@profiler.timed('loadRotationTarget')
 def loadRotationTarget(obj, targetPath, morphFactor):  
     """
     This function loads a rotation target file and applies the rotations to 
@@ -390,8 +398,6 @@ def loadRotationTarget(obj, targetPath, morphFactor):
 
     """
 
-    a = time.time()  
-
     try:
         f = open(targetPath)
         fileDescriptor = f.readlines()
@@ -439,7 +445,6 @@ def loadRotationTarget(obj, targetPath, morphFactor):
     
     verticesToUpdate = [obj.verts[i] for i in set(indicesToUpdate)]
     obj.update(verticesToUpdate)
-    print "ROTATION TIME", time.time()-a
 
     return 1
 
@@ -549,18 +554,11 @@ def checkMeshTopology(obj, verbose=None):
     the vertices and edges
     found to be defective are coloured on the image on the screen. 
     
-    The 'wrong normal' check is written to accommodate an h-edge \"bug\":
-    if a face has a wrong normal (i.e. wrong verts
-    order) the edge loop is infinite, because the
-    condition:
-    
-    ::
-
-        while loopHedge != startHEdge:
-
-    is never true. We therefore assume that a vertex can't share
-    more than 25 edges, so, if the number of iterations is over
-    25, the normals are wrong.
+    The checks use the array based half edges of the halfedge module.
+    If a face has a wrong normal (i.e. wrong verts order), its half 
+    edges go in the same direction as the half edges of its neighbours,
+    so the 'wrong normal' check looks for half edges with the same
+    first and last vertex.
 
     Boundary verts are blue, while verts of an edge
     between two faces with opposite normals, are red.
@@ -574,43 +572,17 @@ def checkMeshTopology(obj, verbose=None):
     
     """
 
-    isolate_verts = []
-    edges_boundary = []
-    wrong_normals_edges = []
-
     import halfedges
 
-    if not hasattr(obj, 'he_hedgeCalculated'):
-        halfedges.calcHedgeData(obj)
+    hedges = halfedges.calcHalfEdges(obj)
+    isolate_verts = hedges.getIsolatedVerts().tolist()
+    edges_boundary = hedges.getBoundaryHedges()
+    wrong_normals_edges = hedges.getDuplicateHedges()
 
-    for v in obj.verts:
-        he = v.he_hedge
-        twin = he.twin
-        if not he:
-            isolate_verts.append(obj.verts.index(v))
-            continue
-        if not twin:
-            edges_boundary.append(he)
-            v.color = [0, 0, 255, 255]  # Blue = boundary
-            continue
-
-        startHEdge = he
-        loopHedge = twin.next
-        i = 0
-        while loopHedge != startHEdge:
-            i += 1
-            if not loopHedge.twin:
-                edges_boundary.append(loopHedge)
-                v.color = [0, 0, 255, 255]  # Blue = boundary
-                break
-            try:
-                loopHedge = loopHedge.twin.next
-            except:
-                break
-            if i > 25:
-                wrong_normals_edges.append(loopHedge.next)
-                v.color = [255, 0, 0, 255]  # Red =Wrong normals
-                break
+    for i in hedges.vert[edges_boundary].tolist() + hedges.getEnd(edges_boundary).tolist():
+        obj.verts[i].color = [0, 0, 255, 255]  # Blue = boundary
+    for i in hedges.vert[wrong_normals_edges].tolist() + hedges.getEnd(wrong_normals_edges).tolist():
+        obj.verts[i].color = [255, 0, 0, 255]  # Red =Wrong normals
     for v in obj.verts:
         v.update(0, 0, 1)
     print 'Check Mesh result:'
@@ -621,11 +593,11 @@ def checkMeshTopology(obj, verbose=None):
     print 'Mesh %s has %s boundary edges ' % (obj.name, len(edges_boundary))
     if verbose:
         for eb in edges_boundary:
-            print eb
+            print '%d-%d' % (hedges.vert[eb], hedges.getEnd(eb))
     print 'Mesh %s has %s edges shared between faces with opposite normals ' % (obj.name, len(wrong_normals_edges))
     if verbose:
         for wne in wrong_normals_edges:
-            print wne
+            print '%d-%d' % (hedges.vert[wne], hedges.getEnd(wne))
 
 
 def analyzeTarget(obj, targetPath):
@@ -820,59 +792,32 @@ def saveVertsColorsFromBitmap(obj, imagePath):
     """
 
     t1 = time.time()
-    tgaData = textures3d.readTGA(imagePath)
-    if tgaData:
-        BGRlist = tgaData[0]
-        xres = tgaData[1]
-        yres = tgaData[2]
-        numOfPixel = tgaData[3]
-        byteUsedForPixel = tgaData[4]
-
-        objectColor = []
-        for f in obj.faces:
-            faceColors = []
-            for uv in f.uv:
-                u = uv[0]
-                v = uv[1]
-
-                pixelIdx = textures3d.UVCooToBitmapIndex(xres, yres, u, v)
-                if byteUsedForPixel == 3:
-                    pixelIdx *= 3
-                    B = BGRlist[pixelIdx]
-                    G = BGRlist[pixelIdx + 1]
-                    R = BGRlist[pixelIdx + 2]
-                    A = 255
-
-                if byteUsedForPixel == 4:
-                    pixelIdx *= 4
-                    B = BGRlist[pixelIdx]
-                    G = BGRlist[pixelIdx + 1]
-                    R = BGRlist[pixelIdx + 2]
-                    A = BGRlist[pixelIdx + 3]
-
-                color = (R, G, B, A)
-                faceColors.append(color)
-            objectColor.append(faceColors)
-    else:
-
+    image = textures3d.readTGAArray(imagePath)
+    if image is None:
         print 'WARNING: %s not converted in verts color' % imagePath
         return
 
+    # Sample the texels under the uv coordinates of all face corners at once
+
+    uvs = [obj.uvValues[uv] for f in obj.faces for uv in f.uv]
+    colors = textures3d.sampleUVs(image, uvs)
+    if colors.shape[1] == 1:
+        colors = colors.repeat(3, axis=1)
+    if colors.shape[1] == 3:
+        colors = textures3d.numpy.hstack([colors, textures3d.numpy.empty((len(colors), 1), colors.dtype)])
+        colors[:, 3] = 255
+
     try:
         fileDescriptor = open(imagePath + '.colors', 'w')
     except:
         print 'error to save obj file'
         return 0
 
-    # Write, for each line, a sequence of 3 verts color of the triangle:
-    # r1,g1,b1,a1,r2,g2,b2,a2,r3,g3,b3,a3,
+    # Write, for each line, a sequence of 4 verts color of the face:
+    # r1,g1,b1,a1,r2,g2,b2,a2,r3,g3,b3,a3,r4,g4,b4,a4
 
-    for fc in objectColor:
-        colorVert0 = fc[0]
-        colorVert1 = fc[1]
-        colorVert2 = fc[2]
-        fileDescriptor.write('%i %i %i %i %i %i %i %i %i %i %i %i\n' % (colorVert0[0], colorVert0[1], colorVert0[2], colorVert0[3], colorVert1[0], colorVert1[1],
-                             colorVert1[2], colorVert1[3], colorVert2[0], colorVert2[1], colorVert2[2], colorVert2[3]))
+    colors = colors.reshape((-1, 16))
+    fileDescriptor.write(''.join(['%i %i %i %i %i %i %i %i %i %i %i %i %i %i %i %i\n' % tuple(fc) for fc in colors.tolist()]))
     fileDescriptor.close()
 
     print 'Time to save colors ', time.time() - t1
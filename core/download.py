@@ -1,111 +1,250 @@
 import os
 import urllib2
+import urlparse
+import httplib
+import socket
+import json
+import ast
+import Queue
 import mh
-from threading import Thread
+from threading import Thread, Lock
 
 class MediaSync(Thread):
-    
-    def __init__(self, app, path, url, callback=None):
-        
+
+    def __init__(self, app, path, url, callback=None, workers=4):
+
         Thread.__init__(self)
         self.app = app
         self.path = path
         self.url = url
         self.callback = callback
-        
+        self.workers = workers
+
     def run(self):
-        
+
         cache = DownloadCache(self.path)
         mh.callAsync(lambda:self.app.progress(0.0, 'Downloading media list'))
-        success, code = cache.download(os.path.join(self.url, 'media.ini'))
+        success, code = cache.download(urlparse.urljoin(self.url, 'media.ini'))
         if success:
             f = open(os.path.join(self.path, 'media.ini'), 'r')
-            filenames = f.readlines()
-            n = float(len(filenames))
-            for index, filename in enumerate(filenames):
-                try:
-                    filename = filename.split()[0]
-                    mh.callAsync(lambda:self.app.progress(index/n, 'Downloading %s' % filename))
-                    url = os.path.join(self.url, filename)
-                    success, code = cache.download(url)
-                except:
-                    pass
+            filenames = [line.split()[0] for line in f if line.split()]
             f.close()
+            urls = [urlparse.urljoin(self.url, filename) for filename in filenames]
+            pool = DownloadPool(cache, self.workers, self.onProgress)
+            pool.download(urls)
+            cache.save()
             mh.callAsync(lambda:self.app.progress(1.0))
         else:
             mh.callAsync(lambda:self.app.progress(1.0))
             mh.callAsync(lambda:self.app.prompt('Error', 'Failed to sync media from %s, error %d.' % (self.path, code), 'OK'))
-            
+
         if self.callback:
              mh.callAsync(self.callback)
 
+    def onProgress(self, done, total, url):
+
+        mh.callAsync(lambda:self.app.progress(float(done) / total, 'Downloading %s' % os.path.basename(url)))
+
+class DownloadPool():
+
+    """
+    Downloads a list of urls through a DownloadCache with a bounded amount of worker threads.
+    Each worker keeps its HTTP connections open between requests to the same server.
+    """
+
+    def __init__(self, cache, workers=4, onProgress=None):
+
+        self.cache = cache
+        self.workers = max(1, workers)
+        self.onProgress = onProgress
+        self.results = {}
+        self.__lock = Lock()
+
+    def download(self, urls):
+        """
+        Downloads the urls and returns a dictionary mapping each url to its (success, code) result.
+        """
+
+        self.results = {}
+        self.__total = len(urls)
+        queue = Queue.Queue()
+        for url in urls:
+            queue.put(url)
+
+        threads = [Thread(target=self.__work, args=(queue,)) for i in xrange(min(self.workers, len(urls)))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        return self.results
+
+    def __work(self, queue):
+
+        connections = ConnectionCache()
+        try:
+            while True:
+                try:
+                    url = queue.get_nowait()
+                except Queue.Empty:
+                    break
+                try:
+                    result = self.cache.download(url, connections)
+                except Exception, e:
+                    print('Could not download %s: %s' % (url, e))
+                    result = False, 0
+                with self.__lock:
+                    self.results[url] = result
+                    done = len(self.results)
+                if self.onProgress:
+                    self.onProgress(done, self.__total, url)
+        finally:
+            connections.close()
+
+class ConnectionCache():
+
+    """
+    Persistent HTTP connections, one per server, for use by a single thread.
+    """
+
+    def __init__(self, timeout=30):
+
+        self.timeout = timeout
+        self.connections = {}
+
+    def request(self, url, headers, redirects=5):
+        """
+        Performs a GET request and returns the response, following redirects.
+        The response body must be read before the next request.
+        """
+
+        scheme, netloc, path, params, query, fragment = urlparse.urlparse(url)
+        if scheme not in ('http', 'https'):
+            raise urllib2.URLError('unsupported url %s' % url)
+        selector = urlparse.urlunparse(('', '', path or '/', params, query, ''))
+
+        for attempt in xrange(2):
+            connection = self.__get(scheme, netloc)
+            try:
+                connection.request('GET', selector, headers=headers)
+                response = connection.getresponse()
+                break
+            except (httplib.HTTPException, socket.error):
+                # The server closed the kept alive connection, reconnect once
+                self.__drop(scheme, netloc)
+                if attempt:
+                    raise
+
+        if response.status in (301, 302, 303, 307) and redirects:
+            location = response.getheader('Location')
+            response.read()
+            return self.request(urlparse.urljoin(url, location), headers, redirects - 1)
+
+        return response
+
+    def close(self):
+
+        for connection in self.connections.itervalues():
+            connection.close()
+        self.connections.clear()
+
+    def __get(self, scheme, netloc):
+
+        key = (scheme, netloc)
+        if key not in self.connections:
+            if scheme == 'https':
+                self.connections[key] = httplib.HTTPSConnection(netloc, timeout=self.timeout)
+            else:
+                self.connections[key] = httplib.HTTPConnection(netloc, timeout=self.timeout)
+        return self.connections[key]
+
+    def __drop(self, scheme, netloc):
+
+        connection = self.connections.pop((scheme, netloc), None)
+        if connection:
+            connection.close()
+
 class DownloadCache():
 
-    class NotModifiedHandler(urllib2.BaseHandler):
-  
-        def http_error_304(self, req, fp, code, message, headers):
-            
-            addinfourl = urllib2.addinfourl(fp, headers, req.get_full_url())
-            addinfourl.code = code
-            
-            return addinfourl
-        
+    """
+    Keeps the ETag and Last-Modified header of each downloaded file in cache.json,
+    so that unchanged files are not downloaded again.
+    """
+
     def __init__(self, path):
-    
+
         self.path = path
-            
-        cachePath = os.path.join(self.path, 'cache.ini')
-        if os.path.exists(cachePath):
-            f = open(cachePath, 'r')
-            self.cache = eval(f.read(), {"__builtins__":None}, {'True':True, 'False':False})
-            f.close()
-        else:
+        self.__lock = Lock()
+
+        cachePath = os.path.join(self.path, 'cache.json')
+        oldCachePath = os.path.join(self.path, 'cache.ini')
+        self.cache = {}
+        try:
+            if os.path.exists(cachePath):
+                f = open(cachePath, 'r')
+                self.cache = dict([(filename, (entry.get('etag'), entry.get('modified')))
+                    for filename, entry in json.load(f).iteritems()])
+                f.close()
+            elif os.path.exists(oldCachePath):
+                f = open(oldCachePath, 'r')
+                self.cache = ast.literal_eval(f.read())
+                f.close()
+        except (ValueError, SyntaxError, AttributeError):
+            print('Ignoring corrupt download cache in %s' % self.path)
             self.cache = {}
-            
-    def download(self, url):
-        
+
+    def download(self, url, connections=None):
+
         filename = os.path.basename(url)
-        
-        if os.path.exists(os.path.join(self.path, filename)):
-            etag, modified = self.cache.get(filename, (None, None))
-        else:
-            etag, modified = None, None
-        
+
+        with self.__lock:
+            if os.path.exists(os.path.join(self.path, filename)):
+                etag, modified = self.cache.get(filename, (None, None))
+            else:
+                etag, modified = None, None
+
+        ownConnections = connections is None
+        if ownConnections:
+            connections = ConnectionCache()
         try:
-            downloaded, etag, modified, data = self.__downloadConditionally(url, etag, modified)
-        except urllib2.HTTPError, e:
-            print('Could not download %s: %s' % (url, e))
-            return False, e.code
-                
-        if downloaded:
-            f = open(os.path.join(self.path, filename), 'wb')
-            f.write(data)
-            f.close()
-            self.cache[filename] = (etag, modified)
-            
-        cachePath = os.path.join(self.path, 'cache.ini')
+            headers = {}
+            if etag:
+                headers['If-None-Match'] = etag
+            if modified:
+                headers['If-Modified-Since'] = modified
+            try:
+                response = connections.request(url, headers)
+            except (httplib.HTTPException, socket.error, urllib2.URLError), e:
+                print('Could not download %s: %s' % (url, e))
+                return False, 0
+            data = response.read()
+        finally:
+            if ownConnections:
+                connections.close()
+
+        if response.status == 304:
+            return True, 304
+        elif response.status != 200:
+            print('Could not download %s: HTTP error %d' % (url, response.status))
+            return False, response.status
+
+        f = open(os.path.join(self.path, filename), 'wb')
+        f.write(data)
+        f.close()
+        with self.__lock:
+            self.cache[filename] = (response.getheader('ETag'), response.getheader('Last-Modified'))
+
+        if ownConnections:
+            self.save()
+
+        return True, 200
+
+    def save(self):
+
+        with self.__lock:
+            cache = dict([(filename, {'etag': etag, 'modified': modified})
+                for filename, (etag, modified) in self.cache.iteritems()])
+        cachePath = os.path.join(self.path, 'cache.json')
         f = open(cachePath, 'w')
-        f.write(repr(self.cache))
+        json.dump(cache, f, indent=1, sort_keys=True)
         f.close()
-        
-        return True, (200 if downloaded else 304)
-        
-    @classmethod
-    def __downloadConditionally(cls, url, etag=None, modified=None):
-    
-        request = urllib2.Request(url)
-        
-        if etag:
-            request.add_header("If-None-Match", etag)
-      
-        if modified:
-            request.add_header("If-Modified-Since", modified)
-     
-        opener = urllib2.build_opener(cls.NotModifiedHandler())
-        handle = opener.open(request)
-        headers = handle.info()
-     
-        if hasattr(handle, 'code') and handle.code == 304:
-            return False, None, None, None
-        else:
-            return True, headers.getheader("ETag"), headers.getheader("Last-Modified"), handle.read()
\ No newline at end of file
@@ -53,8 +53,10 @@ is visible to the user through the GUI.
 import os
 import algos3d
 import module3d
+
+topologies = {}  # path -> (mtime, module3d.Topology, coordinates in the file)
     
-def loadMesh(path, locX=0, locY=0, locZ=0, loadColors=1):
+def loadMesh(path, locX=0, locY=0, locZ=0, loadColors=1, shared=False):
     """
     This function loads the specified mesh objects into internal MakeHuman data structures,
     and return it.
@@ -73,7 +75,22 @@ def loadMesh(path, locX=0, locY=0, locZ=0, loadColors=1):
 
     locZ:
       *float* Z location of loaded obj, default = 0
+
+    shared:
+      *Boolean* Share the faces, uv values and index buffer with the other objects
+      loaded from the same file with shared set. The file is only parsed once.
     """
+
+    if shared:
+        obj = loadSharedMesh(path)
+        if not obj:
+            return False
+        obj.x = locX
+        obj.y = locY
+        obj.z = locZ
+        if loadColors:
+            algos3d.loadVertsColors(obj, path + '.colors', None)
+        return obj
     
     name = os.path.basename(path)
     obj = module3d.Object3D(name)
@@ -160,6 +177,47 @@ def loadMesh(path, locX=0, locY=0, locZ=0, loadColors=1):
         
     return obj
     
+def loadSharedMesh(path):
+    """
+    This function creates an object from the topology of a mesh file, loading the
+    file and keeping its topology and coordinates the first time, or when the file
+    changed. All objects loaded this way only hold their own coordinates and normals.
+
+    path:
+      *String*.  The file system path to the file containing the object to load.
+    """
+
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        print 'Warning: obj file not found: ', path
+        return False
+
+    entry = topologies.get(path)
+    if not entry or entry[0] != mtime:
+        obj = loadMesh(path, loadColors=0)
+        if not obj:
+            return False
+        entry = (mtime, obj.getTopology(), tuple([tuple(v.co) for v in obj.verts]))
+        topologies[path] = entry
+    return entry[1].createObject(coords=entry[2])
+
+def getSharedCoords(obj):
+    """
+    This function returns the vertex coordinates in the mesh file of an object loaded
+    with shared set, or None for other objects.
+
+    obj:
+      *Object3D*.  The object.
+    """
+
+    if not obj.topology:
+        return None
+    entry = topologies.get(obj.topology.path)
+    if entry and entry[1] is obj.topology:
+        return entry[2]
+    return None
+    
 originalVertexCoordinates = []
 
 def loadVertsCoo(path):
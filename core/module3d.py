@@ -25,6 +25,10 @@ FaceGroup objects. A FaceGroup contains one or more Face objects, which themselv
 refer to one or more Vert objects (depending on the kind of primitives that are used).
 The Vert objects themselves are actually owned by the Object3D.
 
+Objects created from a shared Topology hold only their coordinates and normals. Their
+VertView and FaceView objects keep little more than their object and index, everything
+else is looked up in the lists of the object or in the topology.
+
 """
 
 __docformat__ = 'restructuredtext'
@@ -36,6 +40,8 @@ from types import *
 import os
 import weakref
 from fastmath import vnorm3d
+import adjacency
+import profiler
 
 textureCache = {}
 
@@ -313,17 +319,75 @@ class Vert:
 
         """
 
-        sharedVertices = set()
-        for f in self.sharedFaces:
-            for v in f.verts:
-                sharedVertices.add(v)
-        return list(sharedVertices)
+        verts = self.object.verts
+        return [verts[i] for i in self.object.getAdjacency().getVertRing(self.idx)]
 
     def __str__(self):
 
         return 'vert num %s, coord(%s,%s,%s)' % (self.idx, self.co[0], self.co[1], self.co[2])
 
 
+class VertView(Vert, object):
+
+    """
+    A vertex of an object created from a :py:class:`module3d.Topology`. Its coordinates
+    and normal are the items of the coords and normals lists of the object, the faces
+    sharing it and its place in the OpenGL arrays are looked up in the topology.
+    Other attributes, like the color, are only stored when they are set.
+
+    :param object: The object which owns this vertex.
+    :type object: :py:class:`module3d.Object3D`
+    :param idx: The index of this vertex.
+    :type idx: int
+    """
+
+    __slots__ = ('object', 'idx')
+
+    color = (255, 255, 255, 255)
+    weights = None
+
+    def __init__(self, object, idx):
+
+        self.object = object
+        self.idx = idx
+
+    def getCo(self):
+        return self.object.coords[self.idx]
+
+    def setCo(self, co):
+        self.object.coords[self.idx] = co
+
+    co = property(getCo, setCo)
+
+    def getNo(self):
+        return self.object.normals[self.idx]
+
+    def setNo(self, no):
+        self.object.normals[self.idx] = no
+
+    no = property(getNo, setNo)
+
+    @property
+    def sharedFaces(self):
+        faces = self.object.faces
+        return [faces[i] for i in self.object.topology.vertFaces[self.idx]]
+
+    @property
+    def _Vert__indicesInFullVertArray(self):
+        return self.object.topology.vertBufferIndices[self.idx]
+
+    def calcNorm(self):
+
+        faceNormals = self.object.faceNormals
+        no = [0.0, 0.0, 0.0]
+        for i in self.object.topology.vertFaces[self.idx]:
+            fno = faceNormals[i]
+            no[0] += fno[0]
+            no[1] += fno[1]
+            no[2] += fno[2]
+        self.object.normals[self.idx] = vnorm3d(no)
+
+
 class Face:
 
     """
@@ -404,6 +468,61 @@ class Face:
         return 'face %i: verts: %s' % (self.idx, [v.idx for v in self.verts])
 
 
+class FaceView(Face, object):
+
+    """
+    A face of an object created from a :py:class:`module3d.Topology`. Its normal is an
+    item of the faceNormals list of the object, its uv indices and material are looked
+    up in the topology. The tuple of its vertices is kept, as the exporters and fitting
+    code read it many times per face.
+
+    :param object: The object which owns this face.
+    :type object: :py:class:`module3d.Object3D`
+    :param idx: The index of this face.
+    :type idx: int
+    :param group: The face group of this face.
+    :type group: :py:class:`module3d.FaceGroup`
+    :param verts: The vertices of this face.
+    :type verts: (:py:class:`module3d.VertView`, ..)
+    """
+
+    __slots__ = ('object', 'idx', 'group', 'verts')
+
+    color = None
+
+    def __init__(self, object, idx, group, verts):
+
+        self.object = object
+        self.idx = idx
+        self.group = group
+        self.verts = verts
+
+    def getNo(self):
+        return self.object.faceNormals[self.idx]
+
+    def setNo(self, no):
+        self.object.faceNormals[self.idx] = no
+
+    no = property(getNo, setNo)
+
+    @property
+    def uv(self):
+        return self.object.topology.faceUvs[self.idx]
+
+    @property
+    def mtl(self):
+        return self.object.topology.faceMtls[self.idx]
+
+    def calcNormal(self):
+
+        coords = self.object.coords
+        faceVerts = self.object.topology.faceVerts[self.idx]
+        if len(faceVerts) > 2:
+            self.object.faceNormals[self.idx] = aljabr.planeNorm(coords[faceVerts[0]], coords[faceVerts[1]], coords[faceVerts[2]])
+        else:
+            self.object.faceNormals[self.idx] = [0.0, 0.0, 1.0]
+
+
 class FaceGroup:
 
     """
@@ -618,6 +737,22 @@ class Object3D(object):
     .. py:attribute:: uvMap
     
         A map of uv values to speed up searching. dict
+        
+    .. py:attribute:: topology
+    
+        The topology shared with other objects, or None if this object owns its faces, uv values and index buffer. :py:class:`module3d.Topology`
+        
+    .. py:attribute:: coords
+    
+        The coordinates of the vertices of an object with a shared topology, None otherwise. [[float, float, float], ..]
+        
+    .. py:attribute:: normals
+    
+        The normals of the vertices of an object with a shared topology, None otherwise. [[float, float, float], ..]
+        
+    .. py:attribute:: faceNormals
+    
+        The normals of the faces of an object with a shared topology, None otherwise. [[float, float, float], ..]
 
     """
 
@@ -651,6 +786,11 @@ class Object3D(object):
         self.__vertexBufferSize = None
         self.uvValues = None
         self.uvMap = {}
+        self.topology = None
+        self.coords = None
+        self.normals = None
+        self.faceNormals = None
+        self.__adjacency = None
         
         self.__object = None
         
@@ -681,7 +821,19 @@ class Object3D(object):
         # Clear remote data
         self.detach()
 
-        # Clear local data data
+        # Clear local data data, shared data is only released
+        self.__adjacency = None
+        if self.topology:
+            self.topology = None
+            self.__indexBuffer = []
+            self.uvValues = []
+            for f in self.faces:
+                del f.verts
+            del self.verts[:]
+            del self.faces[:]
+            self.coords = None
+            self.normals = None
+            self.faceNormals = None
         if self.__indexBuffer:
             del self.__indexBuffer[:]
         if self.uvValues:
@@ -799,7 +951,16 @@ class Object3D(object):
         that we have a place to record the separate UV-indices.
         Where the UV-map needs a sharp transition (e.g. where the eyelids
         meet the eyeball) we therefore create duplicate vertices.
-        """
+        An object created from a shared topology uses the buffers of the topology.
+        """
+        if self.topology:
+            self.__indexBuffer = self.topology.indexBuffer
+            self.__vertexBufferSize = self.topology.vertexBufferSize
+            for g, (elementIndex, elementCount) in zip(self.__faceGroups, self.topology.groupElements):
+                g._FaceGroup__elementIndex = elementIndex
+                g._FaceGroup__elementCount = elementCount
+            return
+        self.__adjacency = None
         del self.__indexBuffer[:]
         fullArrayIndex = 0
         for g in self.__faceGroups:
@@ -824,6 +985,38 @@ class Object3D(object):
 
         self.__vertexBufferSize = fullArrayIndex
 
+    def getTopology(self):
+        """
+        Returns the topology of this object, so that other objects with the same faces
+        can be created from it. An object which does not share a topology yet keeps its
+        own faces, the topology gets copies of its indices.
+
+        :return: The topology.
+        :rtype: :py:class:`module3d.Topology`
+        """
+        if self.topology:
+            return self.topology
+        if self.__vertexBufferSize is None:
+            self.updateIndexBuffer()
+        return Topology(self, list(self.__indexBuffer), self.__vertexBufferSize,
+            tuple([tuple(v._Vert__indicesInFullVertArray) for v in self.verts]),
+            tuple([(g._FaceGroup__elementIndex, g._FaceGroup__elementCount) for g in self.__faceGroups]))
+
+    def getAdjacency(self):
+        """
+        Returns the adjacency tables of this object, built the first time they are needed.
+        They are shared with other objects of the same topology and rebuilt when the
+        index buffer of this object is updated.
+
+        :return: The adjacency tables.
+        :rtype: :py:class:`adjacency.Adjacency`
+        """
+        if self.topology:
+            return self.topology.getAdjacency()
+        if not self.__adjacency:
+            self.__adjacency = adjacency.Adjacency([[v.idx for v in f.verts] for f in self.faces], len(self.verts))
+        return self.__adjacency
+
     def createFaceGroup(self, name):
         """
         Creates a new module3d.FaceGroup with the given name.
@@ -1136,6 +1329,7 @@ class Object3D(object):
         except AttributeError, text:
             pass
 
+    @profiler.timed('Object3D.update')
     def update(self, verticesToUpdate=None, updateNormals=True):
         """
         This method is used to call the update methods on each of a list of vertices or all vertices that form part of this object.
@@ -1148,10 +1342,13 @@ class Object3D(object):
 
         if verticesToUpdate == None:
             verticesToUpdate = self.verts
+
+        profiler.count('Object3D.update verts', len(verticesToUpdate))
         
         for v in verticesToUpdate:
             v.update(updateNor=updateNormals)
 
+    @profiler.timed('Object3D.calcNormals')
     def calcNormals(self, recalcVertexNormals=1, recalcFaceNormals=1, verticesToUpdate=None, facesToUpdate=None):
         """
         Updates the given vertex and/or face normals.
@@ -1206,6 +1403,102 @@ class Object3D(object):
         return 'object3D named: %s, nverts: %s, nfaces: %s, at |%s,%s,%s|' % (self.name, len(self.verts), len(self.faces), self.x, self.y, self.z)
 
 
+class Topology:
+
+    """
+    The parts of a mesh which do not change when it is morphed: the faces, face groups,
+    uv values, index buffer and the faces sharing each vertex. It only holds indices,
+    the objects created from it hold their own coordinates and normals and see them
+    through :py:class:`module3d.VertView` and :py:class:`module3d.FaceView` objects.
+    
+    .. py:attribute:: faceVerts
+    
+        The vertex indices of each face. ((int, ..), ..)
+        
+    .. py:attribute:: faceUvs
+    
+        The uv indices of each face, or None. ((int, ..), ..)
+        
+    .. py:attribute:: groups
+    
+        The name and face indices of each face group. ((str, (int, ..)), ..)
+        
+    .. py:attribute:: vertFaces
+    
+        The indices of the faces sharing each vertex. ((int, ..), ..)
+
+    :param obj: The object to take the topology from.
+    :type obj: :py:class:`module3d.Object3D`
+    """
+
+    def __init__(self, obj, indexBuffer, vertexBufferSize, vertBufferIndices, groupElements):
+
+        self.name = obj.name
+        self.path = getattr(obj, 'path', None)
+        self.vertsPerPrimitive = obj.vertsPerPrimitive
+        self.nVerts = len(obj.verts)
+        self.faceVerts = tuple([tuple([v.idx for v in f.verts]) for f in obj.faces])
+        self.faceUvs = tuple([f.uv and tuple(f.uv) for f in obj.faces])
+        self.faceMtls = tuple([getattr(f, 'mtl', '') for f in obj.faces])
+        self.groups = tuple([(g.name, tuple([f.idx for f in g.faces])) for g in obj.faceGroups])
+        self.vertFaces = tuple([tuple([f.idx for f in v.sharedFaces]) for v in obj.verts])
+        self.uvValues = obj.uvValues
+        self.indexBuffer = indexBuffer
+        self.vertexBufferSize = vertexBufferSize
+        self.vertBufferIndices = vertBufferIndices
+        self.groupElements = groupElements
+        self.__adjacency = None
+
+    def getAdjacency(self):
+        """
+        Returns the adjacency tables, built the first time they are needed.
+
+        :rtype: :py:class:`adjacency.Adjacency`
+        """
+        if not self.__adjacency:
+            self.__adjacency = adjacency.Adjacency(self.faceVerts, self.nVerts)
+        return self.__adjacency
+
+    def createObject(self, name=None, coords=None):
+        """
+        Creates an object with this topology.
+
+        :param name: The name of the object, the name of the original object if None.
+        :type name: str
+        :param coords: The vertex coordinates, the normals are calculated from them. All
+            vertices are at the origin if None.
+        :type coords: [(float, float, float), ..]
+        :return: The new object.
+        :rtype: :py:class:`module3d.Object3D`
+        """
+        obj = Object3D(name or self.name, self.vertsPerPrimitive)
+        obj.path = self.path
+        obj.uvValues = self.uvValues
+        obj.topology = self
+
+        if coords is None:
+            obj.coords = [[0.0, 0.0, 0.0] for i in xrange(self.nVerts)]
+        else:
+            obj.coords = [[co[0], co[1], co[2]] for co in coords]
+        obj.normals = [[0.0, 0.0, 0.0] for i in xrange(self.nVerts)]
+        obj.faceNormals = [[0.0, 0.0, 0.0] for i in xrange(len(self.faceVerts))]
+        obj.verts = verts = [VertView(obj, i) for i in xrange(self.nVerts)]
+
+        # Faces are in the order of their index, whatever group they are in
+        faces = [None] * len(self.faceVerts)
+        for groupName, groupFaces in self.groups:
+            fg = obj.createFaceGroup(groupName)
+            fg._FaceGroup__faces = [FaceView(obj, i, fg, tuple([verts[j] for j in self.faceVerts[i]])) for i in groupFaces]
+            for f in fg._FaceGroup__faces:
+                faces[f.idx] = f
+        obj.faces = faces
+
+        if coords is not None:
+            obj.calcNormals()
+        obj.updateIndexBuffer()
+
+        return obj
+
 class SelectionColorMap:
 
     """
@@ -0,0 +1,186 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+:Authors:
+    MakeHuman Team
+
+:Version: 1.0
+:Copyright: MakeHuman Team 2001-2012
+:License: GPL3
+
+Abstract
+--------
+
+This module contains named timers and counters for the code which runs on each
+modifier change: applying targets, recalculating normals, updating vertices, updating
+the subdivided mesh and the proxies, and exporting.
+
+Profiling is off by default. A timed function then only tests the module level
+enabled flag before calling the function it wraps. When profiling is on, each timer
+keeps the amount of calls, the total and the longest time, and each counter keeps a
+sum. The statistics can be shown in the Profiling settings task and written to a
+JSON file.
+
+Timers are added with the timed decorator or the timer context manager::
+
+    @profiler.timed('Object3D.calcNormals')
+    def calcNormals(self, ...):
+
+    with profiler.timer('export obj'):
+        ...
+
+Calls which are timed while another timed call is running are included in the time
+of both, so the times of different timers do not add up.
+"""
+
+__docformat__ = 'restructuredtext'
+
+import os
+import json
+import time
+import threading
+
+import mh
+
+enabled = False
+timers = {}    # name -> [calls, total seconds, longest seconds]
+counters = {}  # name -> sum
+
+lock = threading.Lock()
+
+def setEnabled(value):
+    """
+    Switches profiling on or off, the statistics gathered so far are kept.
+    """
+
+    global enabled
+
+    enabled = bool(value)
+
+def reset():
+    """
+    Forgets all statistics.
+    """
+
+    with lock:
+        timers.clear()
+        counters.clear()
+
+def addTime(name, seconds):
+
+    with lock:
+        timer = timers.get(name)
+        if timer is None:
+            timers[name] = [1, seconds, seconds]
+        else:
+            timer[0] += 1
+            timer[1] += seconds
+            if seconds > timer[2]:
+                timer[2] = seconds
+
+def count(name, amount=1):
+    """
+    Adds an amount to a counter if profiling is on.
+    """
+
+    if not enabled:
+        return
+    with lock:
+        counters[name] = counters.get(name, 0) + amount
+
+def timed(name):
+    """
+    Returns a decorator which times each call of a function under the given name.
+    """
+
+    def decorator(function):
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return function(*args, **kwargs)
+            started = time.time()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                addTime(name, time.time() - started)
+        wrapper.__name__ = function.__name__
+        wrapper.__doc__ = function.__doc__
+        wrapper.__dict__.update(function.__dict__)
+        return wrapper
+    return decorator
+
+class timer(object):
+
+    """
+    Times the statements in a with block under the given name.
+    """
+
+    def __init__(self, name):
+
+        self.name = name
+        self.started = None
+
+    def __enter__(self):
+
+        if enabled:
+            self.started = time.time()
+        return self
+
+    def __exit__(self, type, value, traceback):
+
+        if self.started is not None:
+            addTime(self.name, time.time() - self.started)
+            self.started = None
+        return False
+
+def getStats():
+    """
+    Returns the statistics gathered so far.
+
+    :return: For each timer the amount of calls and the total, mean and longest time
+        in seconds, and the sum of each counter.
+    :rtype: dict
+    """
+
+    with lock:
+        result = {
+            'timers': dict([(name, {
+                'calls': calls,
+                'total': total,
+                'mean': total / calls,
+                'max': longest
+                }) for name, (calls, total, longest) in timers.iteritems()]),
+            'counters': dict(counters)
+        }
+    return result
+
+def formatStats():
+    """
+    Returns the statistics as lines of text, the timers with the largest total first.
+    """
+
+    stats = getStats()
+    lines = []
+    for name, timer in sorted(stats['timers'].iteritems(), key=lambda item: -item[1]['total']):
+        lines.append('%s: %d calls, %.3f s, mean %.2f ms, max %.2f ms' %
+            (name, timer['calls'], timer['total'], timer['mean'] * 1000.0, timer['max'] * 1000.0))
+    for name, value in sorted(stats['counters'].iteritems()):
+        lines.append('%s: %d' % (name, value))
+    return lines
+
+def dump(path=None):
+    """
+    Writes the statistics as JSON, by default to profile.json in the user's home folder.
+
+    :return: The path of the written file.
+    :rtype: str
+    """
+
+    if path is None:
+        path = os.path.join(mh.getPath(''), 'profile.json')
+    stats = getStats()
+    stats['time'] = time.strftime('%Y-%m-%d %H:%M:%S')
+    f = open(path, 'w')
+    json.dump(stats, f, indent=1, sort_keys=True)
+    f.close()
+    return path
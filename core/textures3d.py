@@ -29,6 +29,13 @@ such as the 3D algorithms.
 
 __docformat__ = 'restructuredtext'
 
+import struct
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 
 def byteToBit(val, numdigits=8, base=2):
     """
@@ -214,3 +221,166 @@ def uvCooToBitmapIndex(TGAXres, TGAYres, U, V):
     return pixelIndex
 
 
+def readTGAArray(filename):
+    """
+    This function reads a TGA file into a numpy array of shape (height, width, channels).
+    Row 0 of the array is the top row of the image and the channels are in RGB or RGBA
+    order, or a single channel for grayscale images. Uncompressed (type 2 and 3) and run
+    length encoded (type 10 and 11) true color and grayscale images with 8, 24 or 32 bits
+    per pixel are supported. None is returned for other images.
+    
+    Parameters
+    ----------
+
+    filename:
+        *string*. The full file system path to the TGA file to be processed.
+    """
+
+    if numpy is None:
+        raise RuntimeError('numpy is needed to read TGA images into arrays')
+
+    try:
+        f = open(filename, 'rb')
+    except IOError, (errno, strerror):
+        print 'I/O error(%s): %s' % (errno, strerror)
+        return None
+    data = f.read()
+    f.close()
+
+    (lengthOfID, colorMapType, imageType, colorMapStart, colorMapLength, colorMapDepth,
+        xOrigin, yOrigin, width, height, pixelDepth, imageDescriptor) = struct.unpack('<BBBHHBHHHHBB', data[:18])
+
+    if colorMapType != 0 or imageType not in (2, 3, 10, 11):
+        print 'Image type %i not supported, only true color and grayscale images are' % imageType
+        return None
+
+    if pixelDepth not in (8, 24, 32):
+        print 'This module work only with 8, 24 or 32 bits images'
+        return None
+
+    bpp = pixelDepth / 8
+    numOfPixel = width * height
+    pixels = numpy.frombuffer(data, numpy.uint8, offset=18 + lengthOfID)
+
+    if imageType in (10, 11):
+        pixels = decodeTGARLE(pixels, numOfPixel, bpp)
+    else:
+        pixels = pixels[:numOfPixel * bpp]
+
+    if len(pixels) != numOfPixel * bpp:
+        print 'Truncated TGA file %s' % filename
+        return None
+
+    image = pixels.reshape((height, width, bpp))
+
+    # Bits 4 and 5 of the image descriptor give the origin of the image
+
+    if not imageDescriptor & 0x20:
+        image = image[::-1]
+    if imageDescriptor & 0x10:
+        image = image[:, ::-1]
+
+    # BGR(A) to RGB(A)
+
+    if bpp >= 3:
+        image = image[:, :, [2, 1, 0] + range(3, bpp)]
+
+    return numpy.ascontiguousarray(image)
+
+
+def decodeTGARLE(data, numOfPixel, bpp):
+    """
+    This function decodes the run length encoded pixel data of a TGA file into a flat
+    byte array. Only the packet headers are walked in Python, the pixels themselves
+    are gathered in one indexing operation.
+
+    Parameters
+    ----------
+
+    data:
+        *numpy.uint8 array*. The pixel data following the header.
+    numOfPixel:
+        *integer*. The number of pixels in the image.
+    bpp:
+        *integer*. The number of bytes per pixel.
+    """
+
+    headers = bytearray(data.tostring())
+    starts = []
+    counts = []
+    runs = []
+    offset = 0
+    decoded = 0
+    while decoded < numOfPixel and offset < len(headers):
+        header = headers[offset]
+        count = (header & 0x7f) + 1
+        starts.append(offset + 1)
+        counts.append(count)
+        if header & 0x80:
+            runs.append(True)
+            offset += 1 + bpp
+        else:
+            runs.append(False)
+            offset += 1 + count * bpp
+        decoded += count
+
+    starts = numpy.array(starts, dtype=numpy.intp)
+    counts = numpy.array(counts, dtype=numpy.intp)
+    runs = numpy.array(runs, dtype=bool)
+
+    # The position of each pixel within its packet, 0 for every pixel of a run
+
+    packetStarts = numpy.cumsum(counts) - counts
+    withinPacket = numpy.arange(counts.sum()) - numpy.repeat(packetStarts, counts)
+    withinPacket[numpy.repeat(runs, counts)] = 0
+
+    pixelOffsets = numpy.repeat(starts, counts) + withinPacket * bpp
+    pixelOffsets = pixelOffsets[:numOfPixel]
+    if len(pixelOffsets) and pixelOffsets[-1] + bpp > len(data):
+        return numpy.zeros(0, numpy.uint8)
+
+    byteOffsets = (pixelOffsets[:, numpy.newaxis] + numpy.arange(bpp)).ravel()
+    return data[byteOffsets]
+
+
+def uvToTexelIndices(width, height, uvs):
+    """
+    This function is the vectorized version of uvCooToBitmapIndex. It maps an array
+    of uv coordinates to (row, column) indices in an image array as returned by
+    readTGAArray, where v = 0 is the bottom row.
+
+    Parameters
+    ----------
+
+    width:
+        *integer*. The width of the image.
+    height:
+        *integer*. The height of the image.
+    uvs:
+        *array-like* of shape (n, 2). The uv coordinates.
+    """
+
+    uvs = numpy.asarray(uvs, dtype=numpy.float32).reshape((-1, 2))
+    columns = numpy.abs((width - 1) * uvs[:, 0]).astype(numpy.intp)
+    rows = numpy.abs((height - 1) * uvs[:, 1]).astype(numpy.intp)
+    numpy.clip(columns, 0, width - 1, columns)
+    numpy.clip(rows, 0, height - 1, rows)
+    return (height - 1 - rows, columns)
+
+
+def sampleUVs(image, uvs):
+    """
+    This function returns the texels of an image array, as returned by readTGAArray,
+    at an array of uv coordinates, as an array of shape (n, channels).
+
+    Parameters
+    ----------
+
+    image:
+        *numpy array*. The image of shape (height, width, channels).
+    uvs:
+        *array-like* of shape (n, 2). The uv coordinates.
+    """
+
+    rows, columns = uvToTexelIndices(image.shape[1], image.shape[0], uvs)
+    return image[rows, columns]
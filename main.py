@@ -83,7 +83,7 @@ sys.path=sys.path + recursiveDirNames("./apps")
 sys.path.append("./core")
 sys.path=sys.path + recursiveDirNames("./core")
 
-import glob, imp
+import glob, imp, time
 from os.path import join, basename, splitext
 
 import mh
@@ -95,6 +95,10 @@ import guimodelling, guifiles#, guirender
 from aljabr import centroid, vdist
 import algos3d
 import module3d
+import targetindex
+import modelindex
+import startup
+import profiler
 from math import tan, pi
 
 class Camera(events3d.EventHandler):
@@ -391,6 +395,8 @@ class PluginsTaskView(gui3d.TaskView):
 class MHApplication(gui3d.Application):
   
     def __init__(self):
+        self.startupLog = startup.StartupLog()
+        self.startupLog.beginPhase('init')
         gui3d.Application.__init__(self)
 
         self.modelCamera = Camera()
@@ -428,7 +434,10 @@ class MHApplication(gui3d.Application):
             'font':'arial',
             'language':'english',
             'excludePlugins':[],
-            'rtl': False
+            'rtl': False,
+            'undoMemory': 64,
+            'preloadThreads': 2,
+            'profiling': False
         }
         
         self.shortcuts = {
@@ -496,6 +505,7 @@ class MHApplication(gui3d.Application):
 
     def loadBackground(self):
 
+        self.startupLog.beginPhase('background')
         self.progressBar.setProgress(0.1)
 
         self.statusbar = self.addObject(gui3d.Object([0, 580, 9], gui3d.RectangleMesh(800, 32, self.getThemeResource("images", "lowerbar.png"))))
@@ -505,15 +515,27 @@ class MHApplication(gui3d.Application):
         
     def loadHuman(self):   
 
+        self.startupLog.beginPhase('human')
         self.progressBar.setProgress(0.2)
         #hairObj = hair.loadHairsFile(self.scene3d, path="./data/hairs/default", update = False)
         #self.scene3d.clear(hairObj) 
-        self.selectedHuman = self.addObject(human.Human(files3d.loadMesh("data/3dobjs/base.obj")))
+        self.selectedHuman = self.addObject(human.Human(files3d.loadMesh("data/3dobjs/base.obj", shared=True)))
+        targetindex.load()
+        
+        # Parse the targets and update the indexes while the GUI is built
+        self.preloader = startup.Preloader(self.settings['preloadThreads'], self.startupLog)
+        self.preloadedTargets = startup.getMacroTargets(self.selectedHuman)
+        for targetPath in self.preloadedTargets:
+            self.preloader.add(targetPath, startup.preloadTarget, self.selectedHuman.meshData, targetPath)
+        self.preloader.add('model index', modelindex.getModelIndex().updateFolder, mh.getPath('models'))
+        self.preloader.add('target index', targetindex.build, self.selectedHuman.meshData)
+        self.preloader.start()
         
         mh.callAsync(self.loadMainGui)
         
     def loadMainGui(self):
         
+        self.startupLog.beginPhase('main gui')
         self.progressBar.setProgress(0.3)
 
         self.tool = None
@@ -628,6 +650,7 @@ class MHApplication(gui3d.Application):
         
     def loadPlugins(self):
         
+        self.startupLog.beginPhase('plugins')
         self.progressBar.setProgress(0.4)
 
         # Load plugins not starting with _    
@@ -654,9 +677,11 @@ class MHApplication(gui3d.Application):
             try:
                 name, ext = splitext(basename(path))
                 if name not in self.settings['excludePlugins']:
+                    started = time.time()
                     module = imp.load_source(name, path)
                     self.modules[name] = module
                     module.load(self)
+                    self.startupLog.addPlugin(name, time.time() - started)
                 else:
                     self.modules[name] = None
             except Exception, e:
@@ -686,6 +711,7 @@ class MHApplication(gui3d.Application):
                 
     def loadGui(self):
         
+        self.startupLog.beginPhase('gui')
         self.progressBar.setProgress(0.9)
               
         category = self.getCategory('Settings')
@@ -742,7 +768,10 @@ class MHApplication(gui3d.Application):
                 
     def loadFinish(self):
         
+        self.startupLog.beginPhase('apply targets')
+        self.preloader.wait(self.preloadedTargets)
         self.selectedHuman.applyAllTargets(gui3d.app.progress)
+        self.startupLog.beginPhase('finish')
         self.selectedHuman.callEvent('onChanged', human.HumanEvent(self.selectedHuman, 'reset'))
         self.dialog = self.addView(gui3d.View())
         self.dialog.blocker = self.dialog.addObject(gui3d.Object([0, 0, 9.7], gui3d.RectangleMesh(800, 600)))
@@ -783,6 +812,8 @@ class MHApplication(gui3d.Application):
         mh.updatePickingBuffer();
         self.redraw()
         
+        self.startupLog.write()
+        
     # Events
     def onStart(self, event):
         
@@ -791,6 +822,7 @@ class MHApplication(gui3d.Application):
     def onStop(self, event):
         
         self.saveSettings()
+        targetindex.save()
         self.unloadPlugins()
         self.dumpMissingStrings()
         
@@ -872,12 +904,14 @@ class MHApplication(gui3d.Application):
             self.undoStack.append(action)
             del self.redoStack[:]
             print("do " + action.name)
+            self.trimUndoStack()
             self.redraw()
 
     def did(self, action):
         self.undoStack.append(action)
         del self.redoStack[:]
         print("did " + action.name)
+        self.trimUndoStack()
         self.redraw()
 
     def undo(self):
@@ -886,6 +920,7 @@ class MHApplication(gui3d.Application):
             print("undo " + action.name)
             action.undo()
             self.redoStack.append(action)
+            self.trimUndoStack()
             self.redraw()
 
     def redo(self):
@@ -894,7 +929,25 @@ class MHApplication(gui3d.Application):
             print("redo " + action.name)
             action.do()
             self.undoStack.append(action)
+            self.trimUndoStack()
             self.redraw()
+
+    def trimUndoStack(self):
+        """
+        Forgets the oldest undo steps while the mesh deltas of all steps use more
+        than the 'undoMemory' setting, in megabytes. The last step is always kept.
+        """
+
+        def nbytes(action):
+            delta = getattr(action, 'delta', None)
+            return delta.nbytes if delta else 0
+
+        budget = self.settings.get('undoMemory', 64) * 1024 * 1024
+        used = sum([nbytes(action) for action in self.undoStack + self.redoStack])
+        while used > budget and len(self.undoStack) > 1:
+            action = self.undoStack.pop(0)
+            used -= nbytes(action)
+            print("forget " + action.name)
             
     # Settings
             
@@ -910,6 +963,8 @@ class MHApplication(gui3d.Application):
             
         if 'language' in gui3d.app.settings:
             self.setLanguage(gui3d.app.settings['language'])
+
+        profiler.setEnabled(self.settings['profiling'])
         
         try:
             if os.path.isfile(os.path.join(mh.getPath(''), "shortcuts.ini")):
@@ -3,6 +3,8 @@
 # We need this for gui controls
 
 import gui3d
+import renderqueue
+
 class RenderingSettingTaskView(gui3d.TaskView):
 
     def __init__(self, category):
@@ -25,6 +27,16 @@ class RenderingSettingTaskView(gui3d.TaskView):
         def onChange(value):
             gui3d.app.settings['rendering_height'] = 0 if not value else int(value)
 
+        #Cores used by concurrent render jobs
+        coresBox = self.addView(gui3d.GroupBox([10, 170, 9.0], 'Render jobs', gui3d.GroupBoxStyle._replace(height=25+36*1+6)))
+        cpuCount = renderqueue.cpuCount()
+        self.cores = coresBox.addView(gui3d.Slider(value=gui3d.app.settings.get('rendering_cores', cpuCount), min=1,
+            max=max(cpuCount, 2), label = "Cores: %d"))
+
+        @self.cores.event
+        def onChange(value):
+            gui3d.app.settings['rendering_cores'] = int(value)
+
     def onHide(self, event):
 
         gui3d.TaskView.onHide(self, event)
@@ -0,0 +1,68 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# We need this for gui controls
+
+import gui3d
+import profiler
+
+class ProfilingTaskView(gui3d.TaskView):
+
+    def __init__(self, category):
+        gui3d.TaskView.__init__(self, category, 'Profiling')
+
+        self.profilingBox = self.addView(gui3d.GroupBox([10, 80, 9.0], 'Profiling', gui3d.GroupBoxStyle._replace(height=25+25*4+6)))
+        self.enableProfiling = self.profilingBox.addView(gui3d.CheckBox("Enable", gui3d.app.settings.get('profiling', False)))
+        self.refresh = self.profilingBox.addView(gui3d.Button("Refresh"))
+        self.reset = self.profilingBox.addView(gui3d.Button("Reset"))
+        self.save = self.profilingBox.addView(gui3d.Button("Save"))
+
+        self.stats = self.addView(gui3d.TextView(style=gui3d.TextViewStyle._replace(left=10, top=80+25+25*4+6+10, width=400)))
+
+        @self.enableProfiling.event
+        def onClicked(event):
+            gui3d.ToggleButton.onClicked(self.enableProfiling, event)
+            gui3d.app.settings['profiling'] = self.enableProfiling.selected
+            profiler.setEnabled(self.enableProfiling.selected)
+
+        @self.refresh.event
+        def onClicked(event):
+            self.updateStats()
+
+        @self.reset.event
+        def onClicked(event):
+            profiler.reset()
+            self.updateStats()
+
+        @self.save.event
+        def onClicked(event):
+            path = profiler.dump()
+            gui3d.app.prompt('Info', u'The profile has been saved to %s.' % path, 'OK')
+
+    def updateStats(self):
+
+        lines = profiler.formatStats()
+        if not lines:
+            lines = ['Nothing measured yet.' if profiler.enabled else 'Profiling is disabled.']
+        self.stats.setText('\n'.join(lines))
+
+    def onShow(self, event):
+
+        gui3d.TaskView.onShow(self, event)
+        self.enableProfiling.setFocus()
+        self.updateStats()
+
+    def onHide(self, event):
+
+        gui3d.TaskView.onHide(self, event)
+        gui3d.app.saveSettings()
+
+    def onResized(self, event):
+
+        pass
+
+def load(app):
+    category = app.getCategory('Settings')
+    taskview = category.addView(ProfilingTaskView(category))
+
+def unload(app):
+    pass
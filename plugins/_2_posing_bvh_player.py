@@ -31,6 +31,8 @@ from skeleton import Skeleton
 from math import pi
 import mh
 import mh2obj
+import mh2sequence
+import skinning
 
 '''
 bvhToMhMapping = {
@@ -118,24 +120,30 @@ class BvhView(gui3d.TaskView):
         self.bone = None
         
         self.__humanSkeleton = Skeleton()
+        self.__humanJoints = self.__humanSkeleton.getJoints()
+        self.__skinWeights = None
+        self.__restCoords = None
+        self.__restNormals = None
         
-        self.optionsBox = self.addView(gui3d.GroupBox([10, 80, 9.0], 'Options', gui3d.GroupBoxStyle._replace(height=24+25+36*1+24*2+6)))
+        self.optionsBox = self.addView(gui3d.GroupBox([10, 80, 9.0], 'Options', gui3d.GroupBoxStyle._replace(height=24+25+36*1+24*4+6)))
 
         self.frameSlider = self.optionsBox.addView(gui3d.Slider(value = 0, min = 0, max = self.__skeleton.frames, label = 'Frame: %d'))
         self.playPause = self.optionsBox.addView(gui3d.Button("Play"))
         self.showHuman = self.optionsBox.addView(gui3d.ToggleButton("Show human"))
         self.exportFrame = self.optionsBox.addView(gui3d.Button("Export frame"))
+        self.exportAnimation = self.optionsBox.addView(gui3d.Button("Export animation"))
+        self.pointCache = self.optionsBox.addView(gui3d.CheckBox("Point cache", False))
         
         @self.frameSlider.event
         def onChanging(value):
             self.__updateSkeletonMesh(value-1)
-            self.__updateHumanMesh(self.__humanSkeleton.root)
+            self.__updateHuman()
             gui3d.app.selectedHuman.meshData.update()
             
         @self.frameSlider.event
         def onChange(value):
             self.__updateSkeletonMesh(value-1)
-            self.__updateHumanMesh(self.__humanSkeleton.root)
+            self.__updateHuman()
             gui3d.app.selectedHuman.meshData.update()
                 
         @self.playPause.event
@@ -160,6 +168,10 @@ class BvhView(gui3d.TaskView):
         @self.exportFrame.event
         def onClicked(event):
             self.exportCurrentFrame()
+
+        @self.exportAnimation.event
+        def onClicked(event):
+            self.exportFrames(mh2sequence.PC2 if self.pointCache.selected else mh2sequence.OBJ)
                 
     def onFrameChanged(self):
         
@@ -180,6 +192,45 @@ class BvhView(gui3d.TaskView):
              
         mh2obj.exportObj(gui3d.app.selectedHuman.meshData, os.path.join(exportPath, 'bvh_frame_%d.obj' % self.frameSlider.getValue()))
             
+    def exportFrames(self, format=mh2sequence.OBJ, frames=None):
+        """
+        Exports the human posed at each frame of the clip, as an obj file per frame
+        or as an obj file and a point cache.
+        """
+
+        if not skinning.numpy:
+            gui3d.app.prompt('Error', 'Exporting an animation requires numpy.', 'OK')
+            return
+
+        exportPath = mh.getPath('exports')
+        if not os.path.exists(exportPath):
+            os.makedirs(exportPath)
+
+        if frames is None:
+            frames = range(self.__skeleton.frames)
+
+        human = gui3d.app.selectedHuman
+        exporter = mh2sequence.SequenceExporter(human.meshData, self.__skinWeights, self.__restCoords, self.__restNormals)
+        gui3d.app.progress(0.0, 'Exporting animation')
+        exporter.export(exportPath, 'bvh_animation', self.__getFrameMatrices(frames), format,
+            lambda written: gui3d.app.progress(float(written) / max(1, len(frames))))
+        gui3d.app.progress(1.0)
+
+        # Back to the pose of the current frame
+        self.__updateHuman()
+
+    def __getFrameMatrices(self, frames):
+
+        bvhJoints = [self.__skeleton.getJoint(mhToBvhMapping.get(joint.name, '')) for joint in self.__humanJoints]
+        for rotations in self.__skeleton.getRotations(frames):
+            for joint, bvhJoint in zip(self.__humanJoints, bvhJoints):
+                if bvhJoint:
+                    joint.rotation = rotations[bvhJoint.jointIndex].tolist()
+                else:
+                    joint.rotation = [0.0, 0.0, 0.0]
+                joint.calcTransform(False)
+            yield skinning.getJointMatrices(self.__humanJoints)
+
     def onShow(self, event):
 
         gui3d.TaskView.onShow(self, event)
@@ -189,6 +240,13 @@ class BvhView(gui3d.TaskView):
         
         gui3d.app.selectedHuman.storeMesh()
         self.__humanSkeleton.update(gui3d.app.selectedHuman.meshData)
+
+        if skinning.numpy:
+            human = gui3d.app.selectedHuman
+            if not self.__skinWeights:
+                self.__skinWeights = skinning.SkinWeights.fromJoints(self.__humanJoints, len(human.meshData.verts))
+            self.__restCoords = skinning.numpy.array(human.meshStored)
+            self.__restNormals = skinning.numpy.array(human.meshStoredNormals)
         
     def onHide(self, event):
 
@@ -255,6 +313,30 @@ class BvhView(gui3d.TaskView):
         self.__skeletonMesh.calcNormals()
         self.__skeletonMesh.update()
 
+    def __updateHuman(self):
+
+        if not skinning.numpy:
+            self.__updateHumanMesh(self.__humanSkeleton.root)
+            return
+
+        # Pose the joints, parents first, then skin all bound vertices at once
+        for joint in self.__humanJoints:
+            bvhName = mhToBvhMapping.get(joint.name, '')
+            if bvhName:
+                joint.rotation = self.__skeleton.getJoint(bvhName).rotation[:]
+            else:
+                joint.rotation = [0.0, 0.0, 0.0]
+            joint.calcTransform(False)
+
+        matrices = skinning.getJointMatrices(self.__humanJoints)
+        coords, normals = self.__skinWeights.skin(self.__restCoords, matrices, self.__restNormals)
+
+        verts = gui3d.app.selectedHuman.meshData.verts
+        bound = skinning.numpy.flatnonzero(self.__skinWeights.bound)
+        for i, co, no in zip(bound.tolist(), coords[bound].tolist(), normals[bound].tolist()):
+            verts[i].co = co
+            verts[i].no = no
+
     def __updateHumanMesh(self, joint, src=None, dst=None):
         
         # copy angles
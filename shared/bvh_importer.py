@@ -20,11 +20,77 @@ Abstract
 --------
 
 BVH importer
+
+The motion is kept in a single array with a row per frame and a column per channel,
+when numpy is available. bvhSkeleton.getTransforms evaluates the world transforms of
+all joints for any amount of frames at once, and updateFrame copies the transforms
+of one frame, computed once for the whole motion, into the joints.
 """
 
-from aljabr import vadd, makeUnit, degree2rad, makeTranslation, mmul, euler2matrix
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from aljabr import vadd, makeUnit, degree2rad, makeTranslation, mmul, euler2matrix, _AXES2TUPLE, _NEXT_AXIS
 from skeleton import Joint
 
+rotationChannels = ['Yrotation', 'Xrotation', 'Zrotation']
+translationChannels = ['Xposition', 'Yposition', 'Zposition']
+
+def eulerToMatrices(rotations, axes='sxyz'):
+    """
+    Returns an array of homogeneous rotation matrices from an array of Euler angles,
+    like aljabr.euler2matrix does for a single rotation.
+
+    :param rotations: The Euler angles, one row per rotation.
+    :type rotations: numpy.ndarray of shape (n, 3)
+    :param axes: The axis sequence.
+    :type axes: str
+    :return: The rotation matrices.
+    :rtype: numpy.ndarray of shape (n, 4, 4)
+    """
+
+    ai, aj, ak = rotations[:, 0], rotations[:, 1], rotations[:, 2]
+    firstaxis, parity, repetition, frame = _AXES2TUPLE[axes]
+    i = firstaxis
+    j = _NEXT_AXIS[i+parity]
+    k = _NEXT_AXIS[i-parity+1]
+
+    if frame:
+        ai, ak = ak, ai
+    if parity:
+        ai, aj, ak = -ai, -aj, -ak
+
+    si, sj, sk = numpy.sin(ai), numpy.sin(aj), numpy.sin(ak)
+    ci, cj, ck = numpy.cos(ai), numpy.cos(aj), numpy.cos(ak)
+    cc, cs = ci*ck, ci*sk
+    sc, ss = si*ck, si*sk
+
+    m = numpy.zeros((len(rotations), 4, 4))
+    m[:, 3, 3] = 1.0
+    if repetition:
+        m[:, i, i] = cj
+        m[:, i, j] = sj*si
+        m[:, i, k] = sj*ci
+        m[:, j, i] = sj*sk
+        m[:, j, j] = -cj*ss+cc
+        m[:, j, k] = -cj*cs-sc
+        m[:, k, i] = -sj*ck
+        m[:, k, j] = cj*sc+cs
+        m[:, k, k] = cj*cc-ss
+    else:
+        m[:, i, i] = cj*ck
+        m[:, i, j] = sj*sc-cs
+        m[:, i, k] = sj*cc+ss
+        m[:, j, i] = cj*sk
+        m[:, j, j] = sj*ss+cc
+        m[:, j, k] = sj*cs-sc
+        m[:, k, i] = -sj
+        m[:, k, j] = cj*si
+        m[:, k, k] = cj*ci
+    return m
+
 class bvhJoint(Joint):
   def __init__(self, name):
     Joint.__init__(self,name, [])
@@ -91,29 +157,108 @@ class bvhSkeleton:
         self.frames = int(items[1])
         items = self.__expectKeyword('Frame') # Time:
         self.frameTime = float(items[2])
-            
-        for i in range(self.frames):
-            line = self.file.readline()
-            items = line.split()
-            data = [float(item) for item in items]
-            data = self.__getChannelData(self.root, data)
+
+        # Joints in depth first order, parents before their children
+        self.joints = []
+        self.__listJoints(self.root)
+        self.channels = sum([len(joint.channels) for joint in self.joints])
+        self.motion = None
+        self.__transforms = None
+        self.__rotations = None
+        self.__jointNames = None
+
+        if numpy:
+            lines = [self.file.readline() for i in xrange(self.frames)]
+            self.motion = numpy.array(' '.join(lines).split(), dtype=numpy.float64).reshape(self.frames, self.channels)
+            for joint in self.joints:
+                joint.frames = self.motion[:, joint.channelIndex:joint.channelIndex + len(joint.channels)]
+        else:
+            for i in range(self.frames):
+                line = self.file.readline()
+                items = line.split()
+                data = [float(item) for item in items]
+                data = self.__getChannelData(self.root, data)
+
+        self.file.close()
+
+    def __listJoints(self, joint):
+
+        joint.jointIndex = len(self.joints)
+        joint.channelIndex = sum([len(j.channels) for j in self.joints])
+        self.joints.append(joint)
+        for child in joint.children:
+            self.__listJoints(child)
+
+    def __getColumns(self, joint, names):
+
+        return [joint.channelIndex + joint.channels.index(name) if name in joint.channels else -1 for name in names]
+
+    def getRotations(self, frames):
+        """
+        Returns the Y, X and Z rotation of each joint in radians, as stored in the
+        rotation attribute of the joints by updateFrame.
+
+        :param frames: The frame indices.
+        :type frames: numpy.ndarray of int
+        :return: The rotations.
+        :rtype: numpy.ndarray of shape (len(frames), len(self.joints), 3)
+        """
+
+        motion = self.motion[frames]
+        rotations = numpy.zeros((len(frames), len(self.joints), 3))
+        for joint in self.joints:
+            for axis, column in enumerate(self.__getColumns(joint, rotationChannels)):
+                if column >= 0:
+                    rotations[:, joint.jointIndex, axis] = motion[:, column] * degree2rad
+        return rotations
+
+    def getTransforms(self, frames=None, scale=0.10):
+        """
+        Evaluates the world transform of every joint for the given frames. Frames
+        outside of the motion give the rest pose.
+
+        :param frames: The frame indices, all frames if None.
+        :type frames: [int, ..] or numpy.ndarray of int
+        :param scale: The scale of the translation channels.
+        :type scale: float
+        :return: The row-major transforms, in the order of self.joints.
+        :rtype: numpy.ndarray of shape (len(frames), len(self.joints), 4, 4)
+        """
+
+        if frames is None:
+            frames = numpy.arange(self.frames)
+        frames = numpy.atleast_1d(numpy.asarray(frames, dtype=numpy.int32))
+        valid = (frames >= 0) & (frames < self.frames)
+        rotations = self.getRotations(numpy.where(valid, frames, 0))
+        motion = self.motion[numpy.where(valid, frames, 0)]
+
+        transforms = numpy.empty((len(frames), len(self.joints), 4, 4))
+        for joint in self.joints:
+            if joint.channels:
+                local = eulerToMatrices(rotations[:, joint.jointIndex], 'syxz')
+                for axis, column in enumerate(self.__getColumns(joint, translationChannels)):
+                    if column >= 0:
+                        local[:, axis, 3] = motion[:, column] * scale
+                local[~valid] = numpy.identity(4)
+            else:
+                local = numpy.tile(numpy.identity(4), (len(frames), 1, 1))
+            local[:, :3, 3] += joint.offset
+
+            if joint.parent:
+                transforms[:, joint.jointIndex] = numpy.matmul(transforms[:, joint.parent.jointIndex], local)
+            else:
+                transforms[:, joint.jointIndex] = local
+
+        return transforms
                 
     def getJoint(self, name):
         
-        return self.__getJoint(self.root, name)
-        
-    def __getJoint(self, joint, name):
+        if self.__jointNames is None:
+            self.__jointNames = {}
+            for joint in reversed(self.joints):
+                self.__jointNames[joint.name] = joint
+        return self.__jointNames.get(name)
         
-        if joint.name == name:
-            return joint
-            
-        for child in joint.children:
-            j = self.__getJoint(child, name)
-            if j:
-                return j
-                
-        return None
-                
     def __readJoint(self, joint, scale=0.25):
         
         self.__expectKeyword('{')
@@ -189,4 +334,23 @@ class bvhSkeleton:
         return data
         
     def updateFrame(self, frame, scale = 0.25):
-        self.root.updateFrame(frame)
\ No newline at end of file
+
+        if not numpy:
+            self.root.updateFrame(frame)
+            return
+
+        # bvhJoint.updateFrame scales the translation channels by 0.10
+        if self.__transforms is None:
+            self.__transforms = self.getTransforms(None, 0.10)
+            self.__rotations = self.getRotations(numpy.arange(self.frames))
+
+        if frame >= 0 and frame < self.frames:
+            transforms = self.__transforms[frame]
+            rotations = self.__rotations[frame]
+            for joint in self.joints:
+                joint.rotation = rotations[joint.jointIndex].tolist()
+                joint.transform = transforms[joint.jointIndex].ravel().tolist()
+        else:
+            transforms = self.getTransforms([-1], 0.10)[0]
+            for joint in self.joints:
+                joint.transform = transforms[joint.jointIndex].ravel().tolist()
\ No newline at end of file
@@ -35,7 +35,10 @@ import subprocess
 #import hair
 import time
 import math
+import threading
+import weakref
 import gui3d
+import renderqueue
 
 class Shader(object):
 
@@ -324,6 +327,76 @@ class RMRLight:
         self.shadowTranslate(ribfile, -self.position[0], -self.position[1], -self.position[2])
 
 
+class RMRTopology:
+
+    """
+    The part of a sub object that only depends on the mesh topology: the
+    faces belonging to one material, the remap of their vertices to a compact
+    sub object vertex list, and the already formatted nverts, vertex index and
+    facevarying st arrays. Instances are cached per mesh by getTopology, so
+    only the vertex positions need to be written again on each render.
+    """
+
+    def __init__(self, meshData, mtl=None):
+
+        if mtl is not None:
+            faces = [face for face in meshData.faces if face.mtl == mtl]
+        else:
+            faces = meshData.faces
+
+        # Create a translation table, in case of the obj is only a part of a bigger mesh.
+        # Using the translation table, we will create a new vert list for the sub object
+        translationTable = {}
+        self.vertIndices = []
+        nverts = []
+        indices = []
+        st = []
+        uvValues = meshData.uvValues
+        for face in faces:
+            faceIdx = [(vert.idx, face.uv[index]) for index, vert in enumerate(face.verts)]
+            for vertIndex, uvIdx in faceIdx:
+                if vertIndex not in translationTable:
+                    translationTable[vertIndex] = len(self.vertIndices)
+                    self.vertIndices.append(vertIndex)
+            # Renderman expects the opposite winding
+            faceIdx.reverse()
+            if faceIdx[0] == faceIdx[-1]:
+                faceIdx = faceIdx[:-1]
+            nverts.append('%i ' % len(faceIdx))
+            indices.append(' '.join(['%i' % translationTable[vertIndex] for vertIndex, uvIdx in faceIdx]) + ' ')
+            for vertIndex, uvIdx in faceIdx:
+                uvValue = uvValues[uvIdx]
+                st.append('%s %s ' % (uvValue[0], 1 - uvValue[1]))
+
+        self.nverts = ''.join(nverts)
+        self.indices = ''.join(indices)
+        self.st = ''.join(st)
+        self.faceCount = len(nverts)
+
+    def formatPoints(self, verts):
+        """
+        Formats the "P" array of the sub object from the current coordinates of the mesh.
+        """
+
+        return ''.join(['%f %f %f ' % (co[0], co[1], -co[2]) for co in [verts[i].co for i in self.vertIndices]])
+
+topologyCache = weakref.WeakKeyDictionary()
+
+def getTopology(meshData, mtl=None):
+    """
+    Returns the cached RMRTopology of the faces of meshData with material mtl,
+    building it if the mesh was not seen before or its topology changed.
+    """
+
+    key = (len(meshData.verts), len(meshData.faces), len(meshData.uvValues or []))
+    cached = topologyCache.get(meshData)
+    if cached is None or cached[0] != key:
+        cached = topologyCache[meshData] = (key, {})
+    topologies = cached[1]
+    if mtl not in topologies:
+        topologies[mtl] = RMRTopology(meshData, mtl)
+    return topologies[mtl]
+
 class RMRObject:
 
     def __init__(self, name, meshData, mtl=None):
@@ -332,73 +405,31 @@ class RMRObject:
         self.material = None
         self.materialBump = None
         self.name = name
-        self.facesIndices = []
-        self.verts = meshData.verts
         self.meshData = meshData
-        self.translationTable = [0 for vert in meshData.verts]        
-        self.verts = []
-
-        if mtl is not None:
-            self.facesIndices = [[(vert.idx,face.uv[index]) for index, vert in enumerate(face.verts)] for face in meshData.faces if face.mtl == mtl]
-        else:
-            self.facesIndices = [[(vert.idx,face.uv[index]) for index, vert in enumerate(face.verts)] for face in meshData.faces]
-        
-        #Create a translation table, in case of the obj is only a part of a bigger mesh.
-        #Using the translation table, we will create a new vert list for the sub object        
-        processedVerts = set()
-        idx = 0
-        for f in self.facesIndices:
-            for i in f:
-                vertIndex = i[0]                
-                if vertIndex not in processedVerts:                    
-                    self.translationTable[vertIndex] = idx
-                    idx += 1
-                    processedVerts.add(vertIndex)
-                    self.verts.append(meshData.verts[vertIndex])
-  
-        
-
-
-
-
+        self.topology = getTopology(meshData, mtl)
 
     def writeRibCode(self, ribPath ):
 
         #print "ribPath = ", ribPath
-        facesUVvalues = self.meshData.uvValues #TODO usa direttamente self.
+        if not self.topology.faceCount: raise RuntimeError(self.name)
 
         ribObjFile = file(ribPath, 'w')
         ribObjFile.write('Declare "st" "facevarying float[2]"\n')
         ribObjFile.write('Declare "Cs" "facevarying color"\n')
         ribObjFile.write('SubdivisionMesh "catmull-clark" [')
-
-        if not self.facesIndices: raise RuntimeError(self.name)
-
-        for faceIdx in self.facesIndices:
-            ribObjFile.write('%i ' % (3 if faceIdx[0] == faceIdx[-1] else 4))
+        ribObjFile.write(self.topology.nverts)
         ribObjFile.write('] ')
 
         ribObjFile.write('[')
-        for faceIdx in self.facesIndices:
-            faceIdx.reverse()
-            if faceIdx[0] == faceIdx[-1]:
-                ribObjFile.write('%i %i %i ' % (self.translationTable[faceIdx[0][0]], self.translationTable[faceIdx[1][0]], self.translationTable[faceIdx[2][0]]))
-            else:
-                ribObjFile.write('%i %i %i %i ' % (self.translationTable[faceIdx[0][0]], self.translationTable[faceIdx[1][0]], self.translationTable[faceIdx[2][0]], self.translationTable[faceIdx[3][0]]))
+        ribObjFile.write(self.topology.indices)
         ribObjFile.write(']')
 
         ribObjFile.write('''["interpolateboundary"] [0 0] [] []"P" [''')
-        for vert in self.verts:
-            ribObjFile.write('%f %f %f ' % (vert.co[0], vert.co[1], -vert.co[2]))
+        ribObjFile.write(self.topology.formatPoints(self.meshData.verts))
         ribObjFile.write('] ')
 
         ribObjFile.write('\n"st" [')
-        for faceIdx in self.facesIndices:
-            face = faceIdx[:-1] if faceIdx[0] == faceIdx[-1] else faceIdx
-            for idx in face:
-                uvIdx = idx[1]
-                uvValue = facesUVvalues[uvIdx]
-                ribObjFile.write('%s %s ' % (uvValue[0], 1 - uvValue[1]))
+        ribObjFile.write(self.topology.st)
         ribObjFile.write(']')
         ribObjFile.close()
 
@@ -737,11 +768,17 @@ class RMRScene:
 
 
 
-    def writeSceneFile(self):
+    def writeSceneFile(self, sceneFileName=None, rotation=None):
         """
         This function creates the frame definition for a Renderman scene.
+        The rotation optionally overrides the x and y rotation of the human,
+        so that several views can be written and rendered at once.
         """
         self.renderResult = str(time.time())+".tif"
+        if sceneFileName is None:
+            sceneFileName = self.sceneFileName
+        else:
+            self.renderResult = os.path.splitext(os.path.basename(sceneFileName))[0] + "_" + self.renderResult
 
 
         #Getting global settings
@@ -767,7 +804,9 @@ class RMRScene:
 
 
         pos = self.humanCharacter.getHumanPosition()        
-        ribfile = file(self.sceneFileName, 'w')
+        if rotation is not None:
+            pos = (pos[0], pos[1], rotation[0], rotation[1])
+        ribfile = file(sceneFileName, 'w')
 
         #Write rib header
         ribSceneHeader.writeRibCode(ribfile)
@@ -783,6 +822,8 @@ class RMRScene:
         ribfile.write('WorldEnd\n')
         ribfile.close()
 
+        return os.path.join(self.ribsPath, self.renderResult).replace('\\', '/')
+
 
     #def writeSkinBakeFile(self):
         #"""
@@ -889,94 +930,53 @@ class RMRScene:
 
 
 
-    def render(self):
+    def render(self, views=None):
+        """
+        Writes the scene and renders it with Aqsis in the background.
+        If views, a list of (x, y) human rotations, is given, a scene file
+        is written and rendered for every view, concurrently within the
+        'rendering_cores' budget.
+        """
         
         imgLight = ImageLight()
         imgLight.projectLighting()
 
-        filesTorender = []
         self.loadLighting(self.lightsFolderPath, "default.lights")
         #self.writeTextureFile() #TODO move in the init
 
-        ##recalculateAll = 0
-        #recalculateSSS = 0
-
-        #recalculateAll = 1
-        #if  recalculateAll == 1:
-            #self.writeWorldFile(self.worldFileName+"bake.rib", bakeMode = 1)
-            #self.writeSkinBakeFile()
-            #filesTorender.append((self.bakeFilename, 'Calculating SSS'))
-
         self.writeWorldFile(self.worldFileName)
-        self.writeSceneFile()
-        filesTorender.append((self.sceneFileName, 'Rendering scene'))
-
-        renderThread = RenderThread(self.app, filesTorender)
-        renderThread.renderPath = os.path.join(self.ribsPath, self.renderResult).replace('\\', '/')
-        renderThread.start()
-
-from threading import Thread
-
-class RenderThread(Thread):
-
-    def __init__(self, app, filenames):
-
-        Thread.__init__(self)
-        self.app = app
-        self.filenames = filenames
-        self.renderPath = ""
-
-    def run(self):
-        
-        for filename, status in self.filenames:
-            command = '%s "%s"' % ('aqsis -Progress', filename)            
-            renderProc = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE, universal_newlines=True)
-
-            mh.callAsync(lambda:self.app.progress(0.0, status))
-
-            try:
-                while True:
-                    line = renderProc.stdout.readline()
-                    if line == '':
-                        break
-                   
-                    progress = line.split()[1][0:-1]
-                    mh.callAsync(lambda:self.app.progress(float(progress)/100.0))
-            except:
-                pass
-
-            mh.callAsync(lambda:self.app.progress(1.0))
-            
-        gui3d.app.prompt("Render finished", "The image is saved in {0}".format(self.renderPath), "OK", helpId="'renderFinishedPrompt'")
-            
-            
-
 
+        if views is None:
+            filesTorender = [(self.sceneFileName, self.writeSceneFile())]
+        else:
+            filesTorender = []
+            for index, rotation in enumerate(views):
+                sceneFileName = os.path.join(self.ribsPath, "scene_%03d.rib" % index)
+                filesTorender.append((sceneFileName, self.writeSceneFile(sceneFileName, rotation)))
+
+        queue = renderqueue.getRenderQueue(self.app)
+        jobs = []
+        renderPaths = [renderPath for filename, renderPath in filesTorender]
+        # Jobs finish on their own worker threads, only the last one reports
+        finished = [0]
+        finishedLock = threading.Lock()
         
-        """
-        for filename in self.filenames:
-            command = '%s "%s"' % ('aqsis -progress -progressformat="progress %f %p %s %S" -v 0', filename[0])
-            renderProc = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE, universal_newlines=True)
-            
-            #for line in renderProc.stdout:
-              #pass
-              
-            #print "Rendering finished ", renderProc.stdout
-        """
-            
-        """
-        for filename, status in self.filenames:
-
-            command = '%s "%s"' % ('aqsis -progress -progressformat="progress %f %p %s %S" -v 0', filename)
-            #print command
-            renderProc = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE, universal_newlines=True)
-
-            mh.callAsync(lambda:self.app.progress(0.0, status))
-
-            for line in renderProc.stdout:
-              if line.startswith("progress"):
-                progress = line.split()
-                mh.callAsync(lambda:self.app.progress(float(progress[2])/100.0))
-
+        def onFinished(job):
+            with finishedLock:
+                finished[0] += 1
+                if finished[0] != len(jobs):
+                    return
             mh.callAsync(lambda:self.app.progress(1.0))
-        """
+            if [job for job in jobs if job.state != renderqueue.FINISHED]:
+                mh.callAsync(lambda:self.app.prompt("Render failed", "Aqsis did not finish rendering.", "OK"))
+            else:
+                mh.callAsync(lambda:self.app.prompt("Render finished", "The image is saved in {0}".format(', '.join(renderPaths)), "OK", helpId="'renderFinishedPrompt'"))
+
+        mh.callAsync(lambda:self.app.progress(0.0, 'Rendering scene'))
+        for filename, renderPath in filesTorender:
+            job = renderqueue.RenderJob(['aqsis', '-Progress', filename], cwd=self.ribsPath,
+                progressParser=renderqueue.parseAqsisProgress, callback=onFinished)
+            jobs.append(job)
+        for job in jobs:
+            queue.submit(job)
+        return jobs
@@ -0,0 +1,320 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Render job scheduling.
+
+**Project Name:**      MakeHuman
+
+**Product Home Page:** http://www.makehuman.org/
+
+**Code Home Page:**    http://code.google.com/p/makehuman/
+
+**Authors:**           MakeHuman Team
+
+**Copyright(c):**      MakeHuman Team 2001-2012
+
+**Licensing:**         GPL3 (see also http://sites.google.com/site/makehumandocs/licensing)
+
+**Coding Standards:**  See http://sites.google.com/site/makehumandocs/developers-guide
+
+Abstract
+--------
+
+This module implements a queue which runs external renderers (Aqsis, POV-Ray, Mitsuba)
+as background jobs. Several jobs, for example the frames of a turntable or the views of
+a character, run at the same time as long as the sum of the cores they claim stays
+within the core budget of the queue. Each job keeps its own progress, state and
+timings, jobs can depend on other jobs, and queued or running jobs can be cancelled.
+
+The application wide queue is obtained with getRenderQueue, its core budget is the
+'rendering_cores' setting.
+"""
+
+import os
+import re
+import subprocess
+import threading
+import time
+
+import mh
+
+QUEUED, RUNNING, FINISHED, FAILED, CANCELLED = range(5)
+
+stateNames = ['queued', 'running', 'finished', 'failed', 'cancelled']
+
+percentRegex = re.compile(r'(\d+(?:\.\d+)?)%')
+
+def cpuCount():
+
+    try:
+        import multiprocessing
+        return multiprocessing.cpu_count()
+    except (ImportError, NotImplementedError):
+        return 1
+
+def parseAqsisProgress(line):
+    """
+    Parses a line written by aqsis -Progress and returns the progress as a value
+    between 0 and 1, or None if the line does not contain progress information.
+    """
+
+    try:
+        return float(line.split()[1][0:-1]) / 100.0
+    except (IndexError, ValueError):
+        return None
+
+def parsePercentProgress(line):
+    """
+    Returns the last percentage found in a line of renderer output, as written by
+    POV-Ray and the Mitsuba console renderer, as a value between 0 and 1, or None.
+    """
+
+    match = percentRegex.findall(line)
+    if match:
+        return float(match[-1]) / 100.0
+    return None
+
+class RenderJob(object):
+
+    """
+    An external renderer process.
+
+    :param args: The command line, as a list of arguments.
+    :type args: [str, ..]
+    :param cwd: The working directory of the renderer.
+    :type cwd: str
+    :param name: The name, shown in the progress bar.
+    :type name: str
+    :param cores: The amount of cores this job uses.
+    :type cores: int
+    :param progressParser: A function returning the progress from a line of output, or None.
+    :type progressParser: function
+    :param dependencies: The jobs which need to finish successfully before this job starts.
+    :type dependencies: [:py:class:`renderqueue.RenderJob`, ..]
+    :param callback: Called from the worker thread with the job when the job ends.
+    :type callback: function
+    """
+
+    def __init__(self, args, cwd=None, name=None, cores=1, progressParser=None, dependencies=None, callback=None):
+
+        self.args = args
+        self.cwd = cwd
+        self.name = name or os.path.basename(args[-1])
+        self.cores = max(1, cores)
+        self.progressParser = progressParser
+        self.dependencies = dependencies or []
+        self.callback = callback
+
+        self.state = QUEUED
+        self.progress = 0.0
+        self.returnCode = None
+        self.process = None
+        self.queueTime = time.time()
+        self.startTime = None
+        self.endTime = None
+
+    def __str__(self):
+
+        return 'render job %s, %s, %.2f' % (self.name, stateNames[self.state], self.progress)
+
+    @property
+    def done(self):
+        return self.state in (FINISHED, FAILED, CANCELLED)
+
+    @property
+    def elapsed(self):
+        if self.startTime is None:
+            return 0.0
+        return (self.endTime or time.time()) - self.startTime
+
+    @property
+    def waited(self):
+        return (self.startTime or time.time()) - self.queueTime
+
+class RenderJobThread(threading.Thread):
+
+    def __init__(self, queue, job):
+
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.queue = queue
+        self.job = job
+
+    def run(self):
+
+        job = self.job
+        try:
+            job.process = subprocess.Popen(job.args, cwd=job.cwd, stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT, universal_newlines=True)
+        except OSError, e:
+            print('Could not start %s: %s' % (job.args[0], e))
+            self.queue._finish(job, FAILED)
+            return
+
+        if job.state == CANCELLED:
+            job.process.terminate()
+
+        for line in iter(job.process.stdout.readline, ''):
+            if job.progressParser:
+                progress = job.progressParser(line)
+                if progress is not None:
+                    job.progress = min(max(progress, 0.0), 1.0)
+                    self.queue._progress(job)
+
+        job.returnCode = job.process.wait()
+        job.process.stdout.close()
+        if job.state == CANCELLED:
+            self.queue._finish(job, CANCELLED)
+        elif job.returnCode == 0:
+            self.queue._finish(job, FINISHED)
+        else:
+            self.queue._finish(job, FAILED)
+
+class RenderQueue(object):
+
+    """
+    Runs render jobs concurrently within a core budget.
+
+    :param cores: The amount of cores the jobs may use at once, all cores if None.
+    :type cores: int
+    :param onProgress: Called with the queue whenever the progress of a job changes.
+    :type onProgress: function
+    """
+
+    def __init__(self, cores=None, onProgress=None):
+
+        self.cores = cores or cpuCount()
+        self.onProgress = onProgress
+        self.jobs = []
+        self.__usedCores = 0
+        self.__lock = threading.RLock()
+        self.__idle = threading.Condition(self.__lock)
+
+    def submit(self, job):
+        """
+        Queues a job and starts it as soon as its dependencies finished and enough cores are free.
+
+        :param job: The job.
+        :type job: :py:class:`renderqueue.RenderJob`
+        :return: The job.
+        :rtype: :py:class:`renderqueue.RenderJob`
+        """
+
+        with self.__lock:
+            self.jobs.append(job)
+            self.__schedule()
+        return job
+
+    def cancel(self, job):
+        """
+        Cancels a queued or running job, and the jobs depending on it.
+        """
+
+        with self.__lock:
+            if job.state == QUEUED:
+                self._finish(job, CANCELLED)
+            elif job.state == RUNNING:
+                job.state = CANCELLED
+                try:
+                    job.process.terminate()
+                except (AttributeError, OSError):
+                    pass
+
+    def cancelAll(self):
+
+        with self.__lock:
+            for job in self.jobs[:]:
+                self.cancel(job)
+
+    def wait(self, jobs=None):
+        """
+        Blocks until the given jobs, or all jobs, are done.
+        """
+
+        with self.__lock:
+            while [job for job in (jobs or self.jobs) if not job.done]:
+                self.__idle.wait(0.5)
+
+    def clear(self):
+        """
+        Forgets the jobs which are done.
+        """
+
+        with self.__lock:
+            self.jobs = [job for job in self.jobs if not job.done]
+
+    @property
+    def progress(self):
+        """
+        The average progress of all jobs which were not cancelled.
+        """
+
+        jobs = [job for job in self.jobs if job.state != CANCELLED]
+        if not jobs:
+            return 1.0
+        return sum([1.0 if job.done else job.progress for job in jobs]) / len(jobs)
+
+    @property
+    def running(self):
+        return [job for job in self.jobs if job.state == RUNNING]
+
+    def report(self):
+        """
+        Returns a line per job with its state and timings.
+        """
+
+        return ['%-24s %-10s %5.1f%% queued %.1fs running %.1fs' % (job.name, stateNames[job.state],
+            job.progress * 100.0, job.waited, job.elapsed) for job in self.jobs]
+
+    def __schedule(self):
+
+        for job in self.jobs:
+            if job.state != QUEUED:
+                continue
+            if [dep for dep in job.dependencies if dep.state in (FAILED, CANCELLED)]:
+                self._finish(job, CANCELLED)
+                continue
+            if [dep for dep in job.dependencies if dep.state != FINISHED]:
+                continue
+            # A job claiming more cores than the budget runs on its own
+            if self.__usedCores and self.__usedCores + job.cores > self.cores:
+                continue
+            job.state = RUNNING
+            job.startTime = time.time()
+            self.__usedCores += job.cores
+            RenderJobThread(self, job).start()
+
+    def _progress(self, job):
+
+        if self.onProgress:
+            self.onProgress(self)
+
+    def _finish(self, job, state):
+
+        with self.__lock:
+            if job.state == RUNNING or (job.state == CANCELLED and job.startTime is not None and job.endTime is None):
+                self.__usedCores -= job.cores
+            job.state = state
+            job.endTime = time.time()
+            if state == FINISHED:
+                job.progress = 1.0
+            self.__schedule()
+            self.__idle.notifyAll()
+        if job.callback:
+            job.callback(job)
+        self._progress(job)
+
+renderQueue = None
+
+def getRenderQueue(app):
+    """
+    Returns the application wide render queue, reporting its progress in the progress bar.
+    """
+
+    global renderQueue
+
+    if not renderQueue:
+        renderQueue = RenderQueue(onProgress=lambda queue: mh.callAsync(lambda:app.progress(queue.progress)))
+    renderQueue.cores = app.settings.get('rendering_cores', cpuCount())
+    return renderQueue
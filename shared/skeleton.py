@@ -138,6 +138,21 @@ class Skeleton:
     def getJoint(self, name):
         
         return self.__getJoint(self.root, name)
+
+    def getJoints(self):
+        """
+        Returns all joints, each parent before its children.
+        """
+
+        joints = []
+        self.__getJoints(self.root, joints)
+        return joints
+
+    def __getJoints(self, joint, joints):
+
+        joints.append(joint)
+        for child in joint.children:
+            self.__getJoints(child, joints)
             
     def __getJoint(self, joint, name):
         
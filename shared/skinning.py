@@ -0,0 +1,294 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Skinning of the human mesh.
+
+**Project Name:**      MakeHuman
+
+**Product Home Page:** http://www.makehuman.org/
+
+**Code Home Page:**    http://code.google.com/p/makehuman/
+
+**Authors:**           MakeHuman Team
+
+**Copyright(c):**      MakeHuman Team 2001-2012
+
+**Licensing:**         GPL3 (see also http://sites.google.com/site/makehumandocs/licensing)
+
+**Coding Standards:**  See http://sites.google.com/site/makehumandocs/developers-guide
+
+Abstract
+--------
+
+This module poses a mesh from bone transforms. Each vertex is bound to at most a few
+bones, stored as an array of bone indices and an array of weights with a row per
+vertex. The weights come from the weights sections of the rigs in data/rigs, or from
+the vertices bound to each joint of the default skeleton in data/joint-bindings.txt.
+
+The posed coordinates of all vertices, for one or many frames, are computed with linear
+blend skinning, or with dual quaternion skinning which keeps the volume of twisting
+joints. The bone transforms passed to the skinning functions are skinning matrices,
+which map the rest position of a vertex to its posed position, as returned by
+getSkinningMatrices.
+"""
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+LINEAR, DUAL_QUATERNION = range(2)
+
+def readRigWeights(filename):
+    """
+    Reads the weights sections of a rig file.
+
+    :param filename: The path of the rig file.
+    :type filename: str
+    :return: The vertex indices and weights of each bone.
+    :rtype: dict of str to [(int, float), ..]
+    """
+
+    weights = {}
+    wts = None
+    f = open(filename, 'rU')
+    for line in f:
+        words = line.split()
+        if not words:
+            continue
+        if words[0] == '#':
+            if len(words) > 2 and words[1] == 'weights':
+                wts = weights.setdefault(words[2], [])
+            else:
+                wts = None
+        elif wts is not None:
+            wts.append((int(words[0]), float(words[1])))
+    f.close()
+    return weights
+
+def getSkinningMatrices(posed, rest):
+    """
+    Returns the transforms which move vertices from the rest pose of the bones to their
+    posed position, that is posed * inverse(rest).
+
+    :param posed: The posed transforms of the bones, for one or more frames.
+    :type posed: numpy.ndarray of shape (..., bones, 4, 4)
+    :param rest: The rest transforms of the bones.
+    :type rest: numpy.ndarray of shape (bones, 4, 4)
+    :rtype: numpy.ndarray of the shape of posed
+    """
+
+    return numpy.matmul(posed, numpy.linalg.inv(rest))
+
+def getJointMatrices(joints):
+    """
+    Returns the skinning matrices of skeleton.Joint objects after calcTransform, which
+    rotate the vertices bound to a joint around the joint position, like the BVH player.
+
+    :param joints: The joints, in the order of the bones of the SkinWeights.
+    :type joints: [:py:class:`skeleton.Joint`, ..]
+    :rtype: numpy.ndarray of shape (joints, 4, 4)
+    """
+
+    matrices = numpy.array([joint.transform for joint in joints], dtype=numpy.float64).reshape(len(joints), 4, 4)
+    positions = numpy.array([joint.position for joint in joints], dtype=numpy.float64)
+    matrices[:, :3, 3] -= numpy.einsum('bij,bj->bi', matrices[:, :3, :3], positions)
+    return matrices
+
+class SkinWeights:
+
+    """
+    The bone indices and weights of the vertices of a mesh.
+
+    :param nVerts: The amount of vertices.
+    :type nVerts: int
+    :param bones: The bone names, in the order of the skinning matrices.
+    :type bones: [str, ..]
+    :param weights: The vertex indices and weights of each bone.
+    :type weights: dict of str to [(int, float), ..]
+    :param maxInfluences: The maximum amount of bones per vertex, the bones with the
+        lowest weights are dropped.
+    :type maxInfluences: int
+    """
+
+    def __init__(self, nVerts, bones, weights, maxInfluences=4):
+
+        if not numpy:
+            raise RuntimeError('Skinning requires numpy')
+
+        self.bones = list(bones)
+
+        influences = [[] for i in xrange(nVerts)]
+        for bone, index in zip(self.bones, xrange(len(self.bones))):
+            for vindex, weight in weights.get(bone, []):
+                if vindex < nVerts and weight > 0.0:
+                    influences[vindex].append((weight, index))
+
+        count = max([len(influence) for influence in influences] + [1])
+        count = min(count, maxInfluences)
+
+        self.indices = numpy.zeros((nVerts, count), dtype=numpy.int32)
+        self.weights = numpy.zeros((nVerts, count), dtype=numpy.float32)
+        for vindex, influence in enumerate(influences):
+            if influence:
+                influence = sorted(influence, reverse=True)[:count]
+                self.weights[vindex, :len(influence)] = [weight for weight, index in influence]
+                self.indices[vindex, :len(influence)] = [index for weight, index in influence]
+
+        total = self.weights.sum(axis=1)
+        # Vertices without weights keep their rest position
+        self.bound = total > 0.0
+        self.weights[self.bound] /= total[self.bound][:, numpy.newaxis]
+
+    @classmethod
+    def fromRigFile(cls, filename, nVerts, maxInfluences=4):
+        """
+        Loads the weights of a rig in data/rigs.
+        """
+
+        weights = readRigWeights(filename)
+        return cls(nVerts, sorted(weights), weights, maxInfluences)
+
+    @classmethod
+    def fromJoints(cls, joints, nVerts):
+        """
+        Binds the vertices listed in the bindedVects of each joint rigidly to that joint.
+        """
+
+        weights = dict([(joint.name, [(vindex, 1.0) for vindex in joint.bindedVects]) for joint in joints])
+        return cls(nVerts, [joint.name for joint in joints], weights, 1)
+
+    def skin(self, coords, matrices, normals=None, mode=LINEAR):
+        """
+        Poses the vertices of the mesh.
+
+        :param coords: The rest coordinates.
+        :type coords: numpy.ndarray of shape (verts, 3)
+        :param matrices: The skinning matrices of the bones, for one frame or several.
+        :type matrices: numpy.ndarray of shape (bones, 4, 4) or (frames, bones, 4, 4)
+        :param normals: The rest normals, or None.
+        :type normals: numpy.ndarray of shape (verts, 3)
+        :param mode: LINEAR or DUAL_QUATERNION.
+        :type mode: int
+        :return: The posed coordinates, and the posed normals when normals were given.
+            With several frames the arrays have a leading frames axis.
+        """
+
+        coords = numpy.asarray(coords, dtype=numpy.float64)
+        matrices = numpy.asarray(matrices, dtype=numpy.float64)
+
+        if matrices.ndim == 4:
+            results = [self.skin(coords, m, normals, mode) for m in matrices]
+            if normals is None:
+                return numpy.array(results)
+            return numpy.array([r[0] for r in results]), numpy.array([r[1] for r in results])
+
+        if mode == DUAL_QUATERNION:
+            blended = self.__blendDualQuaternions(matrices)
+        else:
+            # Weighted sum of the upper 3 rows of the matrices of each vertex
+            blended = numpy.einsum('vk,vkij->vij', self.weights, matrices[self.indices, :3, :])
+
+        posed = numpy.einsum('vij,vj->vi', blended[:, :, :3], coords) + blended[:, :, 3]
+        posed[~self.bound] = coords[~self.bound]
+
+        if normals is None:
+            return posed
+
+        normals = numpy.asarray(normals, dtype=numpy.float64)
+        posedNormals = numpy.einsum('vij,vj->vi', blended[:, :, :3], normals)
+        length = numpy.sqrt((posedNormals ** 2).sum(axis=1))
+        length[length == 0.0] = 1.0
+        posedNormals /= length[:, numpy.newaxis]
+        posedNormals[~self.bound] = normals[~self.bound]
+        return posed, posedNormals
+
+    def __blendDualQuaternions(self, matrices):
+
+        real, dual = matricesToDualQuaternions(matrices)
+
+        real = real[self.indices]
+        dual = dual[self.indices]
+        # Use the quaternion of the first bone or its opposite, whichever is nearer
+        signs = numpy.where((real * real[:, :1]).sum(axis=2) < 0.0, -1.0, 1.0) * self.weights
+        real = (real * signs[:, :, numpy.newaxis]).sum(axis=1)
+        dual = (dual * signs[:, :, numpy.newaxis]).sum(axis=1)
+
+        length = numpy.sqrt((real ** 2).sum(axis=1))
+        length[length == 0.0] = 1.0
+        real /= length[:, numpy.newaxis]
+        dual /= length[:, numpy.newaxis]
+
+        return dualQuaternionsToMatrices(real, dual)
+
+def matricesToDualQuaternions(matrices):
+    """
+    Converts rigid transforms to unit dual quaternions, as (w, x, y, z) arrays.
+    Scaling in the matrices is not preserved.
+    """
+
+    r = matrices[:, :3, :3]
+    t = matrices[:, :3, 3]
+
+    # Rotation matrix to quaternion, using the largest diagonal term for stability
+    real = numpy.empty((len(matrices), 4))
+    trace = r[:, 0, 0] + r[:, 1, 1] + r[:, 2, 2]
+    cases = numpy.argmax(numpy.column_stack([trace, r[:, 0, 0], r[:, 1, 1], r[:, 2, 2]]), axis=1)
+    for case in xrange(4):
+        sel = cases == case
+        if not sel.any():
+            continue
+        m = r[sel]
+        if case == 0:
+            s = numpy.sqrt(trace[sel] + 1.0) * 2.0
+            real[sel] = numpy.column_stack([0.25 * s, (m[:, 2, 1] - m[:, 1, 2]) / s,
+                (m[:, 0, 2] - m[:, 2, 0]) / s, (m[:, 1, 0] - m[:, 0, 1]) / s])
+        elif case == 1:
+            s = numpy.sqrt(1.0 + m[:, 0, 0] - m[:, 1, 1] - m[:, 2, 2]) * 2.0
+            real[sel] = numpy.column_stack([(m[:, 2, 1] - m[:, 1, 2]) / s, 0.25 * s,
+                (m[:, 0, 1] + m[:, 1, 0]) / s, (m[:, 0, 2] + m[:, 2, 0]) / s])
+        elif case == 2:
+            s = numpy.sqrt(1.0 + m[:, 1, 1] - m[:, 0, 0] - m[:, 2, 2]) * 2.0
+            real[sel] = numpy.column_stack([(m[:, 0, 2] - m[:, 2, 0]) / s, (m[:, 0, 1] + m[:, 1, 0]) / s,
+                0.25 * s, (m[:, 1, 2] + m[:, 2, 1]) / s])
+        else:
+            s = numpy.sqrt(1.0 + m[:, 2, 2] - m[:, 0, 0] - m[:, 1, 1]) * 2.0
+            real[sel] = numpy.column_stack([(m[:, 1, 0] - m[:, 0, 1]) / s, (m[:, 0, 2] + m[:, 2, 0]) / s,
+                (m[:, 1, 2] + m[:, 2, 1]) / s, 0.25 * s])
+
+    # dual = 0.5 * (0, t) * real
+    w, x, y, z = real[:, 0], real[:, 1], real[:, 2], real[:, 3]
+    tx, ty, tz = t[:, 0], t[:, 1], t[:, 2]
+    dual = 0.5 * numpy.column_stack([
+        -tx * x - ty * y - tz * z,
+        tx * w + ty * z - tz * y,
+        -tx * z + ty * w + tz * x,
+        tx * y - ty * x + tz * w])
+
+    return real, dual
+
+def dualQuaternionsToMatrices(real, dual):
+    """
+    Converts unit dual quaternions to 3x4 transforms.
+    """
+
+    w, x, y, z = real[:, 0], real[:, 1], real[:, 2], real[:, 3]
+    m = numpy.empty((len(real), 3, 4))
+    m[:, 0, 0] = 1.0 - 2.0 * (y * y + z * z)
+    m[:, 0, 1] = 2.0 * (x * y - w * z)
+    m[:, 0, 2] = 2.0 * (x * z + w * y)
+    m[:, 1, 0] = 2.0 * (x * y + w * z)
+    m[:, 1, 1] = 1.0 - 2.0 * (x * x + z * z)
+    m[:, 1, 2] = 2.0 * (y * z - w * x)
+    m[:, 2, 0] = 2.0 * (x * z - w * y)
+    m[:, 2, 1] = 2.0 * (y * z + w * x)
+    m[:, 2, 2] = 1.0 - 2.0 * (x * x + y * y)
+
+    # t = 2 * dual * conjugate(real)
+    dw, dx, dy, dz = dual[:, 0], dual[:, 1], dual[:, 2], dual[:, 3]
+    m[:, 0, 3] = 2.0 * (-dw * x + dx * w - dy * z + dz * y)
+    m[:, 1, 3] = 2.0 * (-dw * y + dx * z + dy * w - dz * x)
+    m[:, 2, 3] = 2.0 * (-dw * z - dx * y + dy * x + dz * w)
+
+    return m
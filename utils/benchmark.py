@@ -0,0 +1,485 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Headless benchmark of the morphing, subdivision, proxy fitting and export code.
+
+**Project Name:**      MakeHuman
+
+**Product Home Page:** http://www.makehuman.org/
+
+**Code Home Page:**    http://code.google.com/p/makehuman/
+
+**Authors:**           MakeHuman Team
+
+**Copyright(c):**      MakeHuman Team 2001-2012
+
+**Licensing:**         GPL3 (see also http://sites.google.com/site/makehumandocs/licensing)
+
+**Coding Standards:**  See http://sites.google.com/site/makehumandocs/developers-guide
+
+Abstract
+--------
+
+This script loads data/3dobjs/base.obj into a human without opening a window and
+times the work a user session consists of: applying macro and detail target stacks,
+subdividing, fitting clothes and proxy meshes, and running each exporter. Each case
+runs a few times; the first run of a target stack includes parsing the targets.
+
+The mh module is built into the MakeHuman executable, so the script registers a
+headless replacement which has no textures, cameras or window before it imports the
+application modules.
+
+The results, with the best and mean time of each case and the memory it needed, are
+written as JSON. The memory of a case is the peak resident size while it ran minus
+the resident size before it, so it does not include what earlier cases left behind.
+It is read from /proc and reported on Linux only. Given the results of an earlier run, the script
+reports which cases became slower or faster and exits with status 1 if any became
+slower::
+
+    python utils/benchmark.py -o before.json
+    python utils/benchmark.py -c before.json -o after.json
+
+Run it from the MakeHuman folder.
+"""
+
+__docformat__ = 'restructuredtext'
+
+import sys
+import os
+import imp
+import time
+import json
+import getopt
+import shutil
+import platform
+import tempfile
+
+resultsVersion = 2
+
+macroStacks = [
+    ('neutral', {}),
+    ('young female', {'Gender': 0.0, 'Age': 0.3}),
+    ('old male', {'Gender': 1.0, 'Age': 1.0}),
+    ('muscular heavy male', {'Gender': 1.0, 'Muscle': 0.9, 'Weight': 0.8}),
+    ('thin african female', {'Gender': 0.0, 'Weight': 0.2, 'African': 0.7}),
+    ('asian child', {'Age': 0.1, 'Asian': 1.0})
+]
+
+detailFolders = ['head', 'nose', 'mouth', 'ears', 'neck', 'torso', 'hip', 'armslegs']
+detailsPerFolder = 4
+
+clothes = [
+    'data/clothes/jeans_medium/jeans_medium.mhclo',
+    'data/clothes/tshirt_shortsleeves_medium/tshirt_shortsleeves_medium.mhclo',
+    'data/clothes/shoes/shoes.mhclo'
+]
+
+proxies = [
+    'data/proxymeshes/male/male.proxy',
+    'data/proxymeshes/ascottk/ascottk.proxy'
+]
+
+def setupPaths():
+    """
+    Adds the application folders to the module search path, as main.py does.
+    """
+
+    def recursiveDirNames(root):
+        paths = []
+        for folder, dirs, files in os.walk(root):
+            paths.extend([os.path.join(folder, d) for d in dirs if d != '.svn'])
+        return paths
+
+    sys.path.append('./')
+    sys.path.append('./apps')
+    sys.path.append('./shared')
+    sys.path.append('./shared/mhx/templates')
+    sys.path.append('./shared/mhx')
+    sys.path.extend(recursiveDirNames('./apps'))
+    sys.path.append('./core')
+    sys.path.extend(recursiveDirNames('./core'))
+
+def installHeadlessMh(home):
+    """
+    Registers a replacement for the mh module which keeps no graphics state.
+
+    :param home: The folder mh.getPath returns, exports are written below it.
+    :type home: str
+    """
+
+    mh = imp.new_module('mh')
+
+    class Texture(object):
+
+        def __init__(self, *args, **kwargs):
+            pass
+
+        def loadImage(self, *args, **kwargs):
+            pass
+
+        def loadSubImage(self, *args, **kwargs):
+            pass
+
+    class Image(object):
+
+        def __init__(self, *args, **kwargs):
+            raise RuntimeError('Images are not loaded in headless mode')
+
+    def getPath(type):
+        return os.path.join(home, type)
+
+    def callAsync(function):
+        function()
+
+    def redraw(*args):
+        pass
+
+    mh.Texture = Texture
+    mh.Image = Image
+    mh.getPath = getPath
+    mh.callAsync = callAsync
+    mh.redraw = redraw
+    mh.world = []
+    mh.cameras = []
+    sys.modules['mh'] = mh
+    return mh
+
+class HeadlessApp(object):
+
+    """
+    Stands in for gui3d.app, the human only uses its settings and sends it events.
+    """
+
+    def __init__(self):
+
+        self.settings = {
+            'realtimeUpdates': True,
+            'realtimeNormalUpdates': True,
+            'units': 'metric',
+            'profiling': False
+        }
+        self.selectedHuman = None
+
+    def progress(self, *args, **kwargs):
+        pass
+
+    def callEvent(self, *args, **kwargs):
+        pass
+
+    def redraw(self):
+        pass
+
+    def redrawNow(self):
+        pass
+
+def getMemory():
+    """
+    Returns the current and the peak resident memory of the process in MiB, or None
+    if the platform does not report them.
+    """
+
+    try:
+        f = open('/proc/self/status', 'r')
+        status = dict([line.split(':', 1) for line in f if ':' in line])
+        f.close()
+        # Values are in kB
+        return int(status['VmRSS'].split()[0]) / 1024.0, int(status['VmHWM'].split()[0]) / 1024.0
+    except (IOError, KeyError, ValueError):
+        return None
+
+def resetPeakMemory():
+    """
+    Sets the peak resident memory of the process to its current resident memory,
+    supported by Linux 4.0 and later. Returns whether it succeeded.
+    """
+
+    try:
+        f = open('/proc/self/clear_refs', 'w')
+        f.write('5')
+        f.close()
+        return True
+    except IOError:
+        return False
+
+class Benchmark:
+
+    """
+    Runs the cases and keeps their timings.
+
+    :param repeat: How often each case runs.
+    :type repeat: int
+    :param verbose: Whether to show what the application prints while a case runs.
+    :type verbose: bool
+    """
+
+    def __init__(self, repeat=3, verbose=False):
+
+        self.repeat = max(1, repeat)
+        self.verbose = verbose
+        self.cases = []
+
+    def run(self, name, function, *args):
+        """
+        Runs a case self.repeat times and records the time of each run.
+        """
+
+        times = []
+        peakReset = resetPeakMemory()
+        memoryBefore = getMemory()
+        stdout = sys.stdout
+        if not self.verbose:
+            sys.stdout = open(os.devnull, 'w')
+        try:
+            for i in xrange(self.repeat):
+                started = time.time()
+                function(*args)
+                times.append(time.time() - started)
+        finally:
+            if sys.stdout is not stdout:
+                sys.stdout.close()
+                sys.stdout = stdout
+
+        # Without a peak reset only the memory the case kept can be measured
+        memoryAfter = getMemory()
+        if memoryBefore and memoryAfter:
+            memory = memoryAfter[1 if peakReset else 0] - memoryBefore[0]
+        else:
+            memory = None
+
+        case = {
+            'name': name,
+            'times': times,
+            'best': min(times),
+            'mean': sum(times) / len(times),
+            'memory': memory
+        }
+        self.cases.append(case)
+        print('%-45s %9.4f %9.4f %9s' % (name, case['best'], case['mean'], formatMemory(case['memory'])))
+        return case
+
+    def getResults(self):
+
+        try:
+            import numpy
+            numpyVersion = numpy.__version__
+        except ImportError:
+            numpyVersion = None
+
+        return {
+            'version': resultsVersion,
+            'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'platform': platform.platform(),
+            'python': platform.python_version(),
+            'numpy': numpyVersion,
+            'repeat': self.repeat,
+            'cases': self.cases
+        }
+
+def formatMemory(megabytes):
+
+    if megabytes is None:
+        return '-'
+    return '%.1f' % megabytes
+
+def runSuite(benchmark, exportPath):
+    """
+    Runs all cases on a new human.
+    """
+
+    import gui3d
+    import files3d
+    import algos3d
+    import human
+    import mh2proxy
+    import mh2obj
+    import mh2stl
+    import mh2md5
+    import mh2skel
+    import mh2bvh
+    import mh2collada
+    import mh2mhx
+
+    baseMesh = 'data/3dobjs/base.obj'
+
+    benchmark.run('load base mesh', files3d.loadMesh, baseMesh)
+
+    theHuman = human.Human(files3d.loadMesh(baseMesh))
+    gui3d.app.selectedHuman = theHuman
+
+    # Macro stacks, the first run of each parses the targets it needs
+    algos3d.targetBuffer.clear()
+    for name, values in macroStacks:
+        def applyMacros():
+            for macro in ('Gender', 'Age', 'Muscle', 'Weight', 'African', 'Asian'):
+                default = 0.0 if macro in ('African', 'Asian') else 0.5
+                getattr(theHuman, 'set' + macro)(values.get(macro, default))
+            theHuman.applyAllTargets()
+        benchmark.run('macro %s' % name, applyMacros)
+
+    # A detail stack over the main body zones
+    details = []
+    for folder in detailFolders:
+        targets = []
+        for path, dirs, files in os.walk(os.path.join('data/targets', folder)):
+            targets.extend([os.path.join(path, f) for f in files if f.endswith('.target')])
+        details.extend(sorted(targets)[:detailsPerFolder])
+    def applyDetails():
+        for target in details:
+            theHuman.setDetail(target, 0.5)
+        theHuman.applyAllTargets()
+    benchmark.run('details %d targets' % len(details), applyDetails)
+
+    # Subdivision
+    def toggleSubdivision():
+        theHuman.setSubdivided(True)
+        theHuman.setSubdivided(False)
+    benchmark.run('subdivide', toggleSubdivision)
+    benchmark.run('update subdivision', theHuman.updateSubdivisionMesh)
+
+    # Clothes and proxy meshes
+    for filename in clothes:
+        if not os.path.isfile(filename):
+            continue
+        proxy = mh2proxy.readProxyFile(theHuman.meshData, filename, False)
+        folder, name = proxy.obj_file
+        mesh = files3d.loadMesh(os.path.join(folder, name))
+        def fitClothes():
+            proxy.update(mesh, theHuman.meshData)
+            mesh.update()
+        benchmark.run('fit %s' % os.path.basename(filename), fitClothes)
+
+    for filename in proxies:
+        if not os.path.isfile(filename):
+            continue
+        proxy = mh2proxy.readProxyFile(theHuman.getSeedMesh(), filename, False)
+        theHuman.setProxy(proxy)
+        benchmark.run('fit %s' % os.path.basename(filename), theHuman.updateProxyMesh)
+        theHuman.setProxy(None)
+
+    # Exporters
+    def exported(name):
+        return os.path.join(exportPath, name)
+
+    mesh = theHuman.getSeedMesh()
+    benchmark.run('export obj', mh2obj.exportObj, mesh, exported('human.obj'))
+    benchmark.run('export stl ascii', mh2stl.exportStlAscii, mesh, exported('human.stl'))
+    benchmark.run('export stl binary', mh2stl.exportStlBinary, mesh, exported('human.stl'))
+    benchmark.run('export md5', mh2md5.exportMd5, mesh, exported('human.md5mesh'))
+    benchmark.run('export skel', mh2skel.exportSkel, mesh, exported('human.skel'))
+    benchmark.run('export bvh', mh2bvh.exportSkeleton, mesh, exported('human.bvh'))
+    colladaOptions = {
+        'daerig': 'game',
+        'rotate90X': False,
+        'rotate90Z': False,
+        'eyebrows': True,
+        'lashes': True,
+        'helpers': False,
+        'scale': (1.0, 'decimeter'),
+        'pngTexture': False
+    }
+    benchmark.run('export collada', mh2collada.exportCollada, theHuman, exported('human'), colladaOptions)
+    # Last, as it changes the human
+    benchmark.run('export mhx', mh2mhx.exportMhx, theHuman, exported('human.mhx'), None)
+
+def compare(results, baseline, tolerance=0.1):
+    """
+    Prints how the best time of each case changed compared to an earlier run.
+
+    :param tolerance: The relative change below which a case counts as unchanged.
+    :type tolerance: float
+    :return: The names of the cases which became slower.
+    :rtype: [str, ..]
+    """
+
+    before = dict([(case['name'], case) for case in baseline.get('cases', [])])
+    slower = []
+    print('\nCompared to the run of %s:' % baseline.get('time', 'unknown'))
+    for case in results['cases']:
+        old = before.get(case['name'])
+        if not old or not old['best']:
+            print('%-45s %9s' % (case['name'], 'new'))
+            continue
+        ratio = case['best'] / old['best']
+        if ratio > 1.0 + tolerance:
+            verdict = 'slower'
+            slower.append(case['name'])
+        elif ratio < 1.0 - tolerance:
+            verdict = 'faster'
+        else:
+            verdict = ''
+        print('%-45s %8.2fx %s' % (case['name'], ratio, verdict))
+    return slower
+
+def usage():
+    print('Usage: ' + sys.argv[0] + ' [options]')
+    print('  -o, --output file     write the results to file, default benchmark.json')
+    print('  -c, --compare file    compare with the results in file')
+    print('  -r, --repeat n        run each case n times, default 3')
+    print('  -t, --tolerance x     relative change reported as slower or faster, default 0.1')
+    print('  -v, --verbose         show what the application prints')
+
+def main(argv):
+
+    try:
+        opts, args = getopt.getopt(argv, 'ho:c:r:t:v', ['help', 'output=', 'compare=', 'repeat=', 'tolerance=', 'verbose'])
+    except getopt.GetoptError:
+        usage()
+        sys.exit(2)
+
+    output = 'benchmark.json'
+    baselineFile = None
+    repeat = 3
+    tolerance = 0.1
+    verbose = False
+    for opt, arg in opts:
+        if opt in ('-h', '--help'):
+            usage()
+            sys.exit()
+        elif opt in ('-o', '--output'):
+            output = arg
+        elif opt in ('-c', '--compare'):
+            baselineFile = arg
+        elif opt in ('-r', '--repeat'):
+            repeat = int(arg)
+        elif opt in ('-t', '--tolerance'):
+            tolerance = float(arg)
+        elif opt in ('-v', '--verbose'):
+            verbose = True
+
+    if not os.path.isfile('data/3dobjs/base.obj'):
+        print('Run the benchmark from the MakeHuman folder')
+        sys.exit(2)
+
+    baseline = None
+    if baselineFile:
+        f = open(baselineFile, 'r')
+        baseline = json.load(f)
+        f.close()
+
+    home = tempfile.mkdtemp(prefix='mhbenchmark')
+    exportPath = os.path.join(home, 'exports')
+    os.makedirs(exportPath)
+    try:
+        setupPaths()
+        installHeadlessMh(home)
+        import gui3d
+        gui3d.app = HeadlessApp()
+
+        benchmark = Benchmark(repeat, verbose)
+        print('%-45s %9s %9s %9s' % ('case', 'best s', 'mean s', 'MiB'))
+        runSuite(benchmark, exportPath)
+    finally:
+        shutil.rmtree(home, True)
+
+    results = benchmark.getResults()
+    f = open(output, 'w')
+    json.dump(results, f, indent=1, sort_keys=True)
+    f.close()
+    print('Results written to %s' % output)
+
+    if baseline and compare(results, baseline, tolerance):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -55,25 +55,31 @@ def scan2meshBuild(target_dir,head_mesh,head_mask,output):
     
 def scan2meshFit(head_mesh,head_mask,scan_mesh,scan_mask,fit_verts,prefix,output,regul = 0.005):
 
-    head_mesh = wf.read_obj(head_mesh)
-    head_mask = wf.read_obj(head_mask)
+    fitter = scan_fit.ScanFitter(head_mesh,head_mask,fit_verts,prefix,regul)
     scan_mask = wf.read_obj(scan_mask)
     scan_mesh = wf.read_obj(scan_mesh)
 
-    scan_mesh.vertices,scan_mask.vertices = scan_fit.align_scan(scan_mask.vertices,head_mask.vertices,scan_mesh.vertices)
+    target = fitter.fit(scan_mesh,scan_mask)
     scan_mesh.save("aligned.obj")
-    
-    base_mask = scan_fit.TargetBase(prefix = prefix+"_mask")
-    coefs = scan_fit.fit_mask(head_mesh.vertices,head_mask.vertices,scan_mesh.vertices,scan_mask.vertices,base_mask,constrained = True, regul = 0.005)
-
-    base = scan_fit.TargetBase(prefix = prefix)
-
-    target = scan_fit.fit_mesh(head_mesh.vertices,scan_mesh.vertices,base,fit_verts,init_coefs = coefs,niter = 1)
 
+    head_mesh = fitter.head_mesh
     head_mesh.vertices+=target
     head_mesh.save(output.replace(".target",".obj"))
 
-    scan_fit.save_target(output,dict(zip(base.vert_list,target[base.vert_list])))
+    scan_fit.save_target(output,dict(zip(fitter.base.vert_list,target[fitter.base.vert_list])))
+
+
+def scan2meshFitBatch(head_mesh,head_mask,scan_dir,fit_verts,prefix,regul = 0.005,processes = None):
+    """
+    Fits all the scans in the sub folders of scan_dir, each one with a
+    scan_mesh.obj and a scan_mask.obj, saving result.target and result.obj
+    next to them. The bases are loaded once for each process.
+    """
+
+    failed = scan_fit.fit_scans(head_mesh,head_mask,fit_verts,prefix,scan_dir,regul,processes)
+    for scan,error in failed:
+        print "Could not fit %s: %s"%(scan,error)
+    return failed
 
 
 def analyzeTarget(vertices, targetBuffer, scale=0.5):
@@ -130,11 +136,14 @@ def compute_distance(vertices0, vertices1):
     dist,indx = kd.query(vertices1)
     return sum(dist)
 
-def align_PCA(vertices0, vertices1):
+def align_PCA(vertices0, vertices1, kd0 = None, nsample = 500, margin = 0.1):
     """
      it accepts and returns lists of lists
      vertices0 can be either MH mesh
      or the concatenation of a few manually aligned scans
+     kd0 is a KDTree of vertices0, to build it only once for many scans
+     The flips of the axes are compared using nsample vertices, and only
+     the flips within margin of the best one are compared using all of them
     """
     vertices0 = np.array(vertices0)
     vertices1 = np.array(vertices1)
@@ -153,35 +162,31 @@ def align_PCA(vertices0, vertices1):
     # Computes rotation matrix to go from 1 to 0
     R = np.dot(u0,pinv(u1))
 
+    # eigh picks the sign of each axis at random, so R can be a reflection;
+    # the flips below are all rotations and could never undo it
+    if np.linalg.det(R) < 0 :
+        u1[:,-1] *= -1
+        R = np.dot(u0,pinv(u1))
+
     #apply the transformation
     vertices = w0[-1]/w1[-1]*np.dot(vertices1-mean1,R.T)
     
     # axis can be arbitrarily oriented so we have to check if some rotations
-    # around main axes are needed
-    dmin = None
-    amin = bmin = cmin = None
-    
-    for a in [0,np.pi]:
-        if a != 0 : va = turn_around(vertices[::10],u0[:,0],a)
-        else : va = vertices[::2]
-        for b in [0,np.pi] :
-            if b != 0 : vb = turn_around(va,u0[:,1],b)
-            else : vb = va
-            for c in [0,np.pi] :
-                if c != 0 : vc = turn_around(vb,u0[:,2],c)
-                else : vc = vb
-                dist = compute_distance(vc+mean0,vertices0)
-                if dmin is None or dist < dmin :
-                    dmin = dist
-                    amin = a
-                    bmin = b
-                    cmin = c
-
-    if amin : vertices = turn_around(vertices,u0[:,0],amin)
-    if bmin : vertices = turn_around(vertices,u0[:,1],bmin)
-    if cmin : vertices = turn_around(vertices,u0[:,2],cmin)
-        
-    return vertices + mean0
+    # around main axes are needed. Turning around two of the axes is the same
+    # as turning around the third one, so there are only 4 different flips
+    flips = [np.identity(3)] + [turn_around(vertices,u0[:,i],np.pi) for i in xrange(3)]
+
+    if kd0 is None : kd0 = KDTree(vertices0)
+    sample = vertices[::max(1,len(vertices)/nsample)]
+    dists = [np.mean(kd0.query(np.dot(sample,R.T)+mean0)[0]) for R in flips]
+    candidates = [i for i,d in enumerate(dists) if d <= (1.0+margin)*min(dists)]
+    if len(candidates) > 1 :
+        dists = dict([(i,np.mean(kd0.query(np.dot(vertices,flips[i].T)+mean0)[0])) for i in candidates])
+        best = min(candidates, key = dists.get)
+    else :
+        best = candidates[0]
+
+    return np.dot(vertices,flips[best].T) + mean0
 
     
 def loadObj(path):
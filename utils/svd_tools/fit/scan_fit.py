@@ -1,9 +1,14 @@
 import os.path
 from scipy.linalg import pinv,svd
-from scipy.spatial import KDTree
+try :
+    from scipy.spatial import cKDTree as KDTree
+except ImportError :
+    from scipy.spatial import KDTree
 from scipy.optimize import leastsq
 import numpy as np
 import os
+import itertools
+import multiprocessing
 
 def rotX(angle):
     cosa = np.cos(angle)
@@ -154,10 +159,19 @@ class TargetBase(object):
     @property
     def names(self):
         if self._names is None and self.prefix is not None :
-            with open(prefix+".names","r") as f :
+            with open(self.prefix+".names","r") as f :
                 self._names = [ l.strip() for l in f]
         return self._names
 
+    def load(self):
+        """
+            Loads all the components of the base at once, instead of
+            when they are first used, so the base can be kept in memory
+            and used for many fits.
+        """
+        self.u,self.s,self.vt,self.vert_list,self.targets
+        return self
+
     def save(self,prefix = None):
         if prefix is not None : self.prefix = prefix
 
@@ -300,14 +314,18 @@ def build_matrix(vert_list,targets):
             base[i,look_up[v]]=coords
     return base
 
-def fit_mask(head_mesh,head_mask,scan_mesh,scan_mask,base,rcond = 0.0, constrained = False,regul = None):
+def fit_mask(head_mesh,head_mask,scan_mesh,scan_mask,base,rcond = 0.0, constrained = False,regul = None,kd_head = None,kd_scan = None):
+    """
+        kd_head and kd_scan are KDTrees of head_mesh and scan_mesh, they
+        are built when not given.
+    """
     if isinstance(base,str):
         base = TargetBase(prefix = base)
-    kd_head = KDTree(head_mesh)
+    if kd_head is None : kd_head = KDTree(head_mesh)
     dist,indx = kd_head.query(head_mask)
     head_v = head_mesh[indx]
     
-    kd_scan = KDTree(scan_mesh)
+    if kd_scan is None : kd_scan = KDTree(scan_mesh)
     dist,indx = kd_scan.query(scan_mask)
     scan_v = scan_mesh[indx]
     
@@ -318,7 +336,7 @@ def fit_mask(head_mesh,head_mask,scan_mesh,scan_mask,base,rcond = 0.0, constrain
         coefs = base.compute_combinaison(target,rcond)
     return coefs
 
-def fit_mesh(head_mesh,scan_mesh,base,tofit_verts,init_coefs = None,constrained = False,regul = None,niter = 1):
+def fit_mesh(head_mesh,scan_mesh,base,tofit_verts,init_coefs = None,constrained = False,regul = None,niter = 1,kd_scan = None):
     if isinstance(tofit_verts,str):
         tofit_verts = np.loadtxt(tofit_verts,'int')
     if isinstance(base,str):
@@ -335,7 +353,7 @@ def fit_mesh(head_mesh,scan_mesh,base,tofit_verts,init_coefs = None,constrained
 
     m[verts]+=init_target
     
-    kd = KDTree(scan_mesh)
+    kd = KDTree(scan_mesh) if kd_scan is None else kd_scan
     
     for iter in xrange(niter):
         target = np.zeros((nverts,3))
@@ -359,6 +377,127 @@ def save_target(filename,target):
                 f.write( "%i %s\n"%(v," ".join(["%0.12e"%cc for cc in c]) ) )
 
 
+class ScanFitter(object):
+    """
+        Fits scans to the head mesh, keeping in memory what is the same
+        for all of them : the head mesh and mask, the two target bases
+        and the KDTree of the head mesh.
+
+        arguments :
+        - head_mesh, head_mask : the head mesh and mask, as meshes or paths
+        - fit_verts : the vertices to fit, as an array or a path
+        - prefix : prefix of the bases saved by the build command
+        - regul : regularisation factor for the fit of the mask
+    """
+    def __init__(self,head_mesh,head_mask,fit_verts,prefix,regul = 0.005):
+        import wavefront as wf
+        if isinstance(head_mesh,str) : head_mesh = wf.read_obj(head_mesh)
+        if isinstance(head_mask,str) : head_mask = wf.read_obj(head_mask)
+        if isinstance(fit_verts,str) : fit_verts = np.loadtxt(fit_verts,'int')
+
+        self.head_mesh = head_mesh
+        self.head_mask = head_mask
+        self.fit_verts = fit_verts
+        self.regul = regul
+        self.base_mask = TargetBase(prefix = prefix+"_mask").load()
+        self.base = TargetBase(prefix = prefix).load()
+        self.kd_head = KDTree(head_mesh.vertices)
+
+    def fit(self,scan_mesh,scan_mask):
+        """
+            Aligns scan_mesh using scan_mask and fits the head mesh to it.
+            scan_mesh and scan_mask are meshes, they are aligned in place.
+
+            returns the target, for all the vertices of the head mesh
+        """
+        scan_mesh.vertices,scan_mask.vertices = align_scan(scan_mask.vertices,self.head_mask.vertices,scan_mesh.vertices)
+
+        # The same tree is used for fitting the mask and the mesh
+        kd_scan = KDTree(scan_mesh.vertices)
+        coefs = fit_mask(self.head_mesh.vertices,self.head_mask.vertices,scan_mesh.vertices,scan_mask.vertices,self.base_mask,constrained = True, regul = self.regul,kd_head = self.kd_head,kd_scan = kd_scan)
+        return fit_mesh(self.head_mesh.vertices,scan_mesh.vertices,self.base,self.fit_verts,init_coefs = coefs,niter = 1,kd_scan = kd_scan)
+
+    def fit_dir(self,scan_dir):
+        """
+            Fits the scan_mesh.obj and scan_mask.obj of scan_dir, and saves
+            aligned.obj, result.target and result.obj in it.
+        """
+        import wavefront as wf
+        scan_mesh = wf.read_obj(os.path.join(scan_dir,"scan_mesh.obj"))
+        scan_mask = wf.read_obj(os.path.join(scan_dir,"scan_mask.obj"))
+
+        target = self.fit(scan_mesh,scan_mask)
+        scan_mesh.save(os.path.join(scan_dir,"aligned.obj"))
+
+        head_mesh = self.head_mesh.copy()
+        head_mesh.vertices+=target
+        head_mesh.save(os.path.join(scan_dir,"result.obj"))
+
+        save_target(os.path.join(scan_dir,"result.target"),dict(zip(self.base.vert_list,target[self.base.vert_list])))
+
+# The fitter of each process of fit_scans
+_fitter = None
+
+def _init_fitter(*args):
+    global _fitter
+    _fitter = ScanFitter(*args)
+
+def _fit_scan_dir(scan_dir):
+    try :
+        _fitter.fit_dir(scan_dir)
+    except Exception,e :
+        return scan_dir,str(e)
+    return scan_dir,None
+
+def find_scans(dirname):
+    """
+        Returns the sub directories of dirname with a scan_mesh.obj and
+        a scan_mask.obj.
+    """
+    scans = []
+    for root,dirs,files in os.walk(dirname):
+        dirs.sort()
+        if "scan_mesh.obj" in files and "scan_mask.obj" in files :
+            scans.append(root)
+    return scans
+
+def fit_scans(head_mesh,head_mask,fit_verts,prefix,scans,regul = 0.005,processes = None):
+    """
+        Fits many scans, each in the directory layout used by fit_dir.
+        The scans are shared out between a pool of processes, each
+        one loading the bases and building the KDTree of the head
+        mesh once, with a ScanFitter.
+
+        arguments :
+        - scans : a list of scan directories, or a directory which
+                  sub directories are the scans
+        - processes : the number of processes, one for each cpu if None
+
+        returns the list of (scan directory, error message) of the
+        scans which couldn't be fitted
+    """
+    if isinstance(scans,str) : scans = find_scans(scans)
+
+    args = (head_mesh,head_mask,fit_verts,prefix,regul)
+    if processes == 1 :
+        _init_fitter(*args)
+        pool = None
+        results = itertools.imap(_fit_scan_dir,scans)
+    else :
+        pool = multiprocessing.Pool(processes,_init_fitter,args)
+        results = pool.imap_unordered(_fit_scan_dir,scans)
+
+    failed = []
+    for scan_dir,error in results :
+        print "%s %s"%(scan_dir,"OK" if error is None else error)
+        if error is not None : failed.append((scan_dir,error))
+    if pool is not None :
+        pool.close()
+        pool.join()
+
+    return failed
+
+
 if __name__ == '__main__' :
     import wavefront as wf
     import sys
@@ -416,24 +555,34 @@ if __name__ == '__main__' :
             print "usage : python scan_fit.py fit head_mesh head_mask scan_mesh scan_mask fit_verts prefix output_target"
             sys.exit(-1)
 
-        head_mesh = wf.read_obj(head_mesh)
-        head_mask = wf.read_obj(head_mask)
+        fitter = ScanFitter(head_mesh,head_mask,fit_verts,prefix)
         scan_mask = wf.read_obj(scan_mask)
         scan_mesh = wf.read_obj(scan_mesh)
 
-        scan_mesh.vertices,scan_mask.vertices = align_scan(scan_mask.vertices,head_mask.vertices,scan_mesh.vertices)
+        target = fitter.fit(scan_mesh,scan_mask)
         scan_mesh.save("aligned.obj")
-        
-        base_mask = TargetBase(prefix = prefix+"_mask")
-        coefs = fit_mask(head_mesh.vertices,head_mask.vertices,scan_mesh.vertices,scan_mask.vertices,base_mask,constrained = True, regul = 0.005)
-
-        base = TargetBase(prefix = prefix)
-
-        target = fit_mesh(head_mesh.vertices,scan_mesh.vertices,base,fit_verts,init_coefs = coefs,niter = 1)
 
+        head_mesh = fitter.head_mesh
         head_mesh.vertices+=target
         head_mesh.save(output.replace(".target",".obj"))
 
-        save_target(output,dict(zip(base.vert_list,target[base.vert_list])))
+        save_target(output,dict(zip(fitter.base.vert_list,target[fitter.base.vert_list])))
+
+    elif cmd == 'fitbatch' :
+
+        try :
+            head_mesh = sys.argv[2]
+            head_mask = sys.argv[3]
+            fit_verts = sys.argv[4]
+            prefix = sys.argv[5]
+            scan_dir = sys.argv[6]
+            processes = int(sys.argv[7]) if len(sys.argv) > 7 else None
+        except (IndexError,ValueError) :
+            print "usage : python scan_fit.py fitbatch head_mesh head_mask fit_verts prefix scan_dir [processes]"
+            sys.exit(-1)
+
+        failed = fit_scans(head_mesh,head_mask,fit_verts,prefix,scan_dir,processes = processes)
+        for scan,error in failed :
+            print "Could not fit %s : %s"%(scan,error)
     else :
         print "usage : python scan_fit.py build|project args"
@@ -0,0 +1,535 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Validation, mirroring and reporting of target libraries.
+
+**Project Name:**      MakeHuman
+
+**Product Home Page:** http://www.makehuman.org/
+
+**Code Home Page:**    http://code.google.com/p/makehuman/
+
+**Authors:**           MakeHuman Team
+
+**Copyright(c):**      MakeHuman Team 2001-2012
+
+**Licensing:**         GPL3 (see also http://sites.google.com/site/makehumandocs/licensing)
+
+**Coding Standards:**  See http://sites.google.com/site/makehumandocs/developers-guide
+
+Abstract
+--------
+
+This script does the work of makesymm.py, checksymm.py and checktargets.py on whole
+target trees, without Blender. Each target is read into an array of vertex indices
+and an array of offsets, and the targets are processed by a pool of worker processes.
+
+validate
+    Reports unreadable lines, vertex indices outside the base mesh, repeated indices,
+    offsets which are not finite, empty targets, l- targets which move vertices of the
+    right side and r- targets which move vertices of the left side, l- targets without
+    r- counterpart and counterparts which differ from the mirrored target by more than
+    the tolerance. Optionally it reports the face groups of a mesh which lack any of
+    their twelve scale and translation targets, as checktargets.py does. It exits
+    with status 1 if it found errors.
+
+mirror
+    Writes the r- counterpart of each l- target, or the l- counterpart of each r-
+    target. Vertices without counterpart are left out and reported.
+
+report
+    Writes the amount of vertices and the size of the offsets of each target as
+    JSON, or as CSV if the output file ends in .csv.
+
+The mirror map comes from utils/maketarget/base.sym, which lists a left vertex and its
+right counterpart on each line, and base.sym.centers, which lists the vertices on the
+plane of symmetry. The vertices these files do not list are matched on their position
+in the base mesh. Following checksymm.py, the counterpart of l-name-trans-in is
+r-name-trans-out and the other way around; all other names only swap the side prefix.
+
+Run it from the MakeHuman folder::
+
+    python utils/targetlibrary.py validate
+    python utils/targetlibrary.py mirror data/targets/microdetails
+    python utils/targetlibrary.py report -o targets.csv data/targets/details
+"""
+
+__docformat__ = 'restructuredtext'
+
+import sys
+import os
+import json
+import getopt
+import multiprocessing
+
+sys.path.append('./apps')
+
+try:
+    import numpy
+    import symmetry
+except ImportError:
+    numpy = None
+
+defaultMesh = 'data/3dobjs/base.obj'
+defaultSymmetry = 'utils/maketarget/base.sym'
+defaultRoot = 'data/targets'
+
+LEFT, RIGHT, CENTER = 1, 2, 3
+
+groupTargets = ['scale-depth-decr', 'scale-depth-incr', 'scale-horiz-decr', 'scale-horiz-incr',
+    'scale-vert-decr', 'scale-vert-incr', 'trans-backward', 'trans-forward', 'trans-left',
+    'trans-right', 'trans-up', 'trans-down']
+
+class TargetError(Exception):
+    pass
+
+def readTarget(path):
+    """
+    Reads a target.
+
+    :return: The vertex indices, the offsets and the numbers of the lines which could
+        not be read.
+    :rtype: (numpy.ndarray of int32, numpy.ndarray of shape (verts, 3), [int, ..])
+    """
+
+    rows = []
+    numbers = []
+    badLines = []
+    f = open(path, 'rU')
+    for number, line in enumerate(f):
+        words = line.split()
+        if not words or words[0].startswith('#'):
+            continue
+        if len(words) == 4:
+            rows.append(words)
+            numbers.append(number + 1)
+        else:
+            badLines.append(number + 1)
+    f.close()
+
+    if not rows:
+        return numpy.zeros(0, numpy.int32), numpy.zeros((0, 3)), badLines
+
+    try:
+        data = numpy.array(rows, dtype=float)
+    except ValueError:
+        # Find the lines which are not numbers, the slow way
+        good = []
+        for row, number in zip(rows, numbers):
+            try:
+                good.append([float(word) for word in row])
+            except ValueError:
+                badLines.append(number)
+        badLines.sort()
+        data = numpy.array(good, dtype=float).reshape(-1, 4)
+
+    indices = data[:, 0].astype(numpy.int32)
+    if numpy.any(indices != data[:, 0]):
+        raise TargetError('vertex indices which are not integers')
+    return indices, data[:, 1:], badLines
+
+def writeTarget(path, indices, offsets):
+    """
+    Writes a target in the format makesymm.py and the modelling tools write.
+    """
+
+    f = open(path, 'w')
+    f.write(''.join(['%i %f %f %f\n' % (index, x, y, z)
+        for index, (x, y, z) in zip(indices.tolist(), offsets.tolist())]))
+    f.close()
+
+def readCoords(path):
+    """
+    Returns the vertex coordinates of an obj file.
+    """
+
+    f = open(path, 'rU')
+    coords = [[float(c) for c in line.split()[1:4]] for line in f if line.startswith('v ')]
+    f.close()
+    return coords
+
+def readSymmetry(path, coords):
+    """
+    Reads the mirror map. The vertices the map does not list, like the helper
+    geometry, are matched on their position in the base mesh.
+
+    :return: The index of the counterpart of each vertex, -1 for vertices without one,
+        and the side of each vertex, LEFT, RIGHT, CENTER or 0.
+    :rtype: (numpy.ndarray of int32, numpy.ndarray of int8)
+    """
+
+    nVerts = len(coords)
+    mirror = -numpy.ones(nVerts, numpy.int32)
+    sides = numpy.zeros(nVerts, numpy.int8)
+
+    pairs = numpy.loadtxt(path, delimiter=',', dtype=numpy.int32, ndmin=2)
+    mirror[pairs[:, 0]] = pairs[:, 1]
+    mirror[pairs[:, 1]] = pairs[:, 0]
+    sides[pairs[:, 0]] = LEFT
+    sides[pairs[:, 1]] = RIGHT
+
+    centersPath = path + '.centers'
+    if os.path.isfile(centersPath):
+        centers = numpy.loadtxt(centersPath, dtype=numpy.int32, ndmin=1)
+        mirror[centers] = centers
+        sides[centers] = CENTER
+
+    unlisted = numpy.flatnonzero(mirror < 0)
+    if len(unlisted):
+        matched = symmetry.buildMirrorMap(coords)
+        x = numpy.array(coords)[:, 0]
+        for i in unlisted:
+            j = matched[i]
+            if j != i or abs(x[i]) < 1e-3:
+                mirror[i] = j
+                sides[i] = CENTER if j == i else (LEFT if x[i] < 0.0 else RIGHT)
+
+    return mirror, sides
+
+def getSide(filename):
+
+    name = os.path.basename(filename)
+    if name.startswith('l-'):
+        return LEFT
+    if name.startswith('r-'):
+        return RIGHT
+    return None
+
+def getCounterpartName(filename):
+    """
+    Returns the path of the mirrored target of an l- or r- target, or None.
+    """
+
+    folder, name = os.path.split(filename)
+    side = getSide(name)
+    if not side:
+        return None
+    name = ('r-' if side == LEFT else 'l-') + name[2:]
+    if '-trans-in' in name:
+        name = name.replace('-trans-in', '-trans-out')
+    elif '-trans-out' in name:
+        name = name.replace('-trans-out', '-trans-in')
+    return os.path.join(folder, name)
+
+def findTargets(folders):
+    """
+    Returns the target files below the given folders, sorted.
+    """
+
+    targets = []
+    for root in folders:
+        if os.path.isfile(root):
+            targets.append(root)
+            continue
+        for folder, dirs, files in os.walk(root):
+            if '.svn' in dirs:
+                dirs.remove('.svn')
+            targets.extend([os.path.join(folder, f) for f in files if f.endswith('.target')])
+    return sorted(targets)
+
+def mirrorOffsets(indices, offsets, mirror):
+    """
+    Mirrors the offsets of a target in the yz plane.
+
+    :return: The mirrored indices and offsets, sorted on index, and the indices which
+        have no counterpart.
+    """
+
+    counterparts = mirror[indices]
+    missing = indices[counterparts < 0]
+    keep = counterparts >= 0
+    counterparts = counterparts[keep]
+    offsets = offsets[keep] * [-1.0, 1.0, 1.0]
+    order = numpy.argsort(counterparts, kind='mergesort')
+    return counterparts[order], offsets[order], missing
+
+# The state of the worker processes, see initWorker
+
+theVertCount = 0
+theMirror = None
+theSides = None
+theTolerance = 0.0
+
+def initWorker(vertCount, mirror, sides, tolerance):
+
+    global theVertCount, theMirror, theSides, theTolerance
+
+    theVertCount = vertCount
+    theMirror = mirror
+    theSides = sides
+    theTolerance = tolerance
+
+def validateTarget(path):
+    """
+    Checks one target and, for an l- target, its counterpart.
+
+    :return: The path and its errors and warnings.
+    :rtype: (str, [str, ..], [str, ..])
+    """
+
+    errors = []
+    warnings = []
+
+    try:
+        indices, offsets, badLines = readTarget(path)
+    except (IOError, TargetError), e:
+        return path, ['cannot read: %s' % e], warnings
+
+    if badLines:
+        errors.append('%d unreadable lines' % len(badLines))
+    if not len(indices):
+        warnings.append('empty')
+        return path, errors, warnings
+
+    outside = (indices < 0) | (indices >= theVertCount)
+    if outside.any():
+        errors.append('%d vertex indices outside the mesh, the highest is %d' % (outside.sum(), indices.max()))
+        indices, offsets = indices[~outside], offsets[~outside]
+
+    if len(numpy.unique(indices)) != len(indices):
+        errors.append('%d repeated vertex indices' % (len(indices) - len(numpy.unique(indices))))
+
+    if not numpy.isfinite(offsets).all():
+        errors.append('offsets which are not finite')
+
+    side = getSide(path)
+    if side:
+        other = RIGHT if side == LEFT else LEFT
+        wrongSide = (theSides[indices] == other).sum()
+        if wrongSide:
+            warnings.append('moves %d vertices of the %s side' % (wrongSide, 'right' if other == RIGHT else 'left'))
+
+    if side == LEFT:
+        counterpart = getCounterpartName(path)
+        if not os.path.isfile(counterpart):
+            warnings.append('no counterpart %s' % os.path.basename(counterpart))
+        else:
+            try:
+                deviation = compareMirrored(indices, offsets, counterpart)
+            except (IOError, TargetError), e:
+                deviation = None
+            if deviation is not None and deviation > theTolerance:
+                errors.append('differs from mirrored %s by %f' % (os.path.basename(counterpart), deviation))
+
+    return path, errors, warnings
+
+def compareMirrored(indices, offsets, counterpart):
+    """
+    Returns the largest difference between the mirrored offsets of a target and the
+    offsets of its counterpart.
+    """
+
+    otherIndices, otherOffsets, badLines = readTarget(counterpart)
+    mirroredIndices, mirroredOffsets, missing = mirrorOffsets(indices, offsets, theMirror)
+
+    inside = (otherIndices >= 0) & (otherIndices < theVertCount)
+    expected = numpy.zeros((theVertCount, 3))
+    actual = numpy.zeros((theVertCount, 3))
+    expected[mirroredIndices] = mirroredOffsets
+    actual[otherIndices[inside]] = otherOffsets[inside]
+    return float(numpy.abs(expected - actual).max())
+
+def mirrorTarget(job):
+    """
+    Writes the counterpart of a target.
+
+    :return: The path of the written file and the amount of vertices left out.
+    :rtype: (str, int)
+    """
+
+    source, dryRun = job
+    destination = getCounterpartName(source)
+    indices, offsets, badLines = readTarget(source)
+    inside = (indices >= 0) & (indices < theVertCount)
+    mirroredIndices, mirroredOffsets, missing = mirrorOffsets(indices[inside], offsets[inside], theMirror)
+    if not dryRun:
+        writeTarget(destination, mirroredIndices, mirroredOffsets)
+    return destination, len(missing) + (~inside).sum()
+
+def measureTarget(path):
+    """
+    Returns the amount of vertices and the size of the offsets of a target.
+    """
+
+    try:
+        indices, offsets, badLines = readTarget(path)
+    except (IOError, TargetError), e:
+        return {'path': path, 'error': str(e)}
+
+    lengths = numpy.sqrt((offsets ** 2).sum(axis=1))
+    return {
+        'path': path,
+        'verts': len(indices),
+        'maxOffset': float(lengths.max()) if len(lengths) else 0.0,
+        'meanOffset': float(lengths.mean()) if len(lengths) else 0.0,
+        'totalOffset': float(lengths.sum()),
+        'bytes': os.path.getsize(path)
+    }
+
+def readGroups(path, prefix):
+    """
+    Returns the names of the face groups of an obj file which start with the prefix
+    followed by an underscore, without the prefix.
+    """
+
+    groups = set()
+    f = open(path, 'rU')
+    for line in f:
+        if line.startswith('g '):
+            for name in line.split()[1:]:
+                if name.startswith(prefix + '_'):
+                    groups.add(name[len(prefix) + 1:])
+    f.close()
+    return sorted(groups)
+
+def checkGroupTargets(meshPath, prefix, targets):
+    """
+    Returns the targets missing for the face groups with the given prefix.
+    """
+
+    names = set([os.path.splitext(os.path.basename(target))[0] for target in targets])
+    missing = []
+    for group in readGroups(meshPath, prefix):
+        missing.extend(['%s-%s' % (group, suffix) for suffix in groupTargets if '%s-%s' % (group, suffix) not in names])
+    return missing
+
+def createPool(processes, meshPath, symmetryPath, maxDeviation):
+
+    coords = readCoords(meshPath)
+    mirror, sides = readSymmetry(symmetryPath, coords)
+    initargs = (len(coords), mirror, sides, maxDeviation)
+    # The main process needs the state too, for jobs it runs itself
+    initWorker(*initargs)
+    return multiprocessing.Pool(processes or None, initWorker, initargs)
+
+def validateTargets(pool, targets, meshPath=None, groupPrefix=None):
+
+    nErrors = 0
+    nWarnings = 0
+    results = []
+    for path, errors, warnings in pool.imap(validateTarget, targets, 32):
+        for error in errors:
+            print('error   %s: %s' % (path, error))
+        for warning in warnings:
+            print('warning %s: %s' % (path, warning))
+        nErrors += len(errors)
+        nWarnings += len(warnings)
+        if errors or warnings:
+            results.append({'path': path, 'errors': errors, 'warnings': warnings})
+
+    if groupPrefix:
+        for name in checkGroupTargets(meshPath, groupPrefix, targets):
+            print('warning target %s not present' % name)
+            nWarnings += 1
+
+    print('Checked %d targets, %d errors, %d warnings' % (len(targets), nErrors, nWarnings))
+    return nErrors, results
+
+def mirrorTargets(pool, targets, fromSide=LEFT, dryRun=False):
+
+    sources = [(target, dryRun) for target in targets if getSide(target) == fromSide]
+    nMissing = 0
+    for destination, missing in pool.imap(mirrorTarget, sources, 32):
+        if missing:
+            print('%s: left out %d vertices without counterpart' % (destination, missing))
+            nMissing += 1
+    print('%s %d targets, %d of them move vertices without counterpart' %
+        ('Would write' if dryRun else 'Wrote', len(sources), nMissing))
+
+def reportTargets(pool, targets, output):
+
+    rows = pool.map(measureTarget, targets, 32)
+    f = open(output, 'w')
+    if output.lower().endswith('.csv'):
+        fields = ['path', 'verts', 'maxOffset', 'meanOffset', 'totalOffset', 'bytes']
+        f.write(','.join(fields) + '\n')
+        for row in rows:
+            f.write(','.join([str(row.get(field, '')) for field in fields]) + '\n')
+    else:
+        json.dump(rows, f, indent=1, sort_keys=True)
+    f.close()
+    print('Wrote the report of %d targets to %s' % (len(rows), output))
+
+def usage():
+    print('Usage: ' + sys.argv[0] + ' validate|mirror|report [options] [folder or target ..]')
+    print('  The default folder is %s' % defaultRoot)
+    print('  -j, --processes n     use n worker processes, default one per cpu')
+    print('  -m, --mesh file       the base mesh, default %s' % defaultMesh)
+    print('  -s, --symmetry file   the mirror map, default %s' % defaultSymmetry)
+    print('  -t, --tolerance x     validate: the largest difference with the mirrored target, default 0.01')
+    print('  -g, --groups prefix   validate: check the targets of the mesh groups named prefix_name')
+    print('  -o, --output file     validate, report: the file to write, default targets.json')
+    print('  -r, --right           mirror: mirror the r- targets instead of the l- targets')
+    print('  -n, --dry-run         mirror: only show what would be written')
+
+def main(argv):
+
+    if not argv or argv[0] not in ('validate', 'mirror', 'report'):
+        usage()
+        sys.exit(2)
+    command = argv[0]
+
+    try:
+        opts, args = getopt.getopt(argv[1:], 'hj:m:s:t:g:o:rn',
+            ['help', 'processes=', 'mesh=', 'symmetry=', 'tolerance=', 'groups=', 'output=', 'right', 'dry-run'])
+    except getopt.GetoptError:
+        usage()
+        sys.exit(2)
+
+    processes = 0
+    meshPath = defaultMesh
+    symmetryPath = defaultSymmetry
+    maxDeviation = 0.01
+    groupPrefix = None
+    output = None
+    fromSide = LEFT
+    dryRun = False
+    for opt, arg in opts:
+        if opt in ('-h', '--help'):
+            usage()
+            sys.exit()
+        elif opt in ('-j', '--processes'):
+            processes = int(arg)
+        elif opt in ('-m', '--mesh'):
+            meshPath = arg
+        elif opt in ('-s', '--symmetry'):
+            symmetryPath = arg
+        elif opt in ('-t', '--tolerance'):
+            maxDeviation = float(arg)
+        elif opt in ('-g', '--groups'):
+            groupPrefix = arg
+        elif opt in ('-o', '--output'):
+            output = arg
+        elif opt in ('-r', '--right'):
+            fromSide = RIGHT
+        elif opt in ('-n', '--dry-run'):
+            dryRun = True
+
+    if not numpy:
+        print('The target library tools require numpy')
+        sys.exit(2)
+
+    targets = findTargets(args or [defaultRoot])
+    pool = createPool(processes, meshPath, symmetryPath, maxDeviation)
+    try:
+        if command == 'validate':
+            nErrors, results = validateTargets(pool, targets, meshPath, groupPrefix)
+            if output:
+                f = open(output, 'w')
+                json.dump(results, f, indent=1, sort_keys=True)
+                f.close()
+            status = 1 if nErrors else 0
+        elif command == 'mirror':
+            mirrorTargets(pool, targets, fromSide, dryRun)
+            status = 0
+        else:
+            reportTargets(pool, targets, output or 'targets.json')
+            status = 0
+    finally:
+        pool.close()
+        pool.join()
+    sys.exit(status)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
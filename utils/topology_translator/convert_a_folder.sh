@@ -1,9 +1,5 @@
 
 #!/bin/bash
 
-for file in toconvert/*
-do
-       if [ -f "$file" ]; then
-               python topology_translator.py --tofit baseNew.obj --mold baseOld.obj --target $file --datafile morph.data
-       fi
-done
+#Convert all the targets in toconvert and its subfolders, saving them in converted
+python topology_translator.py --tofit baseNew.obj --mold baseOld.obj --batch toconvert --output converted --datafile morph.data
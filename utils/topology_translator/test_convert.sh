@@ -7,6 +7,9 @@
 #Convert test.target from baseOld.obj to baseNew.obj
 python topology_translator.py --tofit baseNew.obj --mold baseOld.obj --target test.target --datafile morph.data
 
+#Convert all targets in the folder called "toconvert" and its subfolders from baseOld.obj to baseNew.obj, using 4 processes
+#python topology_translator.py --tofit baseNew.obj --mold baseOld.obj --batch toconvert --output converted --processes 4 --datafile morph.data
+
 #make a target fitting base.obj to random1.obj
 #python topology_translator.py --tofit base.obj --mold random1.obj --datafile diff.data
 
@@ -38,6 +38,9 @@ def usage():
     print"    --target path; to specify the target file to convert"
     print"    --targetbase path; to specify the obj to be used as reference to save targets"
     print"    --folder path; to specify the folder with all targets to convert"
+    print"    --batch path; convert all the targets in a folder and its subfolders at once"
+    print"    --output path; to specify the folder where --batch saves the converted targets"
+    print"    --processes n; the number of processes used by --batch, one for each cpu by default"
     print"    --mold path; to specify the mesh obj to be fitted to"
     print"    --tofit path; to specify the obj to fit to the mold"
     print"    --help; what you're looking at right now."
@@ -64,10 +67,13 @@ def main(argv):
     testobj = None
     folder = None
     simil = None
+    batch = None
+    output = None
+    processes = None
 
     #handle options
     try:
-        opts, args = getopt.getopt(argv, "h", ["help","build","simil=","target=","targetbase=","tofit=","mold=","datafile=","testobj=","folder="])
+        opts, args = getopt.getopt(argv, "h", ["help","build","simil=","target=","targetbase=","tofit=","mold=","datafile=","testobj=","folder=","batch=","output=","processes="])
     except getopt.GetoptError:
         usage()
         sys.exit(2)
@@ -93,6 +99,12 @@ def main(argv):
             folder = arg
         elif opt in ("--simil"):            
             simil = arg
+        elif opt in ("--batch"):
+            batch = arg
+        elif opt in ("--output"):
+            output = arg
+        elif opt in ("--processes"):
+            processes = int(arg)
 
     if buildit:        
         vertsList1 = loadVertsCoo(mesh1)
@@ -109,6 +121,14 @@ def main(argv):
         vertsList2 = loadVertsCoo(mesh2)
         faces2 = loadFacesIndices(mesh2)
         meshComparison(vertsList1, vertsList2, faces2, simil)       
+    elif batch:
+        vertsList1 = loadVertsCoo(mesh1)
+        if not targetbase:
+            targetbase = mesh1
+        originalVerts = loadVertsCoo(targetbase)
+        vertsList2 = loadVertsCoo(mesh2)
+        faces2 = loadFacesIndices(mesh2)
+        convertTargets(vertsList1, vertsList2, faces2, datafile, originalVerts, batch, output, processes)
     else:
         vertsList1 = loadVertsCoo(mesh1)
         if not targetbase:
@@ -19,10 +19,17 @@ import sys
 sys.path.append("../../core/")
 from math import sqrt
 from aljabr import *
-import simpleoctree
 import sys
 import os
 import copy
+import itertools
+import multiprocessing
+import numpy
+from scipy.sparse import coo_matrix
+try:
+    from scipy.spatial import cKDTree as KDTree
+except ImportError:
+    from scipy.spatial import KDTree
 
 
 
@@ -320,6 +327,60 @@ def applyMorph(vertsList, targetPath):
 
 
 
+def linkVerts(vertsList1, vertsList2, epsilon=0.2, nNeighbours=7):
+    """
+    This function finds, for each vert of the first list, the nearest verts
+    of the second list, using a kd-tree queried for all verts at once.
+
+
+    Parameters
+    ----------
+
+    vertsList1:
+        *list*. The coords of the verts to link.
+
+    vertsList2:
+        *list*. The coords of the verts to link to.
+
+    epsilon:
+        *float*. Verts farther than this from any vert of vertsList2 are not linked.
+
+    nNeighbours:
+        *int*. The maximum number of verts a vert is linked to.
+
+    Returns the indices of the nearest verts and their weights, both arrays of
+    shape (len(vertsList1), nNeighbours), the number of linked verts of each vert,
+    0 if it is not linked, and the delta vector between each vert and the centroid
+    of the verts it is linked to.
+
+    """
+
+    verts1 = numpy.asarray(vertsList1, dtype=float)[:, :3]
+    verts2 = numpy.asarray(vertsList2, dtype=float)[:, :3]
+    nNeighbours = min(nNeighbours, len(verts2))
+
+    distances, indices = KDTree(verts2).query(verts1, nNeighbours)
+    if nNeighbours == 1:
+        distances = distances[:, numpy.newaxis]
+        indices = indices[:, numpy.newaxis]
+    dmin = distances[:, 0]
+
+    #If the nearest vert is closer than 0.005 new vert and old vert
+    #are coincident, so no more verts are needed.
+    counts = numpy.where(dmin < epsilon, numpy.where(dmin < 0.005, 1, nNeighbours), 0)
+
+    weights = numpy.ones(distances.shape)
+    linked = counts > 1
+    weights[linked] = dmin[linked, numpy.newaxis] / distances[linked]
+
+    #The delta vector, between the vert and the centroid of the linked verts
+    used = numpy.arange(nNeighbours) < counts[:, numpy.newaxis]
+    sums = (verts2[indices] * used[:, :, numpy.newaxis]).sum(axis=1)
+    deltas = sums / numpy.maximum(counts, 1)[:, numpy.newaxis] - verts1
+
+    return indices, weights, counts, deltas
+
+
 def meshComparison(vertsList1, vertsList2, faces2, indexListPath = None):
     """
     This function measure the similarity of 2 meshes.
@@ -345,7 +406,7 @@ def meshComparison(vertsList1, vertsList2, faces2, indexListPath = None):
         try:
             fileDescriptor = open(indexListPath)
         except:
-            print 'Error opening %s file' % path
+            print 'Error opening %s file' % indexListPath
             return        
         for data in fileDescriptor:
             lineData = data.split()            
@@ -357,41 +418,13 @@ def meshComparison(vertsList1, vertsList2, faces2, indexListPath = None):
 
     tess = subdivideObj(faces2, vertsList2, 2)  
 
-    overwrite = 0 #Just for more elegant one-line print output progress
-    
-    #Init of the octree
-    octree = simpleoctree.SimpleOctree(tess[1] , .25)   
-
-    #For each vert of new mesh we found the nearest verts of old one
-    vDistances = []
-    for i1 in indexList:
-        v1 = vertsList1[i1]       
-
-        #We use octree to search only on a small part of the whole old mesh.
-        vertsList3 = octree.root.getSmallestChild(v1)
-
-        #... find nearest verts on old mesh
-        dMin = 100
-        for v2 in vertsList3.verts:
-            d = vdist(v1, v2)            
-            if d < dMin:
-                dMin = d
-
-        vDistances.append(dMin)
-        
+    #For each vert of new mesh we found the nearest vert of old one
+    verts1 = numpy.asarray(vertsList1, dtype=float)[list(indexList)]
+    vDistances = KDTree(numpy.asarray(tess[1], dtype=float)).query(verts1)[0]
 
-        word = "Linking verts: %.2f%c."%((float(i1)/len(vertsList1))*100, "%")
-        sys.stdout.write("%s%s\r" % (word, " "*overwrite ))
-        sys.stdout.flush()
-        overwrite = len(word)
+    averageDist = vDistances.mean()
 
-    dSum = 0
-    for d in vDistances:
-        dSum += d
-
-    averageDist = dSum/len(vDistances)
-
-    print "Average distance %s %s = %s"%(mesh1,mesh2,averageDist)
+    print "Average distance = %s"%(averageDist)
     return averageDist
         
 
@@ -425,103 +458,44 @@ def saveData(vertsList1, vertsList2, faces2, dataPath, epsilon = 0.2):
     #to have a better result in linking new mesh.
     tess = subdivideObj(faces2, vertsList2, 2)    
     vertsList2Tesselated = tess[1]
-    
-    deltaVectors = []
-    notLinked = 0
 
-    overwrite = 0 #Just for more elegant one-line print output progress
+    print "Linking verts..."
+    indices, weights, counts, deltas = linkVerts(vertsList1, vertsList2Tesselated, epsilon)
 
-    #We need to add index information to each vert.    
-    for i,v in enumerate(vertsList2Tesselated):
-        v.append(i)
-
-    #Init of the octree
-    octree = simpleoctree.SimpleOctree(vertsList2Tesselated, .25)
+    #Each line has the indices of the linked verts followed by their weights,
+    #or -1 if the vert is not linked
+    lines = []
+    for n, vIndices, vWeights in zip(counts.tolist(), indices.tolist(), weights.tolist()):
+        if n:
+            lines.append(''.join(['%i ' % (index) for index in vIndices[:n]]) +
+                ''.join(['%f ' % (weight) for weight in vWeights[:n]]) + '\n')
+        else:
+            lines.append('%i\n' % (-1))
 
     try:
         fileDescriptor = open(dataPath, 'w')
     except:
         print 'Unable to open %s'%(dataPath)
         return None
+    fileDescriptor.write(''.join(lines))
+    fileDescriptor.close()
 
-    #For each vert of new mesh we found the nearest verts of old one
-    for i1,v1 in enumerate(vertsList1):
-
-        vIndices = []
-        vDistances = []
-
-        #We use octree to search only on a small part of the whole old mesh.
-        vertsList3 = octree.root.getSmallestChild(v1)
-
-        #This dictionary is needed to have an ordered list of distances
-        distData = {}
-
-
-        #... find nearest verts on old mesh
-        for i2,v2 in enumerate(vertsList3.verts):
-            d = vdist(v1, v2)
-            distData[d]=v2[3] #v2[3] is the vert index
-
-        #The trick to have an ordered list of distances, linked to the indices.
-        #We use distances as keys.
-        dKeys = distData.keys()
-        dKeys.sort()
-        dmin = dKeys[0] #The first one is the smallest.
-
-        if dmin < epsilon: #A vert is found in the given epsilon
-
-            #in case of smaller distance < 0.005
-            #new vert and old vert are coincided, so no more verts are needed.
-            if  dKeys[0] < 0.005:
-                vIndices = [distData[dKeys[0]]]
-                vDistances = [dKeys[0]]
-                weights = [1]
-
-            #else we get the 7 first verts with smaller distance
-            else:
-                if len(dKeys) > 7:
-                    vDistances = dKeys[:7]
-                else:
-                    vDistances = dKeys[:(len(dKeys)-1)]
-                vIndices = [distData[n] for n in vDistances]
-                weights = [dmin/dst for dst in vDistances]
-
-            #The delta vector, between the vert of v1 and the centroid of neighbours verts of v2
-            vx = centroid([vertsList2Tesselated[vIndx] for vIndx in vIndices])
-            deltaVect = vsub(vx,v1)
-            deltaVectors.append(deltaVect)
-
-            #Finally we write the data
-            for index in vIndices:
-                fileDescriptor.write('%i ' % (index))
-            for weight in weights:
-                fileDescriptor.write('%f ' % (weight))
-            fileDescriptor.write('\n')
+    lines = []
+    for n, delta in zip(counts.tolist(), deltas.tolist()):
+        if n:
+            lines.append('%f %f %f\n' % (delta[0], delta[1], delta[2]))
         else:
-            fileDescriptor.write('%i\n' % (-1))
-            deltaVectors.append(-1)
-            notLinked += 1
-
-        word = "Linking verts: %.2f%c."%((float(i1)/len(vertsList1))*100, "%")
-        sys.stdout.write("%s%s\r" % (word, " "*overwrite ))
-        sys.stdout.flush()
-        overwrite = len(word)
-
-    fileDescriptor.close()
+            lines.append('-1 \n')
 
     try:
         fileDescriptor = open(dataPath+".delta", 'w')
     except:
         print 'Unable to open %s'%(dataPath)
         return None
-
-    for delta in deltaVectors:
-        if delta != -1:
-            fileDescriptor.write('%f %f %f\n' % (delta[0], delta[1], delta[2]))
-        else:
-            fileDescriptor.write('-1 \n')
+    fileDescriptor.write(''.join(lines))
     fileDescriptor.close()
 
+    notLinked = (counts == 0).sum()
     print "Data saved in %s"%(dataPath)
     print "Verts not linked with a epsilon radius of %f: %i"%(epsilon,notLinked)
 
@@ -754,3 +728,347 @@ def convertFile(vertList1, vertList2, faces2, dataPath, originalVerts, converted
 
 
 
+def subdivisionMatrix(faces, nVerts, loops):
+    """
+    This function returns the subdivision made by subdivideObj as a sparse
+    matrix, so the subdivided verts are the product of this matrix and the
+    verts. Because the tesselation only uses centroids, the same matrix
+    subdivides any morph of the mesh, and it's built once for many targets.
+
+
+    Parameters
+    ----------
+    faces:
+        *list*. Each "face" is a list with the index of face verts.
+
+    nVerts:
+        *int*. The number of verts of the mesh.
+
+    loops:
+        *int*. The number of tesselations, as in subdivideObj.
+
+    """
+
+    matrix = None
+    for n in xrange(loops):
+        rows = range(nVerts)
+        cols = range(nVerts)
+        values = [1.0]*nVerts
+        vertsUsed = {}
+        subdividedFaces = []
+
+        #Same numbering of new verts as in tessellate
+        def addVert(key, corners):
+            if key not in vertsUsed:
+                vertsUsed[key] = nVerts + len(vertsUsed)
+                for i in corners:
+                    rows.append(vertsUsed[key])
+                    cols.append(i)
+                    values.append(1.0/len(corners))
+            return vertsUsed[key]
+
+        for face in faces:
+            if len(face) == 4:
+                i0, i1, i2, i3 = face
+                n1 = addVert(tuple(sorted([i0,i1])), [i0,i1])
+                n2 = addVert(tuple(sorted([i1,i2])), [i1,i2])
+                n3 = addVert(tuple(sorted([i2,i3])), [i2,i3])
+                n4 = addVert(tuple(sorted([i3,i0])), [i3,i0])
+                n5 = addVert(tuple(sorted(face)), face)
+                subdividedFaces.extend([[i0,n1,n5,n4],[n1,i1,n2,n5],[n5,n2,i2,n3],[n5,n3,i3,n4]])
+            elif len(face) == 3:
+                i0, i1, i2 = face
+                n1 = addVert(tuple(sorted([i0,i1])), [i0,i1])
+                n2 = addVert(tuple(sorted([i1,i2])), [i1,i2])
+                n3 = addVert(tuple(sorted([i2,i0])), [i2,i0])
+                n4 = addVert(tuple(sorted(face)), face)
+                subdividedFaces.extend([[i0,n1,n4],[n1,i1,n4],[i1,n2,n4],[n2,i2,n4],[i2,n3,n4],[n3,i0,n4]])
+
+        nSubdivided = nVerts + len(vertsUsed)
+        loopMatrix = coo_matrix((values, (rows, cols)), shape=(nSubdivided, nVerts)).tocsr()
+        if matrix is None:
+            matrix = loopMatrix
+        else:
+            matrix = loopMatrix * matrix
+        faces = subdividedFaces
+        nVerts = nSubdivided
+
+    return matrix
+
+
+def loadData(dataPath, nLinkedVerts):
+    """
+    This function load the data file and the delta file saved by saveData.
+    It returns the weights as a sparse matrix, with a row for each vert of
+    mesh1, normalized so each linked vert is the product of its row and the
+    subdivided verts of mesh2, the delta vectors and which verts are linked.
+
+
+    Parameters
+    ----------
+
+    dataPath:
+        *string*. The path of data file
+
+    nLinkedVerts:
+        *int*. The number of verts of the subdivided mesh2
+
+    """
+
+    try:
+        fileDescriptor = open(dataPath)
+    except:
+        print 'Unable to open %s'%(dataPath)
+        return None
+
+    fileData =  fileDescriptor.readlines()
+    fileDescriptor.close()
+
+    try:
+        fileDescriptor = open(dataPath+".delta")
+    except:
+        print 'Unable to open %s'%(dataPath)
+        return None
+
+    fileDelta =  fileDescriptor.readlines()
+    fileDescriptor.close()
+
+    rows = []
+    cols = []
+    values = []
+    deltas = numpy.zeros((len(fileData), 3))
+    linked = numpy.zeros(len(fileData), dtype=bool)
+    for idx,line in enumerate(fileData):
+        translationData = line.split()
+        if translationData[0] == '-1':
+            continue
+
+        halfList = len(translationData)/2
+        xIdx = [int(i) for i in translationData[:halfList]]
+        xWeight = [float(w) for w in translationData[halfList:]]
+        sumWeight = sum(xWeight)
+
+        rows.extend([idx]*halfList)
+        cols.extend(xIdx)
+        values.extend([w/sumWeight for w in xWeight])
+        deltas[idx] = [float(d) for d in fileDelta[idx].split()]
+        linked[idx] = True
+
+    if cols and max(cols) >= nLinkedVerts:
+        print "ERROR: wrong datafile used"
+        return None
+
+    weights = coo_matrix((values, (rows, cols)), shape=(len(fileData), nLinkedVerts)).tocsr()
+    return weights, deltas, linked
+
+
+def loadTargetOffsets(targetPath):
+    """
+    This function load a morph target as an array of vert indices and an
+    array of translation vectors.
+
+
+    Parameters
+    ----------
+
+    targetPath:
+        *string*. The path of the target
+
+    """
+
+    indices = []
+    offsets = []
+    fileDescriptor = open(targetPath)
+    for line in fileDescriptor:
+        translationData = line.split()
+        if len(translationData) == 4 and not translationData[0].startswith('#'):
+            indices.append(int(translationData[0]))
+            offsets.append([float(translationData[1]), float(translationData[2]), float(translationData[3])])
+    fileDescriptor.close()
+    return numpy.array(indices, dtype=int), numpy.array(offsets, dtype=float).reshape(-1, 3)
+
+
+#The data shared by the processes converting targets, set by initBatchWorker
+theFitting = None
+theFittedVerts = None
+theFollowedVerts = None
+theVerts = None
+theOriginalVerts = None
+theTargetDir = None
+theOutputDir = None
+theEpsilon = None
+
+def initBatchWorker(fitting, fittedVerts, followedVerts, verts, originalVerts, targetDir, outputDir, epsilon):
+
+    global theFitting, theFittedVerts, theFollowedVerts, theVerts, theOriginalVerts
+    global theTargetDir, theOutputDir, theEpsilon
+
+    theFitting = fitting
+    theFittedVerts = fittedVerts
+    theFollowedVerts = followedVerts
+    theVerts = verts
+    theOriginalVerts = originalVerts
+    theTargetDir = targetDir
+    theOutputDir = outputDir
+    theEpsilon = epsilon
+
+
+def convertBatchTarget(name):
+    """
+    This function convert one target of the batch, and save it in the output
+    directory, with the same path relative to it as the old target has relative
+    to the target directory. It does the same as fitMesh and convertFile, but
+    using the data prepared by convertTargets.
+
+    It returns the name, the number of exported verts, or None if the target
+    can't be converted, and the number of verts moved by the target which no
+    linked vert follows, so their morph is lost.
+
+
+    Parameters
+    ----------
+
+    name:
+        *string*. The path of the target, relative to the target directory
+
+    """
+
+    try:
+        indices, offsets = loadTargetOffsets(os.path.join(theTargetDir, name))
+    except (IOError, ValueError), e:
+        print 'Unable to load %s: %s'%(name, e)
+        return name, None, 0
+
+    nVerts2 = theFitting.shape[1]
+    if len(indices) and (indices.min() < 0 or indices.max() >= nVerts2):
+        print 'ERROR: %s was done for a different mold'%(name)
+        return name, None, 0
+
+    morph = numpy.zeros((nVerts2, 3))
+    morph[indices] = offsets
+    changed = morph.any(axis=1)
+
+    #Only the verts linked to verts moved by the morph are fitted
+    morphed = theFitting.dot(changed.astype(float)) > 0
+    verts = theVerts.copy()
+    verts[morphed] = theFittedVerts[morphed] + theFitting.dot(morph)[morphed]
+
+    delta = verts - theOriginalVerts
+    exported = numpy.nonzero(numpy.sqrt((delta**2).sum(axis=1)) > theEpsilon)[0]
+
+    newTargetPath = os.path.join(theOutputDir, name)
+    try:
+        if not os.path.isdir(os.path.dirname(newTargetPath)):
+            os.makedirs(os.path.dirname(newTargetPath))
+    except OSError:
+        #Another process made it meanwhile
+        pass
+    try:
+        fileDescriptor = open(newTargetPath, 'w')
+    except:
+        print 'Unable to open %s'%(newTargetPath)
+        return name, None, 0
+    fileDescriptor.write(''.join(['%d %f %f %f\n' % (i, d[0], d[1], d[2]) for i, d in zip(exported.tolist(), delta[exported].tolist())]))
+    fileDescriptor.close()
+
+    lost = (changed & ~theFollowedVerts).sum()
+    return name, len(exported), lost
+
+
+def convertTargets(vertList1, vertList2, faces2, dataPath, originalVerts, targetDir, outputDir = None, processes = None, epsilon=0.001):
+
+    """
+    This function convert all the targets in a directory and its subdirectories,
+    as convertFile does for one target. The meshes and the data file are loaded
+    and prepared only once, and the targets are converted by a pool of processes,
+    each of them saving the targets it converts.
+
+
+    Parameters
+    ----------
+    targetDir:
+        *string*. The directory with the old morph targets to convert
+
+    outputDir:
+        *string*. The directory where to save the converted targets. If None,
+        the "converted" directory next to the data file, as in convertFile.
+
+    processes:
+        *int*. The number of processes. If None, one for each cpu.
+
+    epsilon:
+        *float*. The threshold to decide when consider or not a modification as
+        morph to be saved.
+
+    """
+
+    if not outputDir:
+        outputDir = os.path.join(os.path.dirname(dataPath), "converted")
+
+    names = []
+    for root, dirs, files in os.walk(targetDir):
+        dirs.sort()
+        for fileName in sorted(files):
+            if fileName.endswith('.target'):
+                names.append(os.path.relpath(os.path.join(root, fileName), targetDir))
+    if not names:
+        print "No targets found in %s"%(targetDir)
+        return None
+
+    #The fitting of mesh1 is a linear function of the verts of mesh2
+    subdivision = subdivisionMatrix(faces2, len(vertList2), 2)
+    data = loadData(dataPath, subdivision.shape[0])
+    if not data:
+        return None
+    weights, deltas, linked = data
+    if len(linked) != len(vertList1):
+        print "ERROR: data file was done for a different meshtofit"
+        return None
+    if len(originalVerts) != len(vertList1):
+        print "ERROR: target base and mesh to fit have different verts"
+        return None
+
+    fitting = weights * subdivision
+    verts2 = numpy.array(vertList2, dtype=float)
+    fittedVerts = fitting.dot(verts2) - deltas
+    followedVerts = numpy.asarray(fitting.sum(axis=0)).ravel() > 0
+    args = (fitting, fittedVerts, followedVerts, numpy.array(vertList1, dtype=float),
+        numpy.array(originalVerts, dtype=float), targetDir, outputDir, epsilon)
+
+    print "Converting %i targets from %s to %s..."%(len(names), targetDir, outputDir)
+    if processes == 1:
+        initBatchWorker(*args)
+        results = itertools.imap(convertBatchTarget, names)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(processes, initBatchWorker, args)
+        results = pool.imap_unordered(convertBatchTarget, names, 16)
+
+    converted = 0
+    failed = []
+    lostTargets = []
+    for n, (name, nVertsExported, lost) in enumerate(results):
+        if nVertsExported is None:
+            failed.append(name)
+        else:
+            converted += 1
+            if lost:
+                lostTargets.append((lost, name))
+        if (n + 1) % 100 == 0:
+            print "%i/%i"%(n + 1, len(names))
+    if pool:
+        pool.close()
+        pool.join()
+
+    print "Using datafile %s"%(dataPath)
+    print "Converted %i of %i targets"%(converted, len(names))
+    print "Verts not linked, never moved by any target: %i"%((~linked).sum())
+    if lostTargets:
+        lostTargets.sort(reverse=True)
+        print "Targets moving verts of the mold no linked vert follows: %i, %i verts in all"%(len(lostTargets), sum([lost for lost, name in lostTargets]))
+        for lost, name in lostTargets[:10]:
+            print "    %s: %i"%(name, lost)
+    for name in failed:
+        print "ERROR in converting %s, file not converted"%(name)
+
+    return converted, failed
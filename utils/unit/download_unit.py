@@ -0,0 +1,106 @@
+import os
+import sys
+import shutil
+import tempfile
+import threading
+import BaseHTTPServer
+import SimpleHTTPServer
+import SocketServer
+
+# Run from the MakeHuman folder: python utils/unit/download_unit.py
+sys.path.append('./utils')
+import benchmark
+benchmark.setupPaths()
+home = tempfile.mkdtemp()
+benchmark.installHeadlessMh(home)
+
+import download
+
+served = tempfile.mkdtemp()
+requests = []
+
+class Handler(SimpleHTTPServer.SimpleHTTPRequestHandler):
+
+    # Keep connections alive, as the download pool expects
+    protocol_version = 'HTTP/1.1'
+
+    def translate_path(self, path):
+
+        path = SimpleHTTPServer.SimpleHTTPRequestHandler.translate_path(self, path)
+        return os.path.join(served, os.path.relpath(path, os.getcwd()))
+
+    def send_head(self):
+
+        path = self.translate_path(self.path)
+        requests.append(os.path.basename(path))
+        if os.path.isfile(path):
+            modified = self.date_time_string(os.stat(path).st_mtime)
+            if self.headers.get('If-Modified-Since') == modified:
+                self.send_response(304)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return None
+        return SimpleHTTPServer.SimpleHTTPRequestHandler.send_head(self)
+
+    def log_message(self, format, *args):
+        pass
+
+class Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+server = Server(('127.0.0.1', 0), Handler)
+thread = threading.Thread(target=server.serve_forever)
+thread.daemon = True
+thread.start()
+url = 'http://127.0.0.1:%d/' % server.server_address[1]
+
+filenames = ['file%d.target' % i for i in xrange(8)]
+for i, filename in enumerate(filenames):
+    f = open(os.path.join(served, filename), 'wb')
+    f.write('%d 0.1 0.2 0.3\n' % i * (i + 1) * 100)
+    f.close()
+
+target = tempfile.mkdtemp()
+urls = [url + filename for filename in filenames]
+
+try:
+    # parallel sync
+    cache = download.DownloadCache(target)
+    results = download.DownloadPool(cache, 4).download(urls)
+    cache.save()
+
+    print sorted(results.values())
+    assert results == dict([(u, (True, 200)) for u in urls])
+    for filename in filenames:
+        assert open(os.path.join(target, filename), 'rb').read() == open(os.path.join(served, filename), 'rb').read()
+
+    # revalidation with the cache saved by the first sync
+    cache = download.DownloadCache(target)
+    results = download.DownloadPool(cache, 4).download(urls)
+
+    print sorted(results.values())
+    assert results == dict([(u, (True, 304)) for u in urls])
+
+    # a changed file is downloaded again, the others are not
+    f = open(os.path.join(served, filenames[0]), 'wb')
+    f.write('changed\n')
+    f.close()
+    os.utime(os.path.join(served, filenames[0]), (0, 0))
+    results = download.DownloadPool(cache, 4).download(urls)
+
+    print sorted(results.values())
+    assert results[urls[0]] == (True, 200)
+    assert open(os.path.join(target, filenames[0]), 'rb').read() == 'changed\n'
+
+    # missing file
+    result = cache.download(url + 'missing.target')
+
+    print result
+    assert result == (False, 404)
+    assert not os.path.exists(os.path.join(target, 'missing.target'))
+
+    print len(requests), 'requests'
+finally:
+    server.shutdown()
+    for path in (home, served, target):
+        shutil.rmtree(path, True)